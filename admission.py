@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Řízení zátěže (admission control) – omezení souběžných požadavků podle třídy routy.
+
+Každá třída rout (report, export, interactive) má vlastní "pruh" s pevným počtem
+slotů. Požadavek, který slot nedostane, čeká ve frontě nejvýše `timeout` sekund;
+je-li fronta plná (nebo čekání vyprší), odpovíme 503 s hlavičkou Retry-After.
+Těžké admin pruhy (report + export) dohromady – aktivní i čekající – nikdy
+nepřesáhnou počet vláken waitress mínus rezervu pro interaktivní provoz poboček.
+"""
+
+import threading
+import time
+
+from flask import g, request
+
+
+class Lane:
+    """Jeden pruh – semafor se sloty a omezenou frontou čekajících."""
+
+    def __init__(self, name, slots, max_queue=0, timeout=0.0):
+        self.name = name
+        self.slots = slots
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(slots) if slots else None
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def acquire(self):
+        """Vrátí True, pokud požadavek dostal slot; False = odmítnout (503)."""
+        if self._semaphore is None:
+            return True
+        if self._semaphore.acquire(blocking=False):
+            with self._lock:
+                self.active += 1
+            return True
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+        try:
+            ok = self._semaphore.acquire(timeout=self.timeout) if self.timeout > 0 else False
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        with self._lock:
+            if ok:
+                self.active += 1
+            else:
+                self.rejected += 1
+        return ok
+
+    def release(self):
+        if self._semaphore is None:
+            return
+        with self._lock:
+            self.active -= 1
+        self._semaphore.release()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'active': self.active,
+                'waiting': self.waiting,
+                'max_queue': self.max_queue,
+                'rejected': self.rejected,
+            }
+
+
+def plan_slots(threads, reserved_interactive, report_slots, export_slots, max_queue=0):
+    """Rozdělí vlákna mezi pruhy tak, aby interaktivní provoz měl vždy rezervu.
+
+    Čekající ve frontě drží vlákno waitress stejně jako aktivní požadavek, proto
+    se do rozpočtu těžkých pruhů počítají sloty i fronty. Vrací
+    {'report': (sloty, fronta), 'export': (sloty, fronta)}. Při překročení se
+    nejdřív zkracují fronty (delší dřív, při shodě export), pak sloty exportu
+    a reportu – každý pruh si ale ponechá aspoň 1 slot.
+    """
+    heavy_budget = max(threads - reserved_interactive, 2)
+    slots = {'report': max(1, report_slots), 'export': max(1, export_slots)}
+    queues = {'report': max(0, max_queue), 'export': max(0, max_queue)}
+    while sum(slots.values()) + sum(queues.values()) > heavy_budget:
+        if any(queues.values()):
+            name = 'export' if queues['export'] >= queues['report'] else 'report'
+            queues[name] -= 1
+        elif slots['export'] > 1:
+            slots['export'] -= 1
+        elif slots['report'] > 1:
+            slots['report'] -= 1
+        else:
+            break
+    return {name: (slots[name], queues[name]) for name in slots}
+
+
+class AdmissionControl:
+    """Flask rozšíření – přiřadí každému požadavku pruh podle endpointu.
+
+    `classify(endpoint)` vrací název třídy ('report', 'export', 'interactive').
+    Endpointy v `exempt` (health check, statické soubory) se neomezují.
+    """
+
+    def __init__(self, app=None, classify=None, exempt=()):
+        self.classify = classify or (lambda endpoint: 'interactive')
+        self.exempt = set(exempt)
+        self.lanes = {}
+        self.retry_after = 5
+        self.reject_handler = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        threads = app.config.get('WAITRESS_THREADS', 8)
+        reserved = app.config.get('ADMISSION_RESERVED_INTERACTIVE', max(2, threads // 2))
+        plan = plan_slots(
+            threads, reserved,
+            app.config.get('ADMISSION_REPORT_SLOTS', 2),
+            app.config.get('ADMISSION_EXPORT_SLOTS', 1),
+            app.config.get('ADMISSION_QUEUE', 4),
+        )
+        timeout = app.config.get('ADMISSION_TIMEOUT', 10.0)
+        self.retry_after = app.config.get('ADMISSION_RETRY_AFTER', 5)
+        self.lanes = {
+            'report': Lane('report', *plan['report'], timeout=timeout),
+            'export': Lane('export', *plan['export'], timeout=timeout),
+            # Interaktivní provoz poboček omezuje jen samotný počet vláken waitress
+            'interactive': Lane('interactive', 0),
+        }
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['admission'] = self
+
+    def _before_request(self):
+        endpoint = request.endpoint
+        if not endpoint or endpoint in self.exempt:
+            return None
+        lane = self.lanes.get(self.classify(endpoint)) or self.lanes['interactive']
+        started = time.perf_counter()
+        if not lane.acquire():
+            g._admission_wait = time.perf_counter() - started  # čekání ve frontě před 503 (pro metriky)
+            return self._reject(lane)
+        g._admission_lane = lane
+        return None
+
+    def _teardown_request(self, exception=None):
+        lane = g.pop('_admission_lane', None)
+        if lane is not None:
+            lane.release()
+
+    def _reject(self, lane):
+        if self.reject_handler is not None:
+            response = self.reject_handler(lane)
+        else:
+            from flask import make_response
+            response = make_response('Služba je přetížená, zkuste to prosím za chvíli.', 503)
+        response.status_code = 503
+        response.headers['Retry-After'] = str(self.retry_after)
+        return response
+
+    def snapshot(self):
+        return {name: lane.snapshot() for name, lane in self.lanes.items()}
@@ -4,23 +4,39 @@ from flask_wtf import FlaskForm
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from wtforms import StringField, BooleanField, DateField, FloatField, TextAreaField, PasswordField, SelectField
 from wtforms.validators import DataRequired, Optional, Regexp, Length
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 try:
     from zoneinfo import ZoneInfo
 except ImportError:
     ZoneInfo = None
 import os
 import re
+import threading
 import csv
 import io
-try:
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment
-    HAS_EXCEL = True
-except ImportError:
-    HAS_EXCEL = False
+import time
+import click
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask import Response
+from flask import Response, make_response, abort, send_from_directory, g
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import aliased, joinedload, load_only, selectinload
+
+from admission import AdmissionControl
+from query_budget import QueryBudget, BUDGET_MESSAGE, budget_exceeded, is_query_budget_exceeded
+from profiler import RequestProfiler
+import metrics
+from slow_query import SlowQueryLog
+import migrations
+import warmup
+import health
+from log_queue import LogQueue, access_logger, access_record, worker_log_path
+import cold_storage
+from maintenance import Maintenance
+from log_segments import SegmentStore
+from backup import Backup, BackupError
+from importer import FieldRule, ImportSpec, RowError, form_rules, read_rows, run_import, zaruka_do
 
 app = Flask(__name__)
 
@@ -45,10 +61,6 @@ elif _db_url.startswith('postgres://'):
     _db_url = 'postgresql://' + _db_url[11:]  # Neon vrací postgres://, SQLAlchemy chce postgresql://
 app.config['SQLALCHEMY_DATABASE_URI'] = _db_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_pre_ping': True,
-    'connect_args': {'timeout': 15, 'check_same_thread': False} if 'sqlite' in _db_url.lower() else {},
-}
 app.config['WTF_CSRF_ENABLED'] = True  # CSRF ochrana zapnuta
 app.config['WTF_CSRF_TIME_LIMIT'] = 3600  # 1 hodina
 
@@ -58,16 +70,171 @@ app.config['SESSION_COOKIE_HTTPONLY'] = True  # Ochrana před XSS
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # CSRF ochrana
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hodina
 
-# Logging konfigurace
-if not app.debug:
+# Řízení zátěže – počet vláken waitress a sloty pro těžké admin routy
+app.config['WAITRESS_THREADS'] = int(os.environ.get('WAITRESS_THREADS', '8'))
+# Pool připojení jednoho procesu – při více workerech je dopočítá run_waitress.py
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', '0'))  # 0 = výchozí SQLAlchemy
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+app.config['SQLITE_CACHE_KB'] = int(os.environ.get('SQLITE_CACHE_KB', '64000'))  # page cache na připojení
+# Zahřátí workeru před prvním requestem a perzistentní cache zkompilovaných šablon ('' = vypnuto)
+app.config['WARMUP'] = os.environ.get('WARMUP', '1') != '0'
+app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+# Studený archiv reklamací (cold_storage.py): vlastní SQLite soubor ('' = stejná databáze),
+# po kolika dnech od archivace se reklamace přesune a velikost dávky
+app.config['ARCHIVE_DB'] = os.environ.get('ARCHIVE_DB', '')
+app.config['ARCHIVE_MOVE_DAYS'] = int(os.environ.get('ARCHIVE_MOVE_DAYS', '30'))
+app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+# Údržba (maintenance.py, `flask --app app maintenance --loop`): velikost dávky a pauza mezi dávkami,
+# po kolika dnech archivovat vyřízené reklamace a propadnout nevyzvednuté odběry (0 = úloha vypnutá)
+app.config['MAINT_CHUNK_SIZE'] = int(os.environ.get('MAINT_CHUNK_SIZE', '200'))
+app.config['MAINT_CHUNK_PAUSE_MS'] = int(os.environ.get('MAINT_CHUNK_PAUSE_MS', '50'))
+app.config['MAINT_ARCHIVE_AFTER_DAYS'] = int(os.environ.get('MAINT_ARCHIVE_AFTER_DAYS', '30'))
+app.config['MAINT_PICKUP_EXPIRE_DAYS'] = int(os.environ.get('MAINT_PICKUP_EXPIRE_DAYS', '60'))
+app.config['MAINT_VACUUM_PAGES'] = int(os.environ.get('MAINT_VACUUM_PAGES', '2000'))
+app.config['MAINT_TICK_S'] = int(os.environ.get('MAINT_TICK_S', '60'))
+# Retence logu akcí (log_segments.py): záznamy Akce a ReklamaceLog starší než LOG_RETENTION_DAYS
+# přesune úloha log_retention do komprimovaných měsíčních segmentů (0 = ponechat vše v databázi)
+app.config['LOG_RETENTION_DAYS'] = int(os.environ.get('LOG_RETENTION_DAYS', '365'))
+app.config['LOG_SEGMENT_DIR'] = os.environ.get('LOG_SEGMENT_DIR', os.path.join(app.instance_path, 'log_segments'))
+# Online zálohy SQLite (backup.py): adresář, kolik záloh každé databáze ponechat,
+# stránek na jeden krok backup API a pauza mezi kroky (zapisovatelé mezitím nečekají)
+app.config['BACKUP_DIR'] = os.environ.get('BACKUP_DIR', os.path.join(app.instance_path, 'backups'))
+app.config['BACKUP_KEEP'] = int(os.environ.get('BACKUP_KEEP', '14'))
+app.config['BACKUP_STEP_PAGES'] = int(os.environ.get('BACKUP_STEP_PAGES', '256'))
+app.config['BACKUP_STEP_SLEEP_MS'] = int(os.environ.get('BACKUP_STEP_SLEEP_MS', '20'))
+# Hromadný import CSV/XLSX (importer.py): kolik řádků jde do jednoho executemany a jedné transakce
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', '2000'))
+# Prahy pro /health/ready: (warn, fail) – při 'fail' vrací 503 a balancer instanci obejde
+app.config['HEALTH_POOL_USAGE'] = (0.8, 1.0)  # podíl vypůjčených připojení z kapacity poolu
+app.config['HEALTH_WRITE_LOCK_MS'] = (float(os.environ.get('HEALTH_WRITE_LOCK_WARN_MS', '250')),
+                                      float(os.environ.get('HEALTH_WRITE_LOCK_FAIL_MS', '2000')))
+app.config['HEALTH_WAL_MB'] = (float(os.environ.get('HEALTH_WAL_WARN_MB', '64')),
+                               float(os.environ.get('HEALTH_WAL_FAIL_MB', '1024')))
+app.config['HEALTH_QUEUE_WAITING'] = (int(os.environ.get('HEALTH_QUEUE_WARN', '1')), None)  # fail = plná fronta pruhu
+app.config['ADMISSION_RESERVED_INTERACTIVE'] = int(os.environ.get('ADMISSION_RESERVED_INTERACTIVE', str(max(2, app.config['WAITRESS_THREADS'] // 2))))
+app.config['ADMISSION_REPORT_SLOTS'] = int(os.environ.get('ADMISSION_REPORT_SLOTS', '2'))
+app.config['ADMISSION_EXPORT_SLOTS'] = int(os.environ.get('ADMISSION_EXPORT_SLOTS', '1'))
+app.config['ADMISSION_QUEUE'] = int(os.environ.get('ADMISSION_QUEUE', '4'))  # max. čekajících na pruh (zkrátí se do rozpočtu vláken)
+app.config['ADMISSION_TIMEOUT'] = float(os.environ.get('ADMISSION_TIMEOUT', '10'))  # sekundy čekání ve frontě
+app.config['ADMISSION_RETRY_AFTER'] = int(os.environ.get('ADMISSION_RETRY_AFTER', '5'))
+# Rozpočet SQL na jeden request podle třídy routy (ms, 0 = bez limitu)
+app.config['QUERY_BUDGET_MS'] = {
+    'report': int(os.environ.get('QUERY_BUDGET_REPORT_MS', '15000')),
+    'export': int(os.environ.get('QUERY_BUDGET_EXPORT_MS', '60000')),
+    'interactive': int(os.environ.get('QUERY_BUDGET_INTERACTIVE_MS', '5000')),
+}
+
+db = SQLAlchemy()
+
+
+# Třídy rout pro řízení zátěže – vše, co zde není, je interaktivní provoz poboček
+ROUTE_CLASSES = {
+    'admin_dashboard': 'report',
+    'admin_statistiky': 'report',
+    'admin_reklamace_archiv': 'report',
+    'admin_historie': 'report',
+    'admin_import': 'export',
+    'admin_zalohy_stahnout': 'export',
+    'admin_export_excel': 'export',
+    'admin_export_all': 'export',
+    'reklamace_export_csv': 'export',
+    'admin_perf': 'report',
+}
+
+
+def get_route_class(endpoint):
+    """Vrací třídu routy ('report', 'export' nebo 'interactive') podle endpointu."""
+    return ROUTE_CLASSES.get(endpoint, 'interactive')
+
+
+def _admission_rejected(lane):
+    """Odpověď 503 při plné frontě – stejná chybová stránka jako ostatní chyby."""
+    app.logger.warning(f'Admission control: odmítnut požadavek {request.endpoint} (pruh {lane.name})')
+    # Odmítnutí skončí dřív než hooky profileru – do metrik requestů ho zapíšeme tady
+    metrics.observe_request(request.endpoint, request.method, 503, g.get('_admission_wait', 0.0))
+    return make_response(render_template('error.html',
+                                         error_code=503,
+                                         error_message='Server je momentálně přetížen'), 503)
+
+
+admission = AdmissionControl(classify=get_route_class, exempt=('health_check', 'health_live', 'health_ready', 'metrics_endpoint', 'static'))
+admission.reject_handler = _admission_rejected
+query_budget = QueryBudget(classify=get_route_class)
+# cProfile pro jeden request (hlavička X-Profile: 1) smí zapnout jen admin
+profiler = RequestProfiler(is_allowed_to_profile=lambda: current_user.is_authenticated and current_user.is_admin())
+profiler.listeners.append(
+    lambda endpoint, record: metrics.observe_request(
+        endpoint, request.method, record['status'], record['wall_ms'] / 1000.0, record['sql_count'])
+)
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')  # prázdné = /metrics bez autentizace
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', '250'))  # 0 = vypnuto
+app.config['SLOW_QUERY_LOG'] = os.environ.get('SLOW_QUERY_LOG', 'logs/slow_queries.log')
+slow_queries = SlowQueryLog()
+readiness = health.Readiness()
+# JSON záznam o každém requestu (prázdné = vypnuto); soubory zapisuje vlákno na pozadí
+app.config['ACCESS_LOG'] = os.environ.get('ACCESS_LOG', 'logs/access.log')
+# Číslo workeru z run_waitress.py (víc procesů) – štítek metrik a přípona souborů logů
+app.config['WORKER_ID'] = os.environ.get('WAITRESS_WORKER_ID', '')
+log_queue = LogQueue()
+
+
+def _log_access(endpoint, record):
+    if not access_logger.handlers:
+        return
+    user_id = current_user.get_id() if current_user.is_authenticated else None
+    access_logger.info('access', extra={'access': access_record(request, endpoint, record, user_id)})
+
+
+profiler.listeners.append(_log_access)
+
+
+@metrics.registry.gauge_callback
+def _runtime_gauges():
+    """Stav poolu, velikost WAL a front admission control – čte se až při scrape."""
+    gauges = []
+    for name, lane in admission.lanes.items():
+        snap = lane.snapshot()
+        gauges.append(('odbery_admission_active', {'lane': name}, snap['active']))
+        gauges.append(('odbery_admission_waiting', {'lane': name}, snap['waiting']))
+        gauges.append(('odbery_admission_rejected_total', {'lane': name}, snap['rejected']))
+    with app.app_context():
+        engine = db.engine
+    pool = engine.pool
+    if hasattr(pool, 'checkedout'):
+        gauges.append(('odbery_db_pool_checked_out', {}, pool.checkedout()))
+    if hasattr(pool, 'overflow'):
+        gauges.append(('odbery_db_pool_overflow', {}, max(pool.overflow(), 0)))
+    if hasattr(pool, 'size'):
+        gauges.append(('odbery_db_pool_size', {}, pool.size()))
+    wal = health.wal_bytes(engine)
+    if wal is not None:
+        gauges.append(('odbery_sqlite_wal_bytes', {}, wal))
+    return gauges
+
+
+@app.teardown_appcontext
+def shutdown_session(exception=None):
+    """Uzavře DB session po každém requestu – brání úniku připojení a zajišťuje stabilitu."""
+    db.session.remove()
+    if exception:
+        db.session.rollback()
+
+
+login_manager = LoginManager()
+login_manager.login_view = 'admin_login'
+login_manager.session_protection = 'strong'  # Silnější ochrana session
+
+def _setup_logging(app):
+    """Rotovaný soubor logs/app.log (mimo debug a testy)."""
     import logging
     from logging.handlers import RotatingFileHandler
-    
+
     # Vytvoříme adresář pro logy, pokud neexistuje
     if not os.path.exists('logs'):
         os.mkdir('logs')
-    
-    file_handler = RotatingFileHandler('logs/app.log', maxBytes=10240000, backupCount=10)
+
+    file_handler = RotatingFileHandler(worker_log_path('logs/app.log', app.config['WORKER_ID']),
+                                       maxBytes=10240000, backupCount=10)
     file_handler.setFormatter(logging.Formatter(
         '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
     ))
@@ -76,20 +243,76 @@ if not app.debug:
     app.logger.setLevel(logging.INFO)
     app.logger.info('Aplikace spuštěna')
 
-db = SQLAlchemy(app)
-
-
-@app.teardown_appcontext
-def shutdown_session(exception=None):
-    """Uzavře DB session po každém requestu – brání úniku připojení a zajišťuje stabilitu."""
-    db.session.remove()
-    if exception:
-        db.session.rollback()
 
+def _sqlite_on_connect(dbapi_connection, connection_record):
+    """Nastavení každého nového SQLite připojení – platí i pro více procesů nad jedním souborem."""
+    cursor = dbapi_connection.cursor()
+    try:
+        # Nová (prázdná) databáze vznikne rovnou s auto_vacuum=INCREMENTAL pro úlohu vacuum;
+        # u existující PRAGMA nic nezmění – tu převede migrace 6
+        cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        # WAL: čtenáři neblokují zapisovatele; v souboru DB se drží trvale
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f"PRAGMA cache_size=-{app.config['SQLITE_CACHE_KB']}")
+    finally:
+        cursor.close()
+    if app.config['ARCHIVE_DB']:
+        cold_storage.attach(dbapi_connection, app.config['ARCHIVE_DB'])
+
+
+def create_app(config=None):
+    """Dokončí konfiguraci aplikace a zaregistruje rozšíření – bez jediného dotazu do DB.
+
+    Import app.py jen definuje modely a routy; databáze se připojí až při prvním
+    requestu. Schéma a výchozí data vytváří jen explicitní příkaz `flask --app app
+    init-db` (nebo `python migrations.py upgrade` pro samotné migrace).
+    `config` přepíše hodnoty z proměnných prostředí (testy, benchmarky).
+    """
+    if 'sqlalchemy' in app.extensions:
+        if config:
+            raise RuntimeError('create_app() už byla zavolána – konfiguraci nelze měnit')
+        return app
+    started = time.perf_counter()
+    app.config.update(config or {})
+    if app.config['WORKER_ID']:
+        metrics.registry.const_labels = (('worker', app.config['WORKER_ID']),)
+        for key in ('ACCESS_LOG', 'SLOW_QUERY_LOG'):
+            app.config[key] = worker_log_path(app.config[key], app.config['WORKER_ID'])
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    is_sqlite = uri.lower().startswith('sqlite')
+    engine_options = {
+        'pool_pre_ping': True,
+        'connect_args': {'timeout': 15, 'check_same_thread': False} if is_sqlite else {},
+    }
+    if app.config['DB_POOL_SIZE'] and ':memory:' not in uri:
+        engine_options['pool_size'] = app.config['DB_POOL_SIZE']
+        engine_options['max_overflow'] = app.config['DB_MAX_OVERFLOW']
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options)
+    # Archiv v samostatném souboru jde jen se SQLite (ATTACH); PostgreSQL má studené tabulky vedle horkých
+    app.config['ARCHIVE_DB'] = cold_storage.resolve_path(app.config['ARCHIVE_DB'], app.instance_path) if is_sqlite else ''
+    if not app.debug and not app.testing:
+        _setup_logging(app)
+        if app.config['JINJA_CACHE_DIR']:
+            warmup.enable_bytecode_cache(app, app.config['JINJA_CACHE_DIR'])
+    db.init_app(app)
+    if is_sqlite:
+        with app.app_context():
+            event.listen(db.engine, 'connect', _sqlite_on_connect)
+    login_manager.init_app(app)
+    admission.init_app(app)
+    query_budget.init_app(app)
+    profiler.init_app(app)
+    slow_queries.init_app(app)
+    readiness.init_app(app)
+    maintenance.init_app(app)
+    log_segments.init_app(app)
+    backups.init_app(app)
+    if not app.debug and not app.testing:
+        log_queue.init_app(app)  # až po rozšířeních – přesune i jejich souborové handlery
+    app.config['STARTUP_MS'] = round((time.perf_counter() - started) * 1000, 1)
+    return app
 
-login_manager = LoginManager(app)
-login_manager.login_view = 'admin_login'
-login_manager.session_protection = 'strong'  # Silnější ochrana session
 
 # Časová zóna pro ČR
 CZ_TZ = ZoneInfo("Europe/Prague") if ZoneInfo else None
@@ -100,7 +323,7 @@ def get_current_time():
 
 def _is_postgresql():
     """True pokud používáme PostgreSQL (Render + Neon)."""
-    return 'postgresql' in _db_url.lower()
+    return 'postgresql' in app.config['SQLALCHEMY_DATABASE_URI'].lower()
 
 
 def _db_year_eq(column, year):
@@ -113,6 +336,13 @@ def _db_year_eq(column, year):
     return db.func.strftime('%Y', column) == str(y)
 
 
+def _db_month(column):
+    """Měsíc sloupce jako celé číslo 1–12 (pro GROUP BY). SQLite: strftime, PostgreSQL: extract."""
+    if _is_postgresql():
+        return db.cast(db.func.extract('month', column), db.Integer)
+    return db.cast(db.func.strftime('%m', column), db.Integer)
+
+
 def _db_month_eq(column, month):
     """Filtr: měsíc sloupce == month. SQLite: strftime, PostgreSQL: extract."""
     m = int(month) if month is not None else None
@@ -124,14 +354,16 @@ def _db_month_eq(column, month):
 
 
 # Modely
+USER_TABLE = 'users' if 'postgresql' in _db_url.lower() else 'user'  # "user" je rezervované v PostgreSQL
+
 # Asociační tabulka pro many-to-many vztah mezi User a Pobocka
 user_pobocky = db.Table('user_pobocky',
-    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Column('user_id', db.Integer, db.ForeignKey(f'{USER_TABLE}.id'), primary_key=True),
     db.Column('pobocka_id', db.Integer, db.ForeignKey('pobocka.id'), primary_key=True)
 )
 
 class User(UserMixin, db.Model):
-    __tablename__ = 'users' if 'postgresql' in _db_url.lower() else 'user'  # "user" je rezervované v PostgreSQL
+    __tablename__ = USER_TABLE
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(100), unique=True, nullable=False)
     password = db.Column(db.String(100), nullable=False)
@@ -142,7 +374,7 @@ class User(UserMixin, db.Model):
     
     # Relationships
     pobocka = db.relationship('Pobocka', foreign_keys=[pobocka_id], backref='users_old', lazy=True)  # Zpětná kompatibilita
-    pobocky = db.relationship('Pobocka', secondary=user_pobocky, lazy='subquery', backref=db.backref('users', lazy=True))  # Many-to-many
+    pobocky = db.relationship('Pobocka', secondary=user_pobocky, lazy='selectin', backref=db.backref('users', lazy=True))  # Many-to-many
 
     # Pomocné metody pro práci s hesly – ulehčí případné další změny.
     def set_password(self, raw_password: str) -> None:
@@ -241,6 +473,87 @@ class ReklamaceLog(db.Model):
     datum = db.Column(db.DateTime, nullable=False)
     pobocka_id = db.Column(db.Integer, db.ForeignKey('pobocka.id'), nullable=False)
 
+
+class Zasilka(db.Model):
+    """Zásilka reklamací do Ústí – manifest kusů odeslaných a přijatých najednou."""
+    id = db.Column(db.Integer, primary_key=True)
+    pobocka_id = db.Column(db.Integer, db.ForeignKey('pobocka.id'), nullable=False, index=True)
+    stav = db.Column(db.String(20), nullable=False, default='odesláno')  # odesláno / přijato
+    odeslano_at = db.Column(db.DateTime, nullable=False)
+    odeslal = db.Column(db.String(100), nullable=True)
+    prijato_at = db.Column(db.DateTime, nullable=True)
+    prijal = db.Column(db.String(100), nullable=True)
+    poznamka = db.Column(db.String(255), nullable=True)
+
+
+class ZasilkaPolozka(db.Model):
+    """Reklamace v zásilce – bez cizího klíče, reklamace se může přesunout do studeného archivu."""
+    __tablename__ = 'zasilka_polozka'
+    zasilka_id = db.Column(db.Integer, db.ForeignKey('zasilka.id'), primary_key=True)
+    reklamace_id = db.Column(db.Integer, primary_key=True, index=True)
+
+
+class MaintenanceRun(db.Model):
+    """Jeden běh úlohy údržby (maintenance.py) – délka, počet řádků a dávek."""
+    __tablename__ = 'maintenance_run'
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), nullable=False, index=True)
+    started_at = db.Column(db.DateTime, nullable=False)
+    duration_ms = db.Column(db.Float, nullable=False)
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    chunks = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False)
+    detail = db.Column(db.String(500), nullable=True)
+
+
+maintenance = Maintenance(run_table=MaintenanceRun.__table__)
+log_segments = SegmentStore()
+backups = Backup()
+
+
+# Studené tabulky (cold_storage.py) – archivované reklamace po ARCHIVE_MOVE_DAYS dnech.
+# Id reklamace se zachovává, log má vlastní (staré id by se na horké tabulce znovu přidělilo).
+reklamace_cold = cold_storage.cold_table(db.metadata, Reklamace.__table__, 'reklamace_archive',
+                                            indexes=[('pobocka_id', 'datum_prijmu')])
+reklamace_log_cold = cold_storage.cold_table(db.metadata, ReklamaceLog.__table__, 'reklamace_log_archive',
+                                                keep_ids=False, indexes=[('reklamace_id',)])
+# Čtení přes obě tabulky (archiv, tisk, exporty, statistiky) – jen pro čtení, zápisy jdou do Reklamace
+ReklamaceVse = aliased(Reklamace, cold_storage.union_view(Reklamace.__table__, reklamace_cold, 'reklamace_vse'),
+                       name='reklamace_vse')
+reklamace_log_vse = cold_storage.union_view(ReklamaceLog.__table__, reklamace_log_cold, 'reklamace_log_vse',
+                                            ['datum', 'pobocka_id', 'uzivatel', 'akce'])
+
+
+def reklamace_vse(*names):
+    """Horká i studená tabulka reklamací jako jeden poddotaz – jen vyjmenované sloupce."""
+    return cold_storage.union_view(Reklamace.__table__, reklamace_cold, 'reklamace_vse', list(names))
+
+
+# Archivovat lze jen skutečně vyřízené reklamace (ne Čeká, ne Posláno do Ústí – tam čekáme na vrácení a posouzení)
+VYRIZENE_STAVY = ('Výměna kus za kus', 'Zamítnuto')
+
+
+# Projekce pro seznamy – jen sloupce, které šablona vypisuje. Velké texty
+# (popis_zavady, reseni, poznamky) se načtou až v editaci a tisku.
+REKLAMACE_LIST_COLUMNS = (
+    Reklamace.id, Reklamace.pobocka_id, Reklamace.zakaznik, Reklamace.telefon, Reklamace.znacka,
+    Reklamace.model, Reklamace.barva, Reklamace.datum_prijmu, Reklamace.datum_zakoupeni, Reklamace.stav,
+    Reklamace.sleva_procent, Reklamace.cena, Reklamace.zavolano_zakaznikovi, Reklamace.archived,
+    Reklamace.archived_at,
+)
+# branch.html poznámky u odběru zobrazuje – nevypisuje jen stav (vždy 'aktivní')
+ODBER_LIST_COLUMNS = (
+    Odber.id, Odber.pobocka_id, Odber.jmeno, Odber.kdo_zadal, Odber.telefon, Odber.placeno_predem,
+    Odber.datum, Odber.castka, Odber.poznamky,
+)
+
+
+def aktivni_odbery(pobocka_id):
+    """Aktivní odběry pobočky pro seznam v branch.html (nejnovější nahoře)."""
+    return (Odber.query.options(load_only(*ODBER_LIST_COLUMNS))
+            .filter_by(pobocka_id=pobocka_id, stav='aktivní').order_by(Odber.datum.desc()).all())
+
+
 # Formuláře
 class PridatOdberForm(FlaskForm):
     jmeno = StringField('Jméno a příjmení', validators=[DataRequired(message='Zadejte jméno zákazníka'), Length(max=200, message='Jméno může mít maximálně 200 znaků')])
@@ -440,226 +753,21 @@ def log_reklamace_action(reklamace: Reklamace, text: str) -> None:
     )
     db.session.add(log)
 
-# Migrace databáze - přidání nových sloupců do existující tabulky user
-def migrate_db():
-    """Přidá chybějící sloupce do tabulky user, pokud neexistují.
-    U PostgreSQL se migrace přeskočí – create_all() vytvoří kompletní schéma."""
-    if _is_postgresql():
-        return
-    # NEPOUŽÍVÁME app.app_context() zde, protože to už je v init_db()
-    try:
-        # Zkontrolujeme, jestli sloupce existují pomocí PRAGMA (SQLite)
-        result = db.session.execute(db.text("PRAGMA table_info(user)"))
-        columns = [row[1] for row in result.fetchall()]
-        
-        # Přidáme chybějící sloupce
-        if 'pin' not in columns:
-            db.session.execute(db.text('ALTER TABLE user ADD COLUMN pin VARCHAR(10)'))
-            db.session.commit()
-        if 'pobocka_id' not in columns:
-            db.session.execute(db.text('ALTER TABLE user ADD COLUMN pobocka_id INTEGER'))
-            db.session.commit()
-        if 'role' not in columns:
-            db.session.execute(db.text('ALTER TABLE user ADD COLUMN role VARCHAR(20) DEFAULT "user"'))
-            db.session.commit()
-        if 'jmeno' not in columns:
-            db.session.execute(db.text('ALTER TABLE user ADD COLUMN jmeno VARCHAR(100)'))
-            db.session.commit()
-    except Exception as e:
-        # Pokud kontrola selže, zkusíme přidat sloupce přímo (pokud už neexistují)
-        # SQLite vrátí chybu, pokud sloupec už existuje, což je OK
-        try:
-            db.session.execute(db.text('ALTER TABLE user ADD COLUMN pin VARCHAR(10)'))
-            db.session.commit()
-        except:
-            db.session.rollback()
-        try:
-            db.session.execute(db.text('ALTER TABLE user ADD COLUMN pobocka_id INTEGER'))
-            db.session.commit()
-        except:
-            db.session.rollback()
-        try:
-            db.session.execute(db.text('ALTER TABLE user ADD COLUMN role VARCHAR(20) DEFAULT "user"'))
-            db.session.commit()
-        except:
-            db.session.rollback()
-        try:
-            db.session.execute(db.text('ALTER TABLE user ADD COLUMN jmeno VARCHAR(100)'))
-            db.session.commit()
-        except:
-            db.session.rollback()
-    
-    # Migrace pro Reklamace tabulku
-    try:
-        result = db.session.execute(db.text("PRAGMA table_info(reklamace)"))
-        reklamace_columns = [row[1] for row in result.fetchall()]
-        
-        if 'zavolano_zakaznikovi' not in reklamace_columns:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN zavolano_zakaznikovi BOOLEAN DEFAULT 0'))
-            db.session.commit()
-            app.logger.info('Přidán sloupec zavolano_zakaznikovi do Reklamace')
-    except:
-        db.session.rollback()
-        try:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN zavolano_zakaznikovi BOOLEAN DEFAULT 0'))
-            db.session.commit()
-        except:
-            db.session.rollback()
-    
-    try:
-        result = db.session.execute(db.text("PRAGMA table_info(reklamace)"))
-        reklamace_columns = [row[1] for row in result.fetchall()]
-        
-        if 'prijal' not in reklamace_columns:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN prijal VARCHAR(100)'))
-            db.session.commit()
-            app.logger.info('Přidán sloupec prijal do Reklamace')
-    except:
-        db.session.rollback()
-        try:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN prijal VARCHAR(100)'))
-            db.session.commit()
-        except:
-            db.session.rollback()
-    
-    # Migrace pro nová pole v Reklamace: barva a datum_zakoupeni
-    try:
-        result = db.session.execute(db.text("PRAGMA table_info(reklamace)"))
-        reklamace_columns = [row[1] for row in result.fetchall()]
-        
-        if 'barva' not in reklamace_columns:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN barva VARCHAR(50)'))
-            db.session.commit()
-            app.logger.info('Přidán sloupec barva do Reklamace')
-    except:
-        db.session.rollback()
-        try:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN barva VARCHAR(50)'))
-            db.session.commit()
-        except:
-            db.session.rollback()
-    
-    try:
-        result = db.session.execute(db.text("PRAGMA table_info(reklamace)"))
-        reklamace_columns = [row[1] for row in result.fetchall()]
-        
-        if 'datum_zakoupeni' not in reklamace_columns:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN datum_zakoupeni DATE'))
-            db.session.commit()
-            app.logger.info('Přidán sloupec datum_zakoupeni do Reklamace')
-    except:
-        db.session.rollback()
-        try:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN datum_zakoupeni DATE'))
-            db.session.commit()
-        except:
-            db.session.rollback()
-    
-    # Migrace: sleva_procent v Reklamace
-    try:
-        result = db.session.execute(db.text("PRAGMA table_info(reklamace)"))
-        reklamace_columns = [row[1] for row in result.fetchall()]
-        if 'sleva_procent' not in reklamace_columns:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN sleva_procent REAL'))
-            db.session.commit()
-            app.logger.info('Přidán sloupec sleva_procent do Reklamace')
-    except:
-        db.session.rollback()
-        try:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN sleva_procent REAL'))
-            db.session.commit()
-        except:
-            db.session.rollback()
-    
-    # Migrace: stav Sleva -> Zamítnuto (sleva je nyní jen sloupec při Zamítnuto)
-    try:
-        db.session.execute(db.text("UPDATE reklamace SET stav = 'Zamítnuto' WHERE stav = 'Sleva'"))
-        updated = db.session.execute(db.text("SELECT changes()")).scalar()
-        if updated and updated > 0:
-            db.session.commit()
-            app.logger.info(f'Migrace: {updated} reklamací převedeno ze stavu Sleva na Zamítnuto')
-    except:
-        db.session.rollback()
-    
-    # Migrace: archived a archived_at pro archivaci starších reklamací
-    try:
-        result = db.session.execute(db.text("PRAGMA table_info(reklamace)"))
-        reklamace_columns = [row[1] for row in result.fetchall()]
-        if 'archived' not in reklamace_columns:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN archived BOOLEAN DEFAULT 0'))
-            db.session.commit()
-            app.logger.info('Přidán sloupec archived do Reklamace')
-    except:
-        db.session.rollback()
-        try:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN archived BOOLEAN DEFAULT 0'))
-            db.session.commit()
-        except:
-            db.session.rollback()
-    try:
-        result = db.session.execute(db.text("PRAGMA table_info(reklamace)"))
-        reklamace_columns = [row[1] for row in result.fetchall()]
-        if 'archived_at' not in reklamace_columns:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN archived_at DATETIME'))
-            db.session.commit()
-            app.logger.info('Přidán sloupec archived_at do Reklamace')
-    except:
-        db.session.rollback()
-        try:
-            db.session.execute(db.text('ALTER TABLE reklamace ADD COLUMN archived_at DATETIME'))
-            db.session.commit()
-        except:
-            db.session.rollback()
-    
-    # Migrace pro nová pole v Pobocka: adresa a firma
-    try:
-        result = db.session.execute(db.text("PRAGMA table_info(pobocka)"))
-        pobocka_columns = [row[1] for row in result.fetchall()]
-        
-        if 'adresa' not in pobocka_columns:
-            db.session.execute(db.text('ALTER TABLE pobocka ADD COLUMN adresa VARCHAR(200)'))
-            db.session.commit()
-            app.logger.info('Přidán sloupec adresa do Pobocka')
-    except:
-        db.session.rollback()
-        try:
-            db.session.execute(db.text('ALTER TABLE pobocka ADD COLUMN adresa VARCHAR(200)'))
-            db.session.commit()
-        except:
-            db.session.rollback()
-    
-    try:
-        result = db.session.execute(db.text("PRAGMA table_info(pobocka)"))
-        pobocka_columns = [row[1] for row in result.fetchall()]
-        
-        if 'firma' not in pobocka_columns:
-            db.session.execute(db.text('ALTER TABLE pobocka ADD COLUMN firma VARCHAR(200)'))
-            db.session.commit()
-            app.logger.info('Přidán sloupec firma do Pobocka')
-    except:
-        db.session.rollback()
-        try:
-            db.session.execute(db.text('ALTER TABLE pobocka ADD COLUMN firma VARCHAR(200)'))
-            db.session.commit()
-        except:
-            db.session.rollback()
+def log_reklamace_actions(reklamace_ids, pobocka_id, text):
+    """Záznamy o stejné akci nad více reklamacemi jedné pobočky – jeden hromadný INSERT."""
+    uzivatel = current_user.username if current_user.is_authenticated else 'system'
+    now = get_current_time()
+    db.session.execute(db.insert(ReklamaceLog.__table__), [
+        {'reklamace_id': reklamace_id, 'uzivatel': uzivatel, 'akce': text, 'datum': now, 'pobocka_id': pobocka_id}
+        for reklamace_id in reklamace_ids])
 
-# Inicializace databáze
+# Migrace databáze - přidání nových sloupců do existující tabulky user
+# Inicializace databáze – jen přes příkaz init-db, ne při importu
 def init_db():
     with app.app_context():
-        db.create_all()
-        # SQLite: zapnutí WAL režimu pro plynulejší a rychlejší zápisy
-        try:
-            if 'sqlite' in (os.environ.get('DATABASE_URL') or 'sqlite:///').lower():
-                db.session.execute(db.text('PRAGMA journal_mode=WAL'))
-                db.session.execute(db.text('PRAGMA synchronous=NORMAL'))
-                db.session.execute(db.text('PRAGMA cache_size=-64000'))  # 64 MB cache
-                db.session.commit()
-        except Exception:
-            db.session.rollback()
-        # Spustíme migraci před vytvářením dat - MUSÍ být před jakýmkoliv dotazem na modely
-        migrate_db()
-        
+        # DDL jen při čekajících migracích (WAL a další PRAGMA nastavuje _sqlite_on_connect)
+        migrations.upgrade(db.engine, db.metadata, app.logger)
+
         # Po migraci musíme znovu načíst metadata, aby SQLAlchemy věděl o nových sloupcích
         # Použijeme raw SQL dotaz pro kontrolu existence poboček
         try:
@@ -720,13 +828,248 @@ def init_db():
             db.session.commit()
         # No default zadavatel creation
 
-init_db()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Vytvoří/zmigruje schéma a doplní výchozí pobočky a admina."""
+    create_app()
+    started = time.perf_counter()
+    init_db()
+    with app.app_context():
+        version = migrations.current_version(db.engine)
+    click.echo(f'Databáze připravena (schéma verze {version}) za {(time.perf_counter() - started) * 1000:.0f} ms')
+
+
+def presun_do_archivu(before=None):
+    """Přesune reklamace archivované před `before` (výchozí ARCHIVE_MOVE_DAYS dní) do studených tabulek."""
+    if before is None:
+        before = get_current_time() - timedelta(days=app.config['ARCHIVE_MOVE_DAYS'])
+    with app.app_context():
+        return cold_storage.move_archived(
+            db.engine, Reklamace.__table__, reklamace_cold, ReklamaceLog.__table__, reklamace_log_cold,
+            before, batch_size=app.config['ARCHIVE_BATCH_SIZE'])
+
+
+@app.cli.command('archive-move')
+def archive_move_command():
+    """Přesune staré archivované reklamace (a jejich log) do studeného archivu."""
+    create_app()
+    started = time.perf_counter()
+    moved, logs = presun_do_archivu()
+    click.echo(f'Přesunuto {moved} reklamací a {logs} záznamů logu za {(time.perf_counter() - started) * 1000:.0f} ms')
+
+
+# Úlohy údržby (maintenance.py) – hromadné změny po dávkách, každá dávka zapíše i záznam do logu akcí
+@maintenance.job('auto_archive', every=24 * 3600)
+def _job_auto_archive(ctx):
+    """Vyřízené reklamace bez změny za MAINT_ARCHIVE_AFTER_DAYS dní archivuje (jako tlačítko Archivovat)."""
+    days = app.config['MAINT_ARCHIVE_AFTER_DAYS']
+    if not days:
+        return ctx.skip('vypnuto')
+    now = get_current_time()
+    cutoff = now - timedelta(days=days)
+    r, log = Reklamace.__table__, ReklamaceLog.__table__
+    recent_change = db.select(log.c.id).where(log.c.reklamace_id == r.c.id, log.c.datum >= cutoff).exists()
+
+    def select_ids(conn, limit):
+        return conn.execute(
+            db.select(r.c.id).where(r.c.archived == False, r.c.stav.in_(VYRIZENE_STAVY),  # noqa: E712
+                                    r.c.datum_prijmu < cutoff.date(), ~recent_change)
+            .order_by(r.c.id).limit(limit)).scalars().all()
+
+    def apply(conn, ids):
+        conn.execute(db.update(r).where(r.c.id.in_(ids)).values(archived=True, archived_at=now))
+        conn.execute(db.insert(log).from_select(
+            ['reklamace_id', 'uzivatel', 'akce', 'datum', 'pobocka_id'],
+            db.select(r.c.id, db.literal('system'), db.literal(f'Automaticky archivováno po {days} dnech bez změny'),
+                      db.literal(now, db.DateTime), r.c.pobocka_id).where(r.c.id.in_(ids))))
+
+    ctx.chunked(select_ids, apply)
+
+
+@maintenance.job('expire_pickups', every=24 * 3600)
+def _job_expire_pickups(ctx):
+    """Aktivní odběry starší než MAINT_PICKUP_EXPIRE_DAYS dní označí jako nevyzvednuté (jako update())."""
+    days = app.config['MAINT_PICKUP_EXPIRE_DAYS']
+    if not days:
+        return ctx.skip('vypnuto')
+    now = get_current_time()
+    cutoff = date.today() - timedelta(days=days)
+    o, akce = Odber.__table__, Akce.__table__
+
+    def select_ids(conn, limit):
+        return conn.execute(db.select(o.c.id).where(o.c.stav == 'aktivní', o.c.datum < cutoff)
+                            .order_by(o.c.id).limit(limit)).scalars().all()
+
+    def apply(conn, ids):
+        conn.execute(db.update(o).where(o.c.id.in_(ids)).values(stav='nevyzvednuto'))
+        conn.execute(db.insert(akce).from_select(
+            ['odber_id', 'uzivatel', 'akce', 'datum', 'pobocka_id'],
+            db.select(o.c.id, db.literal('system'), db.literal(f'Stav změněn na nevyzvednuto (po {days} dnech)'),
+                      db.literal(now, db.DateTime), o.c.pobocka_id).where(o.c.id.in_(ids))))
+
+    ctx.chunked(select_ids, apply)
+
+
+@maintenance.job('cold_move', every=24 * 3600)
+def _job_cold_move(ctx):
+    """Staré archivované reklamace do studeného archivu (cold_storage.py)."""
+    ctx.rows, logs = presun_do_archivu()
+    ctx.detail = f'{logs} záznamů logu'
+
+
+# Proudy retence logu: (segment, tabulka, cizí klíč) – log reklamací ze studeného archivu jde do stejného segmentu
+LOG_STREAMS = (
+    ('akce', Akce.__table__, 'odber_id'),
+    ('reklamace_log', ReklamaceLog.__table__, 'reklamace_id'),
+    ('reklamace_log', reklamace_log_cold, 'reklamace_id'),
+)
+
+
+@maintenance.job('log_retention', every=24 * 3600)
+def _job_log_retention(ctx):
+    """Záznamy logu starší než LOG_RETENTION_DAYS dní do měsíčních segmentů (log_segments.py)."""
+    days = app.config['LOG_RETENTION_DAYS']
+    if not days:
+        return ctx.skip('vypnuto')
+    cutoff = get_current_time() - timedelta(days=days)
+    for stream, table, fk in LOG_STREAMS:
+        columns = [table.c.id, table.c.datum, table.c.pobocka_id, table.c.uzivatel, table.c.akce, table.c[fk]]
+
+        def select_ids(conn, limit, table=table):
+            return conn.execute(db.select(table.c.id).where(table.c.datum < cutoff)
+                                .order_by(table.c.id).limit(limit)).scalars().all()
+
+        def apply(conn, ids, stream=stream, table=table, columns=columns):
+            # Nejdřív segment na disk, pak DELETE ve stejné transakci – po pádu mezi nimi se dávka
+            # přesune znovu a segment už zapsané (zdroj, id) přeskočí
+            rows = conn.execute(db.select(*columns).where(table.c.id.in_(ids))).mappings().all()
+            log_segments.append(stream, [dict(row, zdroj=table.name) for row in rows])
+            conn.execute(db.delete(table).where(table.c.id.in_(ids)))
+
+        ctx.chunked(select_ids, apply)
+
+
+@maintenance.job('analyze', every=24 * 3600)
+def _job_analyze(ctx):
+    """Obnoví statistiky plánovače dotazů (SQLite s omezeným vzorkem, ať neblokuje dlouho)."""
+    with ctx.engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            conn.exec_driver_sql('PRAGMA analysis_limit=1000')
+            conn.exec_driver_sql('ANALYZE')
+            conn.exec_driver_sql('PRAGMA optimize')
+        else:
+            conn.exec_driver_sql('ANALYZE')
+        conn.commit()
+
+
+@maintenance.job('vacuum', every=7 * 24 * 3600)
+def _job_vacuum(ctx):
+    """Vrátí volné stránky souboru (jen SQLite s auto_vacuum=INCREMENTAL; PostgreSQL má autovacuum)."""
+    with ctx.engine.connect() as conn:
+        if conn.dialect.name != 'sqlite':
+            return ctx.skip('jen SQLite')
+        if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() != 2:
+            return ctx.skip('auto_vacuum není INCREMENTAL – spusťte python migrations.py upgrade (migrace 6)')
+        before = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+        # execute() krokuje PRAGMA jen jednou (= 1 stránka); executescript ho doběhne celý
+        conn.connection.driver_connection.executescript(
+            f"PRAGMA incremental_vacuum({int(app.config['MAINT_VACUUM_PAGES'])});")
+        ctx.rows = before - conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+        conn.commit()
+
+
+@maintenance.job('wal_checkpoint', every=15 * 60)
+def _job_wal_checkpoint(ctx):
+    """Přepíše WAL do databáze a zkrátí ho na nulu; když čtenáři drží snapshot, zkusí to příště."""
+    with ctx.engine.connect() as conn:
+        if conn.dialect.name != 'sqlite':
+            return ctx.skip('jen SQLite')
+        busy, log_pages, checkpointed = conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').one()
+        ctx.rows = max(checkpointed, 0)
+        ctx.detail = f'WAL {log_pages} stránek' + (', zaneprázdněno' if busy else '')
+
+
+@maintenance.job('backup', every=24 * 3600)
+def _job_backup(ctx):
+    """Online záloha SQLite přes backup API (backup.py) – hlavní databáze a soubor studeného archivu."""
+    if ctx.engine.dialect.name != 'sqlite':
+        return ctx.skip('jen SQLite (PostgreSQL zálohuje poskytovatel)')
+    path = ctx.engine.url.database
+    if not path or path == ':memory:':
+        return ctx.skip('databáze v paměti')
+    zalohy = []
+    for source in [path] + ([app.config['ARCHIVE_DB']] if app.config['ARCHIVE_DB'] else []):
+        result = backups.run(source)
+        ctx.rows += result['pages']
+        ctx.chunks += result['steps']
+        zalohy.append(f"{result['name']} ({result['bytes'] // 1024} kB, {result['attempts']}. pokus)")
+    ctx.detail = ', '.join(zalohy)
+
+
+@app.cli.command('maintenance')
+@click.option('--job', 'jobs', multiple=True, help='spustit jen tuto úlohu (lze opakovat), i když není na řadě')
+@click.option('--loop', is_flag=True, help='běžet trvale a pouštět úlohy, které jsou na řadě')
+def maintenance_command(jobs, loop):
+    """Údržba databáze: auto-archivace, propadlé odběry, studený archiv, ANALYZE, VACUUM, WAL, zálohy."""
+    create_app()
+    unknown = set(jobs) - set(maintenance.jobs)
+    if unknown:
+        raise click.BadParameter(f"neznámá úloha {', '.join(sorted(unknown))}; dostupné: {', '.join(maintenance.jobs)}")
+    with app.app_context():
+        engine = db.engine
+    while True:
+        results = maintenance.run(engine, list(jobs), app.logger) if jobs else maintenance.run_due(engine, app.logger)
+        for result in results:
+            click.echo(f"{result['job']:15} {result['status']:8} {result['rows']:6} řádků "
+                       f"{result['chunks']:4} dávek {result['duration_ms']:9.1f} ms  {result['detail']}")
+        if not loop:
+            return
+        jobs = ()
+        time.sleep(app.config['MAINT_TICK_S'])
+
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(['odbery', 'reklamace']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--pobocka', 'pobocka_id', type=int, required=True, help='ID pobočky, do které se řádky importují')
+@click.option('--user', 'uzivatel', default='import', show_default=True, help='kdo import provedl (audit, Zadal/Přijal)')
+@click.option('--dry-run', is_flag=True, help='jen ověřit řádky, nic nezapisovat')
+def import_data_command(kind, path, pobocka_id, uzivatel, dry_run):
+    """Hromadný import odběrů nebo reklamací z CSV/XLSX (převod z papíru nebo jiného systému)."""
+    create_app()
+    with app.app_context():
+        if db.session.get(Pobocka, pobocka_id) is None:
+            raise click.BadParameter(f'pobočka {pobocka_id} neexistuje', param_hint='--pobocka')
+        with open(path, 'rb') as f:
+            try:
+                result = run_import(db.engine, IMPORT_SPECS[kind], read_rows(f, path), pobocka_id, uzivatel,
+                                    get_current_time(), app.config['IMPORT_BATCH_SIZE'], dry_run)
+            except RowError as e:
+                raise click.ClickException(str(e))
+    for line, message in result['errors']:
+        click.echo(f'řádek {line}: {message}', err=True)
+    click.echo(f"{result['imported']}/{result['rows']} řádků {'ověřeno' if dry_run else 'importováno'} "
+               f"({result['batches']} dávek, {result['error_count']} chyb, {result.get('ms', 0)} ms)")
+
+
+def warm_up_app():
+    """Zahřátí workeru (warmup.py) – volá run_waitress.py a wsgi.py před prvním requestem."""
+    if not app.config['WARMUP']:
+        return None
+    return warmup.warm_up(app, db, queries=[
+        ('load_user', lambda: load_user('0')),  # stejný dotaz jako na každém requestu přihlášeného
+        ('pobocky', lambda: Pobocka.query.all()),
+    ])
 
 @login_manager.user_loader
 def load_user(user_id):
     """Načte uživatele – chrání před neplatným user_id a chybami."""
     try:
-        return User.query.get(int(user_id))
+        # Pobočky uživatele se čtou na každé stránce (base.html, kontrola přístupu) – načteme je hned.
+        # populate_existing: options platí, i když je uživatel už v identity map session (testy, CLI)
+        return (User.query.options(selectinload(User.pobocky), joinedload(User.pobocka))
+                .populate_existing().get(int(user_id)))
     except (ValueError, TypeError):
         return None
 
@@ -817,9 +1160,9 @@ def branch(pobocka_id):
         except Exception as e:
             db.session.rollback()
             flash(f'Chyba při přidávání odběru: {str(e)}', 'danger')
-            return render_template('branch.html', form=form, odbery=Odber.query.filter_by(pobocka_id=pobocka_id, stav='aktivní').order_by(Odber.datum.desc()).all(), pobocka=pobocka, prehled={}, validacni_chyba=None)
+            return render_template('branch.html', form=form, odbery=aktivni_odbery(pobocka_id), pobocka=pobocka, prehled={}, validacni_chyba=None)
 
-    odbery = Odber.query.filter_by(pobocka_id=pobocka_id, stav='aktivní').order_by(Odber.datum.desc()).all()
+    odbery = aktivni_odbery(pobocka_id)
     dnes = date.today()
     zelene = 0
     cervene = 0
@@ -862,14 +1205,7 @@ def reklamace_branch(pobocka_id):
         model_ok = bool((form.model.data or '').strip())
         popis_ok = bool((form.popis_zavady.data or '').strip())
         datum_zak_ok = form.datum_zakoupeni.data is not None
-        zaruka_ok = True
-        if datum_zak_ok and form.datum_zakoupeni.data:
-            try:
-                d = form.datum_zakoupeni.data
-                zaruka_do = date(d.year + 2, d.month, d.day)
-            except ValueError:
-                zaruka_do = date(d.year + 2, 2, 28)  # 29.2. v přestupném roce
-            zaruka_ok = zaruka_do >= date.today()
+        zaruka_ok = not datum_zak_ok or zaruka_do(form.datum_zakoupeni.data) >= date.today()
         req_ok = zakaznik_ok and telefon_ok and znacka_ok and model_ok and popis_ok and datum_zak_ok and zaruka_ok
         if not zakaznik_ok:
             validacni_chyba = 'Zadejte jméno zákazníka.'
@@ -925,7 +1261,7 @@ def reklamace_branch(pobocka_id):
     date_to = request.args.get('to', '').strip()
     show_archived = request.args.get('archived', '').strip().lower() in ('1', 'true', 'ano', 'yes')
 
-    reklamace_query = Reklamace.query.filter_by(pobocka_id=pobocka_id)
+    reklamace_query = Reklamace.query.options(load_only(*REKLAMACE_LIST_COLUMNS)).filter_by(pobocka_id=pobocka_id)
     if not show_archived:
         reklamace_query = reklamace_query.filter(Reklamace.archived == False)
     if stav:
@@ -971,7 +1307,12 @@ def reklamace_branch(pobocka_id):
 @login_required
 def reklamace_edit(reklamace_id):
     """Úprava reklamace - vyžaduje přihlášení a oprávnění k pobočce."""
-    reklamace = Reklamace.query.get_or_404(reklamace_id)
+    reklamace = db.session.get(Reklamace, reklamace_id)
+    if reklamace is None:
+        if db.session.query(reklamace_cold.c.id).filter(reklamace_cold.c.id == reklamace_id).first():
+            flash('Reklamace je ve starém archivu a nelze ji upravit – otevírám tisk.', 'info')
+            return redirect(url_for('reklamace_print', reklamace_id=reklamace_id))
+        abort(404)
     pobocka = Pobocka.query.get_or_404(reklamace.pobocka_id)
     
     # Ověření oprávnění k pobočce
@@ -996,14 +1337,7 @@ def reklamace_edit(reklamace_id):
         model_ok = bool((form.model.data or '').strip())
         popis_ok = bool((form.popis_zavady.data or '').strip())
         datum_zak_ok = form.datum_zakoupeni.data is not None
-        zaruka_ok = True
-        if datum_zak_ok and form.datum_zakoupeni.data:
-            try:
-                d = form.datum_zakoupeni.data
-                zaruka_do = date(d.year + 2, d.month, d.day)
-            except ValueError:
-                zaruka_do = date(d.year + 2, 2, 28)  # 29.2. v přestupném roce
-            zaruka_ok = zaruka_do >= date.today()
+        zaruka_ok = not datum_zak_ok or zaruka_do(form.datum_zakoupeni.data) >= date.today()
         req_ok = zakaznik_ok and telefon_ok and znacka_ok and model_ok and popis_ok and datum_zak_ok and zaruka_ok
         if not zakaznik_ok:
             validacni_chyba = 'Zadejte jméno zákazníka.'
@@ -1056,40 +1390,59 @@ def reklamace_edit(reklamace_id):
     return render_template('reklamace_edit.html', pobocka=pobocka, reklamace=reklamace, form=form, telefon_plain=telefon_plain, validacni_chyba=validacni_chyba if request.method == 'POST' else None)
 
 
+# Akce z tlačítek u reklamace → nový stav (rychlá změna stavu i příjem zásilky)
+REKLAMACE_AKCE = {
+    'ceka': 'Čeká',
+    'vymena': 'Výměna kus za kus',
+    'poslano_usti': 'Posláno do Ústí',
+    'zamitnuto': 'Zamítnuto',
+}
+
+
 @app.route('/reklamace/<int:reklamace_id>/status', methods=['POST'])
 @login_required
 def reklamace_change_status(reklamace_id):
-    """Rychlá změna stavu reklamace z tabulky - vyžaduje přihlášení a oprávnění k pobočce."""
+    """Rychlá změna stavu reklamace z tabulky - vyžaduje přihlášení a oprávnění k pobočce.
+
+    AJAX (Accept: application/json) dostane jen nově vykreslený řádek tabulky
+    místo redirectu a celého přehledu pobočky.
+    """
     reklamace = Reklamace.query.get_or_404(reklamace_id)
     pobocka_id = reklamace.pobocka_id
+    as_json = _wants_json()
     
     # Ověření oprávnění k pobočce
     if not current_user.can_access_pobocka(pobocka_id):
+        if as_json:
+            return jsonify({'status': 'error', 'message': 'Nemáte přístup k této pobočce!'}), 403
         flash('Nemáte přístup k této pobočce!', 'danger')
         return redirect(url_for('index'))
     
     action = request.form.get('action', '')
-
-    mapping = {
-        'ceka': 'Čeká',
-        'vymena': 'Výměna kus za kus',
-        'poslano_usti': 'Posláno do Ústí',
-        'zamitnuto': 'Zamítnuto',
-    }
-    new_status = mapping.get(action)
+    new_status = REKLAMACE_AKCE.get(action)
 
     if not new_status:
+        if as_json:
+            return jsonify({'status': 'error', 'message': 'Neplatná akce pro změnu stavu.'}), 400
         flash('Neplatná akce pro změnu stavu.', 'danger')
         return redirect(url_for('reklamace_branch', pobocka_id=pobocka_id))
 
     try:
+        puvodni = reklamace.stav
         reklamace.stav = new_status
         log_reklamace_action(reklamace, f'Změněn stav reklamace na {new_status}')
+        # Řádek se vykreslí před commitem – po něm by se reklamace znovu načítala z DB
+        row = render_template('reklamace_row.html', r=reklamace) if as_json else None
         db.session.commit()
+        if as_json:
+            return jsonify({'status': 'success', 'id': reklamace_id, 'stav': new_status, 'puvodni': puvodni,
+                            'row': row})
         flash(f'Stav reklamace změněn na "{new_status}".', 'success')
     except Exception as e:
         db.session.rollback()
         app.logger.error(f'Chyba při změně stavu reklamace {reklamace_id}: {str(e)}')
+        if as_json:
+            return jsonify({'status': 'error', 'message': f'Chyba při změně stavu reklamace: {str(e)}'}), 500
         flash(f'Chyba při změně stavu reklamace: {str(e)}', 'danger')
 
     return redirect(url_for('reklamace_branch', pobocka_id=pobocka_id))
@@ -1106,9 +1459,7 @@ def reklamace_archive(reklamace_id):
         flash('Nemáte přístup k této pobočce!', 'danger')
         return redirect(url_for('index'))
     
-    # Archivovat lze jen skutečně vyřízené reklamace (ne Čeká, ne Posláno do Ústí – tam čekáme na vrácení a posouzení)
-    vyrizene_stavy = ('Výměna kus za kus', 'Zamítnuto')
-    if reklamace.stav not in vyrizene_stavy:
+    if reklamace.stav not in VYRIZENE_STAVY:
         flash('Archivovat lze pouze vyřízené reklamace (Prošlo – výměna nebo Zamítnuto).', 'warning')
         return redirect(url_for('reklamace_branch', pobocka_id=pobocka_id))
     
@@ -1131,11 +1482,138 @@ def reklamace_archive(reklamace_id):
     return redirect(target)
 
 
+@app.route('/reklamace/branch/<int:pobocka_id>/zasilka', methods=['POST'])
+@login_required
+def zasilka_create(pobocka_id):
+    """Zásilka do Ústí z vybraných čekajících reklamací – všechny kusy v jedné transakci."""
+    if not current_user.can_access_pobocka(pobocka_id):
+        flash('Nemáte přístup k této pobočce!', 'danger')
+        return redirect(url_for('index'))
+    try:
+        ids = {int(i) for i in request.form.getlist('reklamace_ids')}
+    except ValueError:
+        ids = set()
+    r = Reklamace.__table__
+    found = db.session.execute(
+        db.select(r.c.id).where(r.c.id.in_(ids), r.c.pobocka_id == pobocka_id, r.c.stav == 'Čeká',
+                                r.c.archived == False).order_by(r.c.id)).scalars().all() if ids else []  # noqa: E712
+    if not found:
+        flash('Vyberte čekající reklamace, které se mají odeslat do Ústí.', 'warning')
+        return redirect(url_for('reklamace_branch', pobocka_id=pobocka_id))
+
+    try:
+        zasilka = Zasilka(pobocka_id=pobocka_id, stav='odesláno', odeslano_at=get_current_time(),
+                          odeslal=current_user.username or current_user.jmeno,
+                          poznamka=(request.form.get('poznamka') or '').strip()[:255] or None)
+        db.session.add(zasilka)
+        db.session.flush()
+        db.session.execute(db.insert(ZasilkaPolozka.__table__),
+                           [{'zasilka_id': zasilka.id, 'reklamace_id': reklamace_id} for reklamace_id in found])
+        db.session.execute(db.update(r).where(r.c.id.in_(found)).values(stav='Posláno do Ústí'))
+        log_reklamace_actions(found, pobocka_id, f'Změněn stav reklamace na Posláno do Ústí (zásilka #{zasilka.id})')
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f'Chyba při vytváření zásilky na pobočce {pobocka_id}: {str(e)}')
+        flash(f'Chyba při vytváření zásilky: {str(e)}', 'danger')
+        return redirect(url_for('reklamace_branch', pobocka_id=pobocka_id))
+    flash(f'Zásilka #{zasilka.id} vytvořena – {len(found)} reklamací posláno do Ústí.', 'success')
+    return redirect(url_for('zasilka_manifest', zasilka_id=zasilka.id))
+
+
+@app.route('/reklamace/branch/<int:pobocka_id>/zasilky')
+@login_required
+def zasilky_branch(pobocka_id):
+    """Přehled zásilek pobočky do Ústí s počtem kusů."""
+    pobocka = Pobocka.query.get_or_404(pobocka_id)
+    if not current_user.can_access_pobocka(pobocka_id):
+        flash('Nemáte přístup k této pobočce!', 'danger')
+        return redirect(url_for('index'))
+    pocet = db.func.count(ZasilkaPolozka.reklamace_id).label('pocet')
+    zasilky = (db.session.query(Zasilka, pocet)
+               .outerjoin(ZasilkaPolozka, ZasilkaPolozka.zasilka_id == Zasilka.id)
+               .filter(Zasilka.pobocka_id == pobocka_id)
+               .group_by(Zasilka.id)
+               .order_by(Zasilka.odeslano_at.desc(), Zasilka.id.desc())
+               .limit(200).all())
+    return render_template('zasilky_branch.html', pobocka=pobocka, zasilky=zasilky)
+
+
+def _zasilka_polozky(zasilka_id):
+    """Reklamace v zásilce – horká i studená tabulka, jen sloupce manifestu."""
+    rv = reklamace_vse('id', 'zakaznik', 'telefon', 'znacka', 'model', 'barva', 'datum_prijmu', 'datum_zakoupeni',
+                       'popis_zavady', 'stav').c
+    return (db.session.query(*rv)
+            .join(ZasilkaPolozka, ZasilkaPolozka.reklamace_id == rv.id)
+            .filter(ZasilkaPolozka.zasilka_id == zasilka_id)
+            .order_by(rv.id).all())
+
+
+@app.route('/reklamace/zasilka/<int:zasilka_id>')
+@login_required
+def zasilka_manifest(zasilka_id):
+    """Tisknutelný manifest zásilky – seznam kusů a příjem zásilky zpět."""
+    zasilka = Zasilka.query.get_or_404(zasilka_id)
+    if not current_user.can_access_pobocka(zasilka.pobocka_id):
+        flash('Nemáte přístup k této pobočce!', 'danger')
+        return redirect(url_for('index'))
+    pobocka = Pobocka.query.get_or_404(zasilka.pobocka_id)
+    return render_template('zasilka_manifest.html', zasilka=zasilka, pobocka=pobocka,
+                           polozky=_zasilka_polozky(zasilka_id))
+
+
+@app.route('/reklamace/zasilka/<int:zasilka_id>/prijmout', methods=['POST'])
+@login_required
+def zasilka_receive(zasilka_id):
+    """Příjem zásilky z Ústí – výsledek pro všechny kusy najednou (u jednotlivých lze změnit).
+
+    Na každý použitý výsledek jeden UPDATE a jeden hromadný INSERT logu, vše v jedné transakci.
+    Mění se jen kusy, které jsou pořád ve stavu Posláno do Ústí.
+    """
+    zasilka = Zasilka.query.get_or_404(zasilka_id)
+    pobocka_id = zasilka.pobocka_id
+    if not current_user.can_access_pobocka(pobocka_id):
+        flash('Nemáte přístup k této pobočce!', 'danger')
+        return redirect(url_for('index'))
+    if zasilka.stav == 'přijato':
+        flash('Zásilka už byla přijata.', 'info')
+        return redirect(url_for('zasilka_manifest', zasilka_id=zasilka_id))
+    vysledky = {action: stav for action, stav in REKLAMACE_AKCE.items() if action != 'poslano_usti'}
+    vychozi = vysledky.get(request.form.get('action', ''))
+    if not vychozi:
+        flash('Neplatný výsledek reklamace.', 'danger')
+        return redirect(url_for('zasilka_manifest', zasilka_id=zasilka_id))
+
+    r = Reklamace.__table__
+    ids = db.session.execute(
+        db.select(r.c.id).join(ZasilkaPolozka.__table__, ZasilkaPolozka.reklamace_id == r.c.id)
+        .where(ZasilkaPolozka.zasilka_id == zasilka_id, r.c.stav == 'Posláno do Ústí')).scalars().all()
+    podle_stavu = {}
+    for reklamace_id in ids:
+        stav = vysledky.get(request.form.get(f'stav_{reklamace_id}', ''), vychozi)
+        podle_stavu.setdefault(stav, []).append(reklamace_id)
+    try:
+        for stav, stav_ids in podle_stavu.items():
+            db.session.execute(db.update(r).where(r.c.id.in_(stav_ids)).values(stav=stav))
+            log_reklamace_actions(stav_ids, pobocka_id, f'Změněn stav reklamace na {stav} (příjem zásilky #{zasilka_id})')
+        zasilka.stav = 'přijato'
+        zasilka.prijato_at = get_current_time()
+        zasilka.prijal = current_user.username or current_user.jmeno
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f'Chyba při příjmu zásilky {zasilka_id}: {str(e)}')
+        flash(f'Chyba při příjmu zásilky: {str(e)}', 'danger')
+        return redirect(url_for('zasilka_manifest', zasilka_id=zasilka_id))
+    flash(f'Zásilka #{zasilka_id} přijata – změněno {len(ids)} reklamací.', 'success')
+    return redirect(url_for('zasilka_manifest', zasilka_id=zasilka_id))
+
+
 @app.route('/reklamace/<int:reklamace_id>/print')
 @login_required
 def reklamace_print(reklamace_id):
     """Tisk reklamace - vyžaduje přihlášení a oprávnění k pobočce."""
-    reklamace = Reklamace.query.get_or_404(reklamace_id)
+    reklamace = db.session.query(ReklamaceVse).filter(ReklamaceVse.id == reklamace_id).first_or_404()
     pobocka = Pobocka.query.get_or_404(reklamace.pobocka_id)
     
     # Ověření oprávnění k pobočce
@@ -1154,7 +1632,11 @@ def admin_export_excel():
         flash('Nemáte oprávnění!', 'danger')
         return redirect(url_for('index'))
     
-    if not HAS_EXCEL:
+    try:
+        # openpyxl je těžký import – načítá se až při exportu, ne při startu workeru
+        from openpyxl import Workbook
+        from openpyxl.styles import Font, PatternFill, Alignment
+    except ImportError:
         flash('Excel export není dostupný. Nainstalujte openpyxl: pip install openpyxl', 'warning')
         return redirect(url_for('admin_dashboard'))
     
@@ -1174,13 +1656,15 @@ def admin_export_excel():
             cell.font = header_font
             cell.alignment = Alignment(horizontal="center")
         
-        pobocky_dict = {p.id: p.nazev for p in Pobocka.query.all()}
-        odbery = Odber.query.order_by(Odber.datum.desc()).all()
+        # Řádky místo ORM objektů, název pobočky ze stejného dotazu
+        odbery = (db.session.query(Odber.id, Pobocka.nazev.label('pobocka_nazev'), Odber.jmeno, Odber.telefon,
+                                   Odber.datum, Odber.stav, Odber.castka, Odber.kdo_zadal, Odber.poznamky)
+                  .outerjoin(Pobocka, Odber.pobocka_id == Pobocka.id)
+                  .order_by(Odber.datum.desc()).all())
         for odber in odbery:
-            pobocka_nazev = pobocky_dict.get(odber.pobocka_id, "N/A")
             row = ws_odbery.append([
                 odber.id,
-                pobocka_nazev,
+                odber.pobocka_nazev or "N/A",
                 odber.jmeno or '',
                 odber.telefon or '',
                 odber.datum.strftime('%d.%m.%Y') if odber.datum else '',
@@ -1203,12 +1687,19 @@ def admin_export_excel():
             cell.font = header_font
             cell.alignment = Alignment(horizontal="center")
         
-        reklamace = Reklamace.query.order_by(Reklamace.datum_prijmu.desc()).all()
+        rv = reklamace_vse('id', 'pobocka_id', 'zakaznik', 'telefon', 'znacka', 'model', 'barva', 'datum_prijmu',
+                           'datum_zakoupeni', 'stav', 'cena', 'zavolano_zakaznikovi', 'prijal', 'archived', 'poznamky').c
+        reklamace = (db.session.query(rv.id, Pobocka.nazev.label('pobocka_nazev'), rv.zakaznik,
+                                      rv.telefon, rv.znacka, rv.model, rv.barva,
+                                      rv.datum_prijmu, rv.datum_zakoupeni, rv.stav,
+                                      rv.cena, rv.zavolano_zakaznikovi, rv.prijal,
+                                      rv.archived, rv.poznamky)
+                     .outerjoin(Pobocka, rv.pobocka_id == Pobocka.id)
+                     .order_by(rv.datum_prijmu.desc()).all())
         for rekl in reklamace:
-            pobocka_nazev = pobocky_dict.get(rekl.pobocka_id, "N/A")
             row = ws_reklamace.append([
                 rekl.id,
-                pobocka_nazev,
+                rekl.pobocka_nazev or "N/A",
                 rekl.zakaznik or '',
                 rekl.telefon or '',
                 rekl.znacka or '',
@@ -1269,7 +1760,8 @@ def admin_export_all():
     output = io.BytesIO()
     # Přidáme UTF-8 BOM pro správné zobrazení diakritiky v Excel
     output.write('\ufeff'.encode('utf-8'))
-    writer = csv.writer(io.TextIOWrapper(output, encoding='utf-8', newline=''))
+    text_output = io.TextIOWrapper(output, encoding='utf-8', newline='')
+    writer = csv.writer(text_output)
     
     # Export všech reklamací
     writer.writerow(['=== REKLAMACE ==='])
@@ -1277,10 +1769,18 @@ def admin_export_all():
         'ID', 'Pobočka', 'Zákazník', 'Telefon', 'Značka', 'Model', 'Barva', 'Datum přijmu', 'Datum zakoupení',
         'Popis závady', 'Stav', 'Řešení', 'Cena', 'Poznámky', 'Vytvořeno'
     ])
-    pobocky_dict = {p.id: p.nazev for p in Pobocka.query.all()}
-    for r in Reklamace.query.order_by(Reklamace.datum_prijmu.desc()).all():
+    rv = reklamace_vse('id', 'pobocka_id', 'zakaznik', 'telefon', 'znacka', 'model', 'barva', 'datum_prijmu',
+                       'datum_zakoupeni', 'popis_zavady', 'stav', 'reseni', 'cena', 'poznamky', 'created_at').c
+    reklamace_rows = (db.session.query(rv.id, Pobocka.nazev.label('pobocka_nazev'), rv.zakaznik,
+                                       rv.telefon, rv.znacka, rv.model, rv.barva,
+                                       rv.datum_prijmu, rv.datum_zakoupeni, rv.popis_zavady,
+                                       rv.stav, rv.reseni, rv.cena, rv.poznamky,
+                                       rv.created_at)
+                      .outerjoin(Pobocka, rv.pobocka_id == Pobocka.id)
+                      .order_by(rv.datum_prijmu.desc()))
+    for r in reklamace_rows:
         writer.writerow([
-            r.id, pobocky_dict.get(r.pobocka_id, 'Neznámá'), r.zakaznik, r.telefon or '',
+            r.id, r.pobocka_nazev or 'Neznámá', r.zakaznik, r.telefon or '',
             r.znacka, r.model or '', r.barva or '', 
             r.datum_prijmu.strftime('%d.%m.%Y') if r.datum_prijmu else '',
             r.datum_zakoupeni.strftime('%d.%m.%Y') if r.datum_zakoupeni else '',
@@ -1293,13 +1793,17 @@ def admin_export_all():
     writer.writerow([
         'ID', 'Pobočka', 'Zadavatel', 'Datum', 'Stav', 'Poznámky'
     ])
-    for o in Odber.query.order_by(Odber.datum.desc()).all():
+    odber_rows = (db.session.query(Odber.id, Pobocka.nazev.label('pobocka_nazev'), Odber.kdo_zadal, Odber.datum,
+                                   Odber.stav, Odber.poznamky)
+                  .outerjoin(Pobocka, Odber.pobocka_id == Pobocka.id)
+                  .order_by(Odber.datum.desc()))
+    for o in odber_rows:
         writer.writerow([
-            o.id, pobocky_dict.get(o.pobocka_id, 'Neznámá'), o.kdo_zadal or '',
+            o.id, o.pobocka_nazev or 'Neznámá', o.kdo_zadal or '',
             o.datum.strftime('%d.%m.%Y') if o.datum else '', o.stav, o.poznamky or ''
         ])
     
-    output.seek(0)
+    text_output.flush()  # TextIOWrapper drží zápis v bufferu – bez flush by export obsahoval jen BOM
     return Response(
         output.getvalue(),
         mimetype='text/csv; charset=utf-8',
@@ -1320,29 +1824,42 @@ def admin_reklamace_archiv():
     stav = request.args.get('stav', '').strip()
     archived_only = request.args.get('archived', '').strip().lower() in ('1', 'true', 'ano', 'yes')
     
-    reklamace_query = Reklamace.query
+    # Horká i studená tabulka jedním dotazem – řádky jen se sloupci, které šablona vypisuje,
+    # název pobočky přes JOIN ve stejném dotazu
+    rv = reklamace_vse('id', 'pobocka_id', 'zakaznik', 'telefon', 'znacka', 'model', 'barva', 'datum_prijmu',
+                       'stav', 'archived', 'archived_at').c
+    reklamace_query = (db.session.query(*rv, Pobocka.nazev.label('pobocka_nazev'))
+                       .outerjoin(Pobocka, rv.pobocka_id == Pobocka.id))
     if pobocka_id:
         try:
-            reklamace_query = reklamace_query.filter(Reklamace.pobocka_id == int(pobocka_id))
+            reklamace_query = reklamace_query.filter(rv.pobocka_id == int(pobocka_id))
         except ValueError:
             pass
     if stav:
-        reklamace_query = reklamace_query.filter(Reklamace.stav == stav)
+        reklamace_query = reklamace_query.filter(rv.stav == stav)
     if archived_only:
-        reklamace_query = reklamace_query.filter(Reklamace.archived == True)
+        reklamace_query = reklamace_query.filter(rv.archived == True)
     if q:
         like = f"%{q}%"
         reklamace_query = reklamace_query.filter(
             db.or_(
-                Reklamace.zakaznik.ilike(like),
-                Reklamace.telefon.ilike(like),
-                Reklamace.znacka.ilike(like),
-                Reklamace.model.ilike(like),
-                Reklamace.barva.ilike(like),
+                rv.zakaznik.ilike(like),
+                rv.telefon.ilike(like),
+                rv.znacka.ilike(like),
+                rv.model.ilike(like),
+                rv.barva.ilike(like),
             )
         )
     
-    reklamace_list = reklamace_query.order_by(Reklamace.datum_prijmu.desc(), Reklamace.id.desc()).limit(500).all()
+    try:
+        reklamace_list = reklamace_query.order_by(rv.datum_prijmu.desc(), rv.id.desc()).limit(500).all()
+    except OperationalError as e:
+        if not is_query_budget_exceeded(e):
+            raise
+        db.session.rollback()
+        app.logger.warning(f'Archiv reklamací: překročen rozpočet dotazů (q={q!r}, pobočka={pobocka_id!r}, stav={stav!r})')
+        flash(BUDGET_MESSAGE, 'warning')
+        reklamace_list = []
     pobocky = Pobocka.query.order_by(Pobocka.nazev).all()
     
     return render_template(
@@ -1356,15 +1873,241 @@ def admin_reklamace_archiv():
     )
 
 
+@app.route('/admin/historie')
+@login_required
+def admin_historie():
+    """Admin: vyhledávání v historii akcí – živé tabulky logu, na požádání i starší komprimované segmenty."""
+    if not (current_user.is_authenticated and current_user.is_admin()):
+        flash('Nemáte oprávnění!', 'danger')
+        return redirect(url_for('index'))
+
+    q = request.args.get('q', '').strip()
+    pobocka_id = request.args.get('pobocka', '').strip()
+    typ = request.args.get('typ', '').strip()
+    date_from = request.args.get('date_from', '').strip()
+    date_to = request.args.get('date_to', '').strip()
+    starsi = request.args.get('starsi', '').strip().lower() in ('1', 'true', 'ano', 'yes')
+    limit = 500
+
+    od = do = None
+    try:
+        od = datetime.strptime(date_from, "%Y-%m-%d") if date_from else None
+    except ValueError:
+        pass
+    try:
+        do = datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1) if date_to else None
+    except ValueError:
+        pass
+    pobocky_filtr = []
+    if pobocka_id:
+        try:
+            pobocky_filtr = [int(pobocka_id)]
+        except ValueError:
+            pass
+
+    # Živé tabulky: Akce a log reklamací (horký i studený archiv) – stejné filtry jako segmenty
+    sources = []
+    if typ in ('', 'akce'):
+        sources.append(('akce', Akce.__table__.c))
+    if typ in ('', 'reklamace'):
+        sources.append(('reklamace_log', reklamace_log_vse.c))
+    historie = []
+    try:
+        for stream, cols in sources:
+            query = db.session.query(cols.datum, cols.pobocka_id, cols.uzivatel, cols.akce)
+            if pobocky_filtr:
+                query = query.filter(cols.pobocka_id.in_(pobocky_filtr))
+            if od:
+                query = query.filter(cols.datum >= od)
+            if do:
+                query = query.filter(cols.datum < do)
+            if q:
+                like = f"%{q}%"
+                query = query.filter(db.or_(cols.uzivatel.ilike(like), cols.akce.ilike(like)))
+            historie.extend((stream, row._asdict(), False) for row in query.order_by(cols.datum.desc()).limit(limit))
+    except OperationalError as e:
+        if not is_query_budget_exceeded(e):
+            raise
+        db.session.rollback()
+        app.logger.warning(f'Historie: překročen rozpočet dotazů (q={q!r}, pobočka={pobocka_id!r})')
+        flash(BUDGET_MESSAGE, 'warning')
+    if starsi:
+        streams = [stream for stream, _cols in sources]
+        for stream, record in log_segments.search(streams, pobocky_filtr, od, do, q, limit):
+            historie.append((stream, record, True))
+    historie.sort(key=lambda item: item[1]['datum'], reverse=True)
+
+    pobocky = Pobocka.query.order_by(Pobocka.nazev).all()
+    pobocky_dict = {p.id: p.nazev for p in pobocky}
+    zaznamy = [{
+        'datum': record['datum'],
+        'pobocka': pobocky_dict.get(record['pobocka_id'], 'Není známo'),
+        'uzivatel': record['uzivatel'],
+        'akce': record['akce'],
+        'typ': 'Reklamace' if stream == 'reklamace_log' else 'Odběr / admin',
+        'archiv': archiv,
+    } for stream, record, archiv in historie[:limit]]
+    segmenty = log_segments.load_index()
+
+    return render_template(
+        'admin_historie.html',
+        historie=zaznamy,
+        pobocky=pobocky,
+        segmenty={stream: sorted(months) for stream, months in segmenty.items()},
+        retence_dni=app.config['LOG_RETENTION_DAYS'],
+        filter_q=q,
+        filter_pobocka=pobocka_id,
+        filter_typ=typ,
+        filter_date_from=date_from,
+        filter_date_to=date_to,
+        filter_starsi=starsi,
+    )
+
+
+# Hromadný import (importer.py) – pravidla sloupců z formulářů, přes které řádky jinak vznikají
+ODBER_IMPORT_STAVY = ['aktivní', 'vydáno', 'nevyzvednuto', 'smazano']
+ZARUKA_VYPRSELA = 'Záruka 2 roky již vypršela – nelze přijmout reklamaci.'
+
+
+def _import_telefon(values):
+    return f"+420{values['telefon']}"
+
+
+def _import_odber(values, ctx):
+    return {
+        'pobocka_id': ctx['pobocka_id'],
+        'jmeno': values['jmeno'],
+        'kdo_zadal': values['kdo_zadal'] or ctx['uzivatel'],
+        'telefon': _import_telefon(values),
+        'placeno_predem': values['placeno_predem'],
+        'datum': values['datum'],
+        'castka': values['castka'],
+        'poznamky': values['poznamky'],
+        'stav': values['stav'] or 'aktivní',
+    }
+
+
+def _import_reklamace(values, ctx):
+    stav = values['stav'] or 'Čeká'
+    return {
+        'pobocka_id': ctx['pobocka_id'],
+        'zakaznik': values['zakaznik'],
+        'telefon': _import_telefon(values),
+        'znacka': values['znacka'],
+        'model': values['model'],
+        'barva': values['barva'],
+        'datum_prijmu': values['datum_prijmu'],
+        'datum_zakoupeni': values['datum_zakoupeni'],
+        'popis_zavady': values['popis_zavady'],
+        'stav': stav,
+        'sleva_procent': values['sleva_procent'] if stav == 'Zamítnuto' else None,
+        'reseni': values['reseni'],
+        'cena': values['cena'],
+        'poznamky': values['poznamky'],
+        'zavolano_zakaznikovi': values['zavolano_zakaznikovi'],
+        'prijal': ctx['uzivatel'],
+        'archived': False,
+        'created_at': ctx['now'],
+    }
+
+
+def _import_zaruka(values):
+    """Historická reklamace: záruka se posuzuje ke dni přijetí, ne ke dni importu."""
+    if zaruka_do(values['datum_zakoupeni']) < values['datum_prijmu']:
+        return ZARUKA_VYPRSELA
+    return None
+
+
+IMPORT_SPECS = {
+    'odbery': ImportSpec(
+        Odber.__table__,
+        form_rules(PridatOdberForm, exclude=('kdo_zadal',)) + [
+            FieldRule('kdo_zadal', 'Zadal', max_len=100),
+            FieldRule('stav', 'Stav', choices=ODBER_IMPORT_STAVY),
+        ],
+        _import_odber, Akce.__table__, 'odber_id',
+        lambda values: f"Importován odběr: {values['jmeno']}"[:100]),
+    'reklamace': ImportSpec(
+        Reklamace.__table__,
+        form_rules(ReklamaceForm, required=('datum_zakoupeni',), optional=('stav',)),
+        _import_reklamace, ReklamaceLog.__table__, 'reklamace_id',
+        lambda values: f"Importována reklamace (stav: {values['stav'] or 'Čeká'})",
+        check=_import_zaruka),
+}
+IMPORT_NAZVY = {'odbery': 'Odběry', 'reklamace': 'Reklamace'}
+
+
+@app.route('/admin/import', methods=['GET', 'POST'])
+@login_required
+def admin_import():
+    """Admin: hromadný import odběrů / reklamací z CSV nebo XLSX s přehledem chyb po řádcích."""
+    if not (current_user.is_authenticated and current_user.is_admin()):
+        flash('Nemáte oprávnění!', 'danger')
+        return redirect(url_for('index'))
+
+    pobocky = Pobocka.query.order_by(Pobocka.nazev).all()
+    result = None
+    kind = request.form.get('kind', 'odbery')
+    pobocka_id = request.form.get('pobocka', type=int)
+    dry_run = bool(request.form.get('dry_run'))
+    if request.method == 'POST':
+        upload = request.files.get('soubor')
+        if kind not in IMPORT_SPECS or pobocka_id not in {p.id for p in pobocky}:
+            flash('Vyberte typ importu a pobočku.', 'warning')
+        elif not upload or not upload.filename:
+            flash('Vyberte soubor CSV nebo XLSX.', 'warning')
+        else:
+            uzivatel = current_user.jmeno or current_user.username
+            # Dávky jdou přes vlastní spojení a transakce – transakci session requestu uzavřeme
+            db.session.commit()
+            try:
+                result = run_import(db.engine, IMPORT_SPECS[kind], read_rows(upload.stream, upload.filename),
+                                    pobocka_id, uzivatel, get_current_time(),
+                                    app.config['IMPORT_BATCH_SIZE'], dry_run)
+            except RowError as e:
+                flash(str(e), 'danger')
+            except OperationalError as e:
+                if not is_query_budget_exceeded(e):
+                    raise
+                flash(f'{BUDGET_MESSAGE} Dávky zapsané před přerušením zůstaly v databázi – velké soubory '
+                      'importujte příkazem flask import-data.', 'warning')
+            else:
+                app.logger.info(f"Import {kind} do pobočky {pobocka_id} ({uzivatel}): {result['imported']}/"
+                                f"{result['rows']} řádků, {result['error_count']} chyb, {result['ms']} ms")
+                if dry_run:
+                    flash(f"Kontrola: {result['imported']} z {result['rows']} řádků je v pořádku.", 'info')
+                elif result['imported']:
+                    flash(f"Importováno {result['imported']} z {result['rows']} řádků.", 'success')
+
+    return render_template(
+        'admin_import.html',
+        pobocky=pobocky,
+        druhy=IMPORT_NAZVY,
+        sloupce={k: spec.rules for k, spec in IMPORT_SPECS.items()},
+        result=result,
+        kind=kind,
+        pobocka_id=pobocka_id,
+        dry_run=dry_run,
+    )
+
+
 @app.route('/reklamace/branch/<int:pobocka_id>/export.csv')
 def reklamace_export_csv(pobocka_id):
     pobocka = Pobocka.query.get_or_404(pobocka_id)
-    reklamace_qs = Reklamace.query.filter_by(pobocka_id=pobocka_id).order_by(Reklamace.datum_prijmu.desc(), Reklamace.id.desc()).all()
+    rv = reklamace_vse('id', 'pobocka_id', 'datum_prijmu', 'datum_zakoupeni', 'zakaznik', 'telefon', 'znacka', 'model',
+                       'barva', 'stav', 'cena', 'popis_zavady', 'reseni', 'poznamky', 'created_at').c
+    reklamace_qs = (db.session.query(rv.id, rv.datum_prijmu, rv.datum_zakoupeni, rv.zakaznik,
+                                     rv.telefon, rv.znacka, rv.model, rv.barva,
+                                     rv.stav, rv.cena, rv.popis_zavady, rv.reseni,
+                                     rv.poznamky, rv.created_at)
+                    .filter(rv.pobocka_id == pobocka_id)
+                    .order_by(rv.datum_prijmu.desc(), rv.id.desc()).all())
 
     output = io.BytesIO()
     # Přidáme UTF-8 BOM pro správné zobrazení diakritiky v Excel
     output.write('\ufeff'.encode('utf-8'))
-    writer = csv.writer(io.TextIOWrapper(output, encoding='utf-8', newline=''))
+    text_output = io.TextIOWrapper(output, encoding='utf-8', newline='')
+    writer = csv.writer(text_output)
     writer.writerow(
         [
             'ID',
@@ -1405,6 +2148,7 @@ def reklamace_export_csv(pobocka_id):
             ]
         )
 
+    text_output.flush()
     filename = f"reklamace_{pobocka.nazev}_{date.today().strftime('%Y%m%d')}.csv".replace(' ', '_')
     return Response(
         output.getvalue(),
@@ -1412,46 +2156,125 @@ def reklamace_export_csv(pobocka_id):
         headers={'Content-Disposition': f'attachment; filename="{filename}"'},
     )
 
+def _wants_json():
+    """AJAX z přehledů (Accept: application/json) chce JSON místo redirectu na celou stránku."""
+    return request.accept_mimetypes.best == 'application/json'
+
+
+def _prehled_delta(odbery):
+    """Změna počitadel přehledu pobočky, když odběry (stav, datum) přestanou být aktivní."""
+    dnes = date.today()
+    delta = {'celkem': 0, 'zelene': 0, 'cervene': 0}
+    for stav, datum in odbery:
+        if stav != 'aktivní':
+            continue
+        delta['celkem'] -= 1
+        delta['zelene' if (dnes - datum).days <= 7 else 'cervene'] -= 1
+    return delta
+
+
+# Akce z tlačítek u odběru → nový stav (update() i hromadná změna)
+ODBER_AKCE = {'vydano': 'vydáno', 'nevyzvednuto': 'nevyzvednuto', 'smazat': 'smazano'}
+BULK_MAX_IDS = 500
+
+
 @app.route('/update/<int:id>', methods=['POST'])
 @login_required
 def update(id):
-    """Aktualizace stavu odběru - vyžaduje přihlášení a oprávnění k pobočce."""
+    """Aktualizace stavu odběru - vyžaduje přihlášení a oprávnění k pobočce.
+
+    AJAX z přehledu pobočky (Accept: application/json) dostane místo redirectu
+    JSON se změnou počitadel – řádek z tabulky odstraní JS.
+    """
+    odber = Odber.query.get_or_404(id)
+    as_json = _wants_json()
+
+    # Ověření oprávnění k pobočce
+    if not current_user.can_access_pobocka(odber.pobocka_id):
+        if as_json:
+            return jsonify({'status': 'error', 'message': 'Nemáte přístup k této pobočce!'}), 403
+        flash('Nemáte přístup k této pobočce!', 'danger')
+        return redirect(url_for('index'))
+
+    pobocka_id = odber.pobocka_id
+    akce = request.form.get('action')
+    if akce not in ODBER_AKCE:
+        if as_json:
+            return jsonify({'status': 'error', 'message': 'Neplatná akce!'}), 400
+        flash('Neplatná akce!', 'danger')
+        return redirect(url_for('branch', pobocka_id=pobocka_id))
+
     try:
-        odber = Odber.query.get_or_404(id)
-        
-        # Ověření oprávnění k pobočce
-        if not current_user.can_access_pobocka(odber.pobocka_id):
-            flash('Nemáte přístup k této pobočce!', 'danger')
-            return redirect(url_for('index'))
-        
-        akce = request.form.get('action')
-        if akce not in ['vydano', 'nevyzvednuto', 'smazat']:
-            flash('Neplatná akce!', 'danger')
-            return redirect(url_for('branch', pobocka_id=odber.pobocka_id))
-        
-        if akce == 'vydano':
-            odber.stav = 'vydáno'
-        elif akce == 'nevyzvednuto':
-            odber.stav = 'nevyzvednuto'
-        elif akce == 'smazat':
-            odber.stav = 'smazano'
+        prehled = _prehled_delta([(odber.stav, odber.datum)])
+        novy_stav = odber.stav = ODBER_AKCE[akce]
         
         akce_log = Akce(
             odber_id=id,
             uzivatel=current_user.username or current_user.jmeno or 'unknown',
-            akce=f'Stav změněn na {odber.stav}',
+            akce=f'Stav změněn na {novy_stav}',
             datum=get_current_time(),
-            pobocka_id=odber.pobocka_id
+            pobocka_id=pobocka_id
         )
         db.session.add(akce_log)
         db.session.commit()
+        if as_json:
+            return jsonify({'status': 'success', 'id': id, 'stav': novy_stav, 'prehled': prehled})
         flash('Stav aktualizován!', 'success')
     except Exception as e:
         db.session.rollback()
         app.logger.error(f'Chyba při aktualizaci stavu odběru {id}: {str(e)}')
+        if as_json:
+            return jsonify({'status': 'error', 'message': f'Chyba při aktualizaci: {str(e)}'}), 500
         flash(f'Chyba při aktualizaci: {str(e)}', 'danger')
     
-    return redirect(url_for('branch', pobocka_id=odber.pobocka_id))
+    return redirect(url_for('branch', pobocka_id=pobocka_id))
+
+@app.route('/branch/<int:pobocka_id>/update_bulk', methods=['POST'])
+@login_required
+def update_bulk(pobocka_id):
+    """Hromadná změna stavu odběrů jedné pobočky (výdej u pultu) – JSON, jedna transakce.
+
+    Oprávnění se ověří jednou pro pobočku; odběry jiných poboček se nezmění
+    a vrátí se v 'missing' spolu s neexistujícími id.
+    """
+    if not current_user.can_access_pobocka(pobocka_id):
+        return jsonify({'status': 'error', 'message': 'Nemáte přístup k této pobočce!'}), 403
+    data = request.get_json(silent=True) or {}
+    akce = data.get('action')
+    if akce not in ODBER_AKCE:
+        return jsonify({'status': 'error', 'message': 'Neplatná akce!'}), 400
+    try:
+        ids = sorted({int(i) for i in data.get('ids') or []})
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Neplatná id odběrů'}), 400
+    if not ids:
+        return jsonify({'status': 'error', 'message': 'Nevybrali jste žádný odběr'}), 400
+    if len(ids) > BULK_MAX_IDS:
+        return jsonify({'status': 'error', 'message': f'Najednou lze změnit nejvýš {BULK_MAX_IDS} odběrů'}), 400
+
+    stav = ODBER_AKCE[akce]
+    o = Odber.__table__
+    try:
+        rows = db.session.execute(
+            db.select(o.c.id, o.c.stav, o.c.datum).where(o.c.id.in_(ids), o.c.pobocka_id == pobocka_id)
+            .order_by(o.c.id)).all()
+        found = [row.id for row in rows]
+        prehled = _prehled_delta([(row.stav, row.datum) for row in rows])
+        if found:
+            now = get_current_time()
+            uzivatel = current_user.username or current_user.jmeno or 'unknown'
+            db.session.execute(db.update(o).where(o.c.id.in_(found)).values(stav=stav))
+            db.session.execute(db.insert(Akce.__table__), [
+                {'odber_id': odber_id, 'uzivatel': uzivatel, 'akce': f'Stav změněn na {stav}',
+                 'datum': now, 'pobocka_id': pobocka_id} for odber_id in found])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f'Chyba při hromadné změně stavu odběrů na pobočce {pobocka_id}: {str(e)}')
+        return jsonify({'status': 'error', 'message': f'Chyba při aktualizaci: {str(e)}'}), 500
+    return jsonify({'status': 'success', 'stav': stav, 'updated': found,
+                    'missing': sorted(set(ids) - set(found)), 'prehled': prehled})
+
 
 @app.route('/update_notes/<int:id>', methods=['POST'])
 @login_required
@@ -1531,12 +2354,14 @@ def admin_login():
         username_val = (form.username.data or '').strip()
         password_val = (form.password.data or '').strip()
 
+        # Přihlášený uživatel zůstává current_user do konce requestu – pobočky načteme rovnou
+        user_query = User.query.options(selectinload(User.pobocky), joinedload(User.pobocka))
         if pin_val:
-            user = User.query.filter_by(pin=pin_val).first()
+            user = user_query.filter_by(pin=pin_val).first()
             if not user:
                 flash('Neplatný PIN.', 'danger')
         elif username_val and password_val:
-            user = User.query.filter_by(username=username_val).first()
+            user = user_query.filter_by(username=username_val).first()
             if not user or not user.check_password(password_val):
                 flash('Neplatné uživatelské jméno nebo heslo.', 'danger')
                 user = None
@@ -1585,7 +2410,9 @@ def admin_dashboard():
         user_form.pobocky.choices = [(str(p.id), p.nazev) for p in all_pobocky]
     except Exception as e:
         app.logger.error(f'Chyba při načítání poboček pro formulář: {str(e)}')
+        all_pobocky = []
         user_form.pobocky.choices = []
+    pobocky_by_id = {p.id: p for p in all_pobocky}
     
     # Přidání uživatele
     if user_form.validate_on_submit() and 'jmeno' in request.form and (current_user.is_authenticated and current_user.is_admin()):
@@ -1626,13 +2453,13 @@ def admin_dashboard():
                         if p_id:
                             try:
                                 pob_id = int(p_id)
-                                if Pobocka.query.get(pob_id):
+                                if pob_id in pobocky_by_id:
                                     pobocky_ids.append(pob_id)
                             except (ValueError, TypeError):
                                 continue
                     
                     if pobocky_ids:
-                        pobocky_objects = Pobocka.query.filter(Pobocka.id.in_(pobocky_ids)).all()
+                        pobocky_objects = [pobocky_by_id[pob_id] for pob_id in pobocky_ids]
                         user.pobocky = pobocky_objects
                         if pobocky_objects:
                             user.pobocka_id = pobocky_objects[0].id
@@ -1682,48 +2509,54 @@ def admin_dashboard():
     
     # Filtrování podle pobočky uživatele
     try:
-        user_pobocky = get_user_pobocky()
-        pobocky_ids = [p.id for p in user_pobocky] if user_pobocky else []
+        dostupne_pobocky = get_user_pobocky()
+        pobocky_ids = [p.id for p in dostupne_pobocky] if dostupne_pobocky else []
         
         if current_user.is_authenticated and current_user.is_admin():
-            pobocky = Pobocka.query.all()
+            pobocky = all_pobocky
         else:
-            pobocky = user_pobocky if user_pobocky else []
-        users = User.query.all() if (current_user.is_authenticated and current_user.is_admin()) else []
+            pobocky = dostupne_pobocky if dostupne_pobocky else []
+        users = (User.query.options(selectinload(User.pobocky), joinedload(User.pobocka)).all()
+                 if (current_user.is_authenticated and current_user.is_admin()) else [])
+        # Počet uživatelů na pobočku jedním dotazem (místo líného Pobocka.users v šabloně)
+        pocty_uzivatelu = dict(
+            db.session.query(user_pobocky.c.pobocka_id, db.func.count(user_pobocky.c.user_id))
+            .group_by(user_pobocky.c.pobocka_id).all()
+        )
+        
+        # Přehled odběrů podle roku – jeden seskupený dotaz pro všechny pobočky (dříve 8 dotazů na pobočku)
+        odbery_by_p = {p.id: {} for p in pobocky}
+        tyden_zpet = date.today() - timedelta(days=7)
+        odbery_rows = (db.session.query(
+                Odber.pobocka_id, Odber.stav, db.func.count(Odber.id), db.func.sum(Odber.castka),
+                db.func.sum(db.case((Odber.datum >= tyden_zpet, 1), else_=0)))
+            .filter(Odber.pobocka_id.in_(list(odbery_by_p)), _db_year_eq(Odber.datum, selected_year))
+            .group_by(Odber.pobocka_id, Odber.stav)
+            .all())
+        for pid, stav, cnt, castka, cerstve in odbery_rows:
+            odbery_by_p[pid][stav] = (cnt, castka or 0, cerstve or 0)
         
-        # Přehled odběrů podle roku
         prehled = []
         for pobocka in pobocky:
-            # Filtrování podle roku
-            odbery_rok = Odber.query.filter_by(pobocka_id=pobocka.id).filter(
-                _db_year_eq(Odber.datum, selected_year)
-            )
-            
-            aktivni_odbery = odbery_rok.filter_by(stav='aktivní').all()
-            zelene = sum(1 for odber in aktivni_odbery if (date.today() - odber.datum).days <= 7)
-            cervene = sum(1 for odber in aktivni_odbery if (date.today() - odber.datum).days > 7)
-            
+            stavy = odbery_by_p[pobocka.id]
+            aktivni, _, zelene = stavy.get('aktivní', (0, 0, 0))
             prehled.append({
                 'nazev': pobocka.nazev,
-                'aktivni': odbery_rok.filter_by(stav='aktivní').count(),
-                'vydano': odbery_rok.filter_by(stav='vydáno').count(),
-                'nevyzvednuto': odbery_rok.filter_by(stav='nevyzvednuto').count(),
-                'smazano': odbery_rok.filter_by(stav='smazano').count(),
-                'castka_vydano': sum(odber.castka or 0 for odber in odbery_rok.filter_by(stav='vydáno').all()),
+                'aktivni': aktivni,
+                'vydano': stavy.get('vydáno', (0,))[0],
+                'nevyzvednuto': stavy.get('nevyzvednuto', (0,))[0],
+                'smazano': stavy.get('smazano', (0,))[0],
+                'castka_vydano': stavy.get('vydáno', (0, 0))[1],
                 'zelene': zelene,
-                'cervene': cervene,
-                'celkem_rok': odbery_rok.count()
+                'cervene': aktivni - zelene,
+                'celkem_rok': sum(v[0] for v in stavy.values())
             })
-            
-            # Reklamace podle roku
-            reklamace_rok = Reklamace.query.filter_by(pobocka_id=pobocka.id).filter(
-                _db_year_eq(Reklamace.datum_prijmu, selected_year)
-            )
     except Exception as e:
         app.logger.error(f'Chyba v admin dashboard při načítání dat: {str(e)}')
         pobocky = []
         pobocky_ids = []
         users = []
+        pocty_uzivatelu = {}
         prehled = []
 
     pobocky_dict = {p.id: p.nazev for p in pobocky} if pobocky else {}
@@ -1742,12 +2575,13 @@ def admin_dashboard():
             'typ': 'Odběr / admin'
         })
 
-    # Historie reklamací (filtrování podle pobočky)
-    reklamace_query = ReklamaceLog.query
+    # Historie reklamací (filtrování podle pobočky) – i log přesunutý do studeného archivu
+    rlog_cols = reklamace_log_vse.c
+    reklamace_query = db.session.query(rlog_cols.datum, rlog_cols.pobocka_id, rlog_cols.uzivatel, rlog_cols.akce)
     if current_user.is_authenticated and not current_user.is_admin() and pobocky_ids:
-        reklamace_query = reklamace_query.filter(ReklamaceLog.pobocka_id.in_(pobocky_ids))
+        reklamace_query = reklamace_query.filter(rlog_cols.pobocka_id.in_(pobocky_ids))
     reklamace_logs = []
-    for rlog in reklamace_query.order_by(ReklamaceLog.datum.desc()).limit(200).all():
+    for rlog in reklamace_query.order_by(rlog_cols.datum.desc()).limit(200).all():
         reklamace_logs.append({
             'datum': rlog.datum,
             'pobocka': pobocky_dict.get(rlog.pobocka_id, 'Není známo'),
@@ -1779,18 +2613,25 @@ def admin_dashboard():
     }
     
     try:
-        for pobocka in pobocky:
-            # Reklamace podle roku
-            reklamace_rok = Reklamace.query.filter_by(pobocka_id=pobocka.id).filter(
-                _db_year_eq(Reklamace.datum_prijmu, selected_year)
-            )
-            
-            celkem = reklamace_rok.count()
-            ceka = reklamace_rok.filter_by(stav='Čeká').count()
-            vymena = reklamace_rok.filter_by(stav='Výměna kus za kus').count()
-            poslano = reklamace_rok.filter_by(stav='Posláno do Ústí').count()
-            zamitnuto = reklamace_rok.filter_by(stav='Zamítnuto').count()
-            sleva = reklamace_rok.filter_by(stav='Zamítnuto').filter(Reklamace.sleva_procent.isnot(None)).count()
+        # Reklamace podle roku – seskupeně podle pobočky a stavu (count(sleva_procent) = se slevou)
+        reklamace_by_p = {p.id: {} for p in pobocky}
+        # Včetně studeného archivu – přesun do archivu nesmí měnit statistiky
+        rv = reklamace_vse('pobocka_id', 'stav', 'id', 'sleva_procent', 'datum_prijmu').c
+        reklamace_rows = (db.session.query(
+                rv.pobocka_id, rv.stav, db.func.count(rv.id), db.func.count(rv.sleva_procent))
+            .filter(rv.pobocka_id.in_(list(reklamace_by_p)), _db_year_eq(rv.datum_prijmu, selected_year))
+            .group_by(rv.pobocka_id, rv.stav)
+            .all())
+        for pid, stav, cnt, se_slevou in reklamace_rows:
+            reklamace_by_p[pid][stav] = (cnt, se_slevou)
+        
+        for pobocka, radek_odberu in zip(pobocky, prehled):
+            stavy = reklamace_by_p[pobocka.id]
+            celkem = sum(v[0] for v in stavy.values())
+            ceka = stavy.get('Čeká', (0,))[0]
+            vymena = stavy.get('Výměna kus za kus', (0,))[0]
+            poslano = stavy.get('Posláno do Ústí', (0,))[0]
+            zamitnuto, sleva = stavy.get('Zamítnuto', (0, 0))
             vyrizene = vymena + poslano
             reklamace_prehled.append(
                 {
@@ -1813,11 +2654,8 @@ def admin_dashboard():
             celkove_statistiky['sleva_reklamace'] = celkove_statistiky.get('sleva_reklamace', 0) + sleva
             celkove_statistiky['zamitnuto_reklamace'] = celkove_statistiky.get('zamitnuto_reklamace', 0) + zamitnuto
             celkove_statistiky['vyrizene_reklamace'] += vyrizene
-            # Celkové odběry v daném roce (použijeme query z cyklu)
-            odbery_rok_count = Odber.query.filter_by(pobocka_id=pobocka.id).filter(
-                _db_year_eq(Odber.datum, selected_year)
-            ).count()
-            celkove_statistiky['celkem_odberu'] += odbery_rok_count
+            # Celkové odběry v daném roce (z přehledu odběrů výše)
+            celkove_statistiky['celkem_odberu'] += radek_odberu.get('celkem_rok', 0)
     except Exception as e:
         app.logger.error(f'Chyba při načítání reklamací: {str(e)}')
         reklamace_prehled = []
@@ -1830,6 +2668,7 @@ def admin_dashboard():
             users=users,
             all_pobocky=all_pobocky,
             pobocky=pobocky,
+            pocty_uzivatelu=pocty_uzivatelu,
             prehled=prehled,
             akce=historie,
             reklamace_prehled=reklamace_prehled,
@@ -1889,166 +2728,89 @@ def admin_statistiky():
         pobocky_dict = {p.id: p.nazev for p in pobocky}
         app.logger.debug(f'Načteno {len(pobocky)} poboček, rok: {selected_year}, měsíc: {selected_month}, pobočka: {selected_pobocka}')
         
-        # Základní query pro odběry a reklamace (SQLite kompatibilní)
-        # Filtrujeme pouze záznamy s platným datem
-        # Použijeme strftime pro porovnání roku (vrací string, takže porovnáváme se stringem)
-        # Debug: zkontrolujeme, kolik záznamů máme celkem
-        total_odbery = Odber.query.count()
-        total_reklamace = Reklamace.query.count()
-        app.logger.debug(f'Celkem v DB: {total_odbery} odběrů, {total_reklamace} reklamací')
-        
-        odbery_query = Odber.query.filter(
+        # Všechny agregace z jednoho seskupeného dotazu pro odběry a jednoho pro reklamace
+        # (pobočka × měsíc × stav) za vybraný rok – dříve ~15 dotazů na měsíc a pobočku.
+        odbery_query = db.session.query(
+            Odber.pobocka_id, _db_month(Odber.datum), Odber.stav,
+            db.func.count(Odber.id), db.func.sum(Odber.castka)
+        ).filter(
             Odber.datum.isnot(None),
             _db_year_eq(Odber.datum, selected_year)
         )
-        reklamace_query = Reklamace.query.filter(
-            Reklamace.datum_prijmu.isnot(None),
-            _db_year_eq(Reklamace.datum_prijmu, selected_year)
+        rv = reklamace_vse('pobocka_id', 'datum_prijmu', 'stav', 'id', 'cena', 'zavolano_zakaznikovi').c
+        reklamace_query = db.session.query(
+            rv.pobocka_id, _db_month(rv.datum_prijmu), rv.stav,
+            db.func.count(rv.id), db.func.sum(rv.cena),
+            db.func.sum(db.case((rv.zavolano_zakaznikovi == True, 1), else_=0))
+        ).filter(
+            rv.datum_prijmu.isnot(None),
+            _db_year_eq(rv.datum_prijmu, selected_year)
         )
+        if selected_pobocka:
+            odbery_query = odbery_query.filter(Odber.pobocka_id == selected_pobocka)
+            reklamace_query = reklamace_query.filter(rv.pobocka_id == selected_pobocka)
+        odbery_rows = odbery_query.group_by(Odber.pobocka_id, _db_month(Odber.datum), Odber.stav).all()
+        reklamace_rows = reklamace_query.group_by(
+            rv.pobocka_id, _db_month(rv.datum_prijmu), rv.stav).all()
         
-        # Debug: zkontrolujeme, kolik záznamů máme po filtrování
-        odbery_count_after_filter = odbery_query.count()
-        reklamace_count_after_filter = reklamace_query.count()
-        app.logger.debug(f'Po filtrování roku {selected_year}: {odbery_count_after_filter} odběrů, {reklamace_count_after_filter} reklamací')
+        def _odbery_stats():
+            return {'celkem': 0, 'aktivni': 0, 'vydano': 0, 'nevyzvednuto': 0, 'smazano': 0, 'castka': 0}
         
-        if selected_month:
-            odbery_query = odbery_query.filter(_db_month_eq(Odber.datum, selected_month))
-            reklamace_query = reklamace_query.filter(_db_month_eq(Reklamace.datum_prijmu, selected_month))
+        def _reklamace_stats():
+            return {'celkem': 0, 'ceka': 0, 'vymena': 0, 'poslano': 0, 'zamitnuto': 0, 'cena': 0, 'zavolano': 0}
         
-        if selected_pobocka:
-            odbery_query = odbery_query.filter_by(pobocka_id=selected_pobocka)
-            reklamace_query = reklamace_query.filter_by(pobocka_id=selected_pobocka)
+        odbery_stav_klic = {'aktivní': 'aktivni', 'vydáno': 'vydano', 'nevyzvednuto': 'nevyzvednuto', 'smazano': 'smazano'}
+        reklamace_stav_klic = {'Čeká': 'ceka', 'Výměna kus za kus': 'vymena', 'Posláno do Ústí': 'poslano', 'Zamítnuto': 'zamitnuto'}
         
-        # Měsíční statistiky - inicializujeme všechny měsíce
-        mesicni_odbery = {i: {'celkem': 0, 'aktivni': 0, 'vydano': 0, 'castka': 0} for i in range(1, 13)}
-        mesicni_reklamace = {i: {'celkem': 0, 'ceka': 0, 'vymena': 0, 'poslano': 0, 'zamitnuto': 0, 'cena': 0} for i in range(1, 13)}
-        for mesic in range(1, 13):
-            odbery_mesic = Odber.query.filter(
-                Odber.datum.isnot(None),
-                _db_year_eq(Odber.datum, selected_year),
-                _db_month_eq(Odber.datum, mesic)
-            )
-            if selected_pobocka:
-                odbery_mesic = odbery_mesic.filter_by(pobocka_id=selected_pobocka)
-            
-            reklamace_mesic = Reklamace.query.filter(
-                Reklamace.datum_prijmu.isnot(None),
-                _db_year_eq(Reklamace.datum_prijmu, selected_year),
-                _db_month_eq(Reklamace.datum_prijmu, mesic)
-            )
-            if selected_pobocka:
-                reklamace_mesic = reklamace_mesic.filter_by(pobocka_id=selected_pobocka)
-            
-            try:
-                odbery_count = odbery_mesic.count()
-                odbery_vydano_list = odbery_mesic.filter_by(stav='vydáno').all()
-                mesicni_odbery[mesic] = {
-                    'celkem': odbery_count or 0,
-                    'aktivni': odbery_mesic.filter_by(stav='aktivní').count() or 0,
-                    'vydano': len(odbery_vydano_list) or 0,
-                    'castka': sum(o.castka or 0 for o in odbery_vydano_list) or 0
-                }
-            except Exception as e:
-                app.logger.error(f'Chyba při načítání měsíčních odběrů pro měsíc {mesic}: {str(e)}')
-                import traceback
-                app.logger.error(traceback.format_exc())
-                mesicni_odbery[mesic] = {'celkem': 0, 'aktivni': 0, 'vydano': 0, 'castka': 0}
-            
-            try:
-                reklamace_count = reklamace_mesic.count()
-                reklamace_all_list = reklamace_mesic.all()
-                mesicni_reklamace[mesic] = {
-                    'celkem': reklamace_count or 0,
-                    'ceka': reklamace_mesic.filter_by(stav='Čeká').count() or 0,
-                    'vymena': reklamace_mesic.filter_by(stav='Výměna kus za kus').count() or 0,
-                    'poslano': reklamace_mesic.filter_by(stav='Posláno do Ústí').count() or 0,
-                    'zamitnuto': reklamace_mesic.filter_by(stav='Zamítnuto').count() or 0,
-                    'cena': sum(r.cena or 0 for r in reklamace_all_list) or 0
-                }
-            except Exception as e:
-                app.logger.error(f'Chyba při načítání měsíčních reklamací pro měsíc {mesic}: {str(e)}')
-                import traceback
-                app.logger.error(traceback.format_exc())
-                mesicni_reklamace[mesic] = {'celkem': 0, 'ceka': 0, 'vymena': 0, 'poslano': 0, 'zamitnuto': 0, 'cena': 0}
+        # Měsíční statistiky (celý rok, bez filtru měsíce) - inicializujeme všechny měsíce
+        mesicni_odbery = {i: _odbery_stats() for i in range(1, 13)}
+        mesicni_reklamace = {i: _reklamace_stats() for i in range(1, 13)}
+        # Statistiky podle poboček a celkové (s filtrem měsíce)
+        odbery_by_p = {p.id: _odbery_stats() for p in pobocky}
+        reklamace_by_p = {p.id: _reklamace_stats() for p in pobocky}
+        odbery_celkem = _odbery_stats()
+        reklamace_celkem = _reklamace_stats()
         
-        # Statistiky podle poboček
-        pobocky_stats = []
-        for pobocka in pobocky:
-            if selected_pobocka and pobocka.id != selected_pobocka:
-                continue
-            
-            try:
-                odbery_pob = odbery_query.filter_by(pobocka_id=pobocka.id)
-                reklamace_pob = reklamace_query.filter_by(pobocka_id=pobocka.id)
-                
-                odbery_pob_vydano = odbery_pob.filter_by(stav='vydáno').all()
-                reklamace_pob_all = reklamace_pob.all()
-                
-                pobocky_stats.append({
-                    'id': pobocka.id,
-                    'nazev': pobocka.nazev,
-                    'odbery': {
-                        'celkem': odbery_pob.count() or 0,
-                        'aktivni': odbery_pob.filter_by(stav='aktivní').count() or 0,
-                        'vydano': len(odbery_pob_vydano) or 0,
-                        'castka': sum(o.castka or 0 for o in odbery_pob_vydano) or 0
-                    },
-                    'reklamace': {
-                        'celkem': reklamace_pob.count() or 0,
-                        'ceka': reklamace_pob.filter_by(stav='Čeká').count() or 0,
-                        'vymena': reklamace_pob.filter_by(stav='Výměna kus za kus').count() or 0,
-                        'poslano': reklamace_pob.filter_by(stav='Posláno do Ústí').count() or 0,
-                        'zamitnuto': reklamace_pob.filter_by(stav='Zamítnuto').count() or 0,
-                        'cena': sum(r.cena or 0 for r in reklamace_pob_all) or 0
-                    }
-                })
-            except Exception as e:
-                app.logger.error(f'Chyba při načítání statistik pro pobočku {pobocka.nazev}: {str(e)}')
-                pobocky_stats.append({
-                    'id': pobocka.id,
-                    'nazev': pobocka.nazev,
-                    'odbery': {'celkem': 0, 'aktivni': 0, 'vydano': 0, 'castka': 0},
-                    'reklamace': {'celkem': 0, 'ceka': 0, 'vymena': 0, 'poslano': 0, 'zamitnuto': 0, 'cena': 0}
-                })
-        
-        # Celkové statistiky
-        try:
-            odbery_count_total = odbery_query.count()
-            odbery_vydano = odbery_query.filter_by(stav='vydáno').all()
-            odbery_castka = sum(o.castka or 0 for o in odbery_vydano)
-            app.logger.debug(f'Celkem odběrů: {odbery_count_total}, vydáno: {len(odbery_vydano)}, částka: {odbery_castka}')
-        except Exception as e:
-            app.logger.error(f'Chyba při načítání celkových statistik odběrů: {str(e)}')
-            odbery_castka = 0
+        for pid, mesic, stav, cnt, castka in odbery_rows:
+            klic = odbery_stav_klic.get(stav)
+            castka = castka or 0
+            targets = [mesicni_odbery[mesic]] if mesic in mesicni_odbery else []
+            if not selected_month or mesic == selected_month:
+                targets.append(odbery_celkem)
+                if pid in odbery_by_p:
+                    targets.append(odbery_by_p[pid])
+            for t in targets:
+                t['celkem'] += cnt
+                if klic:
+                    t[klic] += cnt
+                if stav == 'vydáno':
+                    t['castka'] += castka
         
-        try:
-            reklamace_count_total = reklamace_query.count()
-            reklamace_all = reklamace_query.all()
-            reklamace_cena = sum(r.cena or 0 for r in reklamace_all)
-            app.logger.debug(f'Celkem reklamací: {reklamace_count_total}, cena: {reklamace_cena}')
-        except Exception as e:
-            app.logger.error(f'Chyba při načítání celkových statistik reklamací: {str(e)}')
-            reklamace_cena = 0
+        for pid, mesic, stav, cnt, cena, zavolano in reklamace_rows:
+            klic = reklamace_stav_klic.get(stav)
+            targets = [mesicni_reklamace[mesic]] if mesic in mesicni_reklamace else []
+            if not selected_month or mesic == selected_month:
+                targets.append(reklamace_celkem)
+                if pid in reklamace_by_p:
+                    targets.append(reklamace_by_p[pid])
+            for t in targets:
+                t['celkem'] += cnt
+                if klic:
+                    t[klic] += cnt
+                t['cena'] += cena or 0
+                t['zavolano'] += zavolano or 0
         
-        celkove_stats = {
-            'odbery': {
-                'celkem': odbery_query.count() or 0,
-                'aktivni': odbery_query.filter_by(stav='aktivní').count() or 0,
-                'vydano': odbery_query.filter_by(stav='vydáno').count() or 0,
-                'nevyzvednuto': odbery_query.filter_by(stav='nevyzvednuto').count() or 0,
-                'smazano': odbery_query.filter_by(stav='smazano').count() or 0,
-                'castka': odbery_castka
-            },
-            'reklamace': {
-                'celkem': reklamace_query.count() or 0,
-                'ceka': reklamace_query.filter_by(stav='Čeká').count() or 0,
-                'vymena': reklamace_query.filter_by(stav='Výměna kus za kus').count() or 0,
-                'poslano': reklamace_query.filter_by(stav='Posláno do Ústí').count() or 0,
-                'zamitnuto': reklamace_query.filter_by(stav='Zamítnuto').count() or 0,
-                'cena': reklamace_cena,
-                'zavolano': reklamace_query.filter_by(zavolano_zakaznikovi=True).count() or 0
+        pobocky_stats = [
+            {
+                'id': pobocka.id,
+                'nazev': pobocka.nazev,
+                'odbery': odbery_by_p[pobocka.id],
+                'reklamace': reklamace_by_p[pobocka.id],
             }
-        }
+            for pobocka in pobocky
+            if not selected_pobocka or pobocka.id == selected_pobocka
+        ]
+        celkove_stats = {'odbery': odbery_celkem, 'reklamace': reklamace_celkem}
         
         # Top zákazníci (podle počtu odběrů)
         try:
@@ -2069,20 +2831,23 @@ def admin_statistiky():
         
         # Top značky reklamací
         try:
+            rv = reklamace_vse('znacka', 'id', 'datum_prijmu', 'pobocka_id').c
             top_znacky = db.session.query(
-                Reklamace.znacka,
-                db.func.count(Reklamace.id).label('pocet')
+                rv.znacka,
+                db.func.count(rv.id).label('pocet')
             ).filter(
-                Reklamace.datum_prijmu.isnot(None),
-                _db_year_eq(Reklamace.datum_prijmu, selected_year)
+                rv.datum_prijmu.isnot(None),
+                _db_year_eq(rv.datum_prijmu, selected_year)
             )
             if selected_pobocka:
-                top_znacky = top_znacky.filter_by(pobocka_id=selected_pobocka)
-            top_znacky = top_znacky.group_by(Reklamace.znacka).order_by(db.func.count(Reklamace.id).desc()).limit(10).all()
+                top_znacky = top_znacky.filter(rv.pobocka_id == selected_pobocka)
+            top_znacky = top_znacky.group_by(rv.znacka).order_by(db.func.count(rv.id).desc()).limit(10).all()
         except Exception as e:
             app.logger.error(f'Chyba při načítání top značek: {str(e)}')
             top_znacky = []
         
+        if budget_exceeded():
+            flash(BUDGET_MESSAGE, 'warning')
         return render_template(
             'admin_statistiky.html',
             selected_year=selected_year,
@@ -2099,10 +2864,14 @@ def admin_statistiky():
             is_admin=True
         )
     except Exception as e:
-        app.logger.error(f'Chyba v admin statistiky: {str(e)}')
-        import traceback
-        app.logger.error(traceback.format_exc())
-        flash(f'Chyba při načítání statistik: {str(e)}', 'danger')
+        if is_query_budget_exceeded(e) or budget_exceeded():
+            app.logger.warning(f'Admin statistiky: překročen rozpočet dotazů ({request.query_string.decode(errors="replace")})')
+            flash(BUDGET_MESSAGE, 'warning')
+        else:
+            app.logger.error(f'Chyba v admin statistiky: {str(e)}')
+            import traceback
+            app.logger.error(traceback.format_exc())
+            flash(f'Chyba při načítání statistik: {str(e)}', 'danger')
         # Vytvoříme prázdné struktury pro šablonu
         empty_mesicni_odbery = {i: {'celkem': 0, 'aktivni': 0, 'vydano': 0, 'castka': 0} for i in range(1, 13)}
         empty_mesicni_reklamace = {i: {'celkem': 0, 'ceka': 0, 'vymena': 0, 'poslano': 0, 'zamitnuto': 0, 'cena': 0} for i in range(1, 13)}
@@ -2125,6 +2894,86 @@ def admin_statistiky():
         )
 
 
+@app.route('/admin/perf')
+@login_required
+def admin_perf():
+    """Admin: výkon rout – percentily času, SQL a renderování podle endpointu."""
+    if not (current_user.is_authenticated and current_user.is_admin()):
+        flash('Nemáte oprávnění!', 'danger')
+        return redirect(url_for('index'))
+
+    return render_template(
+        'admin_perf.html',
+        rows=profiler.summary(),
+        profiles=list(profiler.profiles),
+        samples_per_endpoint=profiler.samples_per_endpoint,
+        slow_queries=list(slow_queries.entries),
+        slow_query_ms=slow_queries.threshold_ms,
+    )
+
+
+@app.route('/admin/perf/reset', methods=['POST'])
+@login_required
+def admin_perf_reset():
+    """Admin: vynulování nasbíraných vzorků výkonu."""
+    if not (current_user.is_authenticated and current_user.is_admin()):
+        flash('Nemáte oprávnění!', 'danger')
+        return redirect(url_for('index'))
+    profiler.reset()
+    slow_queries.entries.clear()
+    flash('Statistiky výkonu byly vynulovány.', 'success')
+    return redirect(url_for('admin_perf'))
+
+
+@app.route('/admin/zalohy')
+@login_required
+def admin_zalohy():
+    """Admin: online zálohy SQLite – seznam záloh, poslední běhy a ruční spuštění."""
+    if not (current_user.is_authenticated and current_user.is_admin()):
+        flash('Nemáte oprávnění!', 'danger')
+        return redirect(url_for('index'))
+
+    runs = (db.session.query(MaintenanceRun).filter(MaintenanceRun.job == 'backup')
+            .order_by(MaintenanceRun.started_at.desc()).limit(10).all())
+    return render_template(
+        'admin_zalohy.html',
+        snapshots=backups.snapshots(),
+        runs=runs,
+        running=backups.running,
+        keep=backups.keep,
+        is_sqlite=not _is_postgresql(),
+    )
+
+
+@app.route('/admin/zalohy/spustit', methods=['POST'])
+@login_required
+def admin_zalohy_spustit():
+    """Admin: spustí zálohu na pozadí – request nečeká, běh se zapíše do maintenance_run."""
+    if not (current_user.is_authenticated and current_user.is_admin()):
+        flash('Nemáte oprávnění!', 'danger')
+        return redirect(url_for('index'))
+    if backups.running:
+        flash('Záloha už běží.', 'info')
+        return redirect(url_for('admin_zalohy'))
+    threading.Thread(target=maintenance.run, args=(db.engine, ['backup'], app.logger),
+                     name='backup', daemon=True).start()
+    app.logger.info(f'Záloha spuštěna ručně ({current_user.jmeno or current_user.username})')
+    flash('Záloha běží na pozadí – za chvíli obnovte stránku.', 'success')
+    return redirect(url_for('admin_zalohy'))
+
+
+@app.route('/admin/zalohy/<name>')
+@login_required
+def admin_zalohy_stahnout(name):
+    """Admin: stažení zálohy – jen soubory ze seznamu záloh."""
+    if not (current_user.is_authenticated and current_user.is_admin()):
+        flash('Nemáte oprávnění!', 'danger')
+        return redirect(url_for('index'))
+    if name not in {snapshot['name'] for snapshot in backups.snapshots()}:
+        abort(404)
+    return send_from_directory(backups.directory, name, as_attachment=True)
+
+
 @app.route('/admin/user/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_user(id):
@@ -2133,11 +2982,12 @@ def edit_user(id):
         flash('Nemáte oprávnění!', 'danger')
         return redirect(url_for('admin_dashboard'))
     
-    user = User.query.get_or_404(id)
+    user = User.query.options(selectinload(User.pobocky)).get_or_404(id)
     form = EditUserForm()
     
     # Naplníme choices pro pobočky (pro zpětnou kompatibilitu)
     all_pobocky = Pobocka.query.all()
+    pobocky_by_id = {p.id: p for p in all_pobocky}
     form.pobocky.choices = [(str(p.id), p.nazev) for p in all_pobocky]
     
     # Získáme ID poboček uživatele pro checkboxy
@@ -2179,14 +3029,14 @@ def edit_user(id):
                 if p_id:
                     try:
                         pob_id = int(p_id)
-                        # Ověření, že pobočka existuje
-                        if Pobocka.query.get(pob_id):
+                        # Ověření, že pobočka existuje (bez dotazu na každou pobočku zvlášť)
+                        if pob_id in pobocky_by_id:
                             pobocky_ids.append(pob_id)
                     except (ValueError, TypeError):
                         continue
             
             if pobocky_ids:
-                pobocky_objects = Pobocka.query.filter(Pobocka.id.in_(pobocky_ids)).all()
+                pobocky_objects = [pobocky_by_id[pob_id] for pob_id in pobocky_ids]
                 user.pobocky = pobocky_objects
                 app.logger.info(f'Uživatel {user.username} má nyní {len(pobocky_objects)} poboček: {[p.nazev for p in pobocky_objects]}')
                 # Zpětná kompatibilita
@@ -2317,7 +3167,8 @@ def delete_pobocka(id):
     
     # Kontrola, jestli pobočka nemá žádné odběry nebo reklamace
     odbery_count = Odber.query.filter_by(pobocka_id=id).count()
-    reklamace_count = Reklamace.query.filter_by(pobocka_id=id).count()
+    rv = reklamace_vse('id', 'pobocka_id').c
+    reklamace_count = db.session.query(rv.id).filter(rv.pobocka_id == id).count()
     
     if odbery_count > 0 or reklamace_count > 0:
         flash(f'Nelze smazat pobočku! Má {odbery_count} odběrů a {reklamace_count} reklamací.', 'danger')
@@ -2376,6 +3227,18 @@ def forbidden_error(error):
                          error_message='Přístup zamítnut'), 403
 
 
+@app.errorhandler(OperationalError)
+def operational_error(error):
+    """Dotaz přerušený rozpočtem → srozumitelná hláška; ostatní DB chyby jako 500."""
+    if not is_query_budget_exceeded(error):
+        return internal_error(error)
+    db.session.rollback()
+    app.logger.warning(f'Překročen rozpočet dotazů: {request.endpoint} {request.full_path}')
+    return render_template('error.html',
+                         error_code=503,
+                         error_message=BUDGET_MESSAGE), 503
+
+
 # Health check endpoint pro monitoring
 @app.route('/health')
 def health_check():
@@ -2398,7 +3261,97 @@ def health_check():
         }), 503
 
 
+
+@readiness.check('schema')
+def _ready_schema():
+    version = migrations.current_version(db.engine)
+    if version < migrations.LATEST_VERSION:
+        status = health.FAIL  # chybí migrace – spusťte flask --app app init-db
+    elif version > migrations.LATEST_VERSION:
+        status = health.WARN  # databáze je novější než kód (rozpracovaný deploy)
+    else:
+        status = health.OK
+    return {'status': status, 'version': version, 'expected': migrations.LATEST_VERSION}
+
+
+@readiness.check('pool')
+def _ready_pool():
+    used, capacity = health.pool_usage(db.engine)
+    if not capacity:
+        return {'status': health.OK, 'checked_out': used, 'capacity': None}
+    warn, fail = app.config['HEALTH_POOL_USAGE']
+    return {'status': health.grade(used / capacity, warn, fail), 'checked_out': used, 'capacity': capacity}
+
+
+@readiness.check('write_lock')
+def _ready_write_lock():
+    warn, fail = app.config['HEALTH_WRITE_LOCK_MS']
+    latency = health.write_probe_ms(db.engine, timeout_ms=fail)
+    return {'status': health.grade(latency, warn, fail), 'latency_ms': round(latency, 1)}
+
+
+@readiness.check('wal')
+def _ready_wal():
+    size = health.wal_bytes(db.engine)
+    if size is None:
+        return {'status': health.OK, 'mb': None}
+    warn, fail = app.config['HEALTH_WAL_MB']
+    mb = size / (1024 * 1024)
+    return {'status': health.grade(mb, warn, fail), 'mb': round(mb, 1)}
+
+
+@readiness.check('warmup')
+def _ready_warmup():
+    state = app.extensions.get('warmup')
+    if not app.config['WARMUP']:
+        return {'status': health.OK, 'enabled': False}
+    if state is None or not state['ready']:
+        return {'status': health.WARN, 'ready': False}
+    return {'status': health.WARN if state['errors'] else health.OK, 'ready': True,
+            'total_ms': state['total_ms'], 'errors': state['errors']}
+
+
+@readiness.check('queues')
+def _ready_queues():
+    lanes = admission.snapshot()
+    waiting = sum(lane['waiting'] for lane in lanes.values())
+    full = [name for name, lane in lanes.items() if lane['max_queue'] and lane['waiting'] >= lane['max_queue']]
+    warn, _fail = app.config['HEALTH_QUEUE_WAITING']
+    status = health.FAIL if full else health.grade(waiting, warn, None)
+    return {'status': status, 'waiting': waiting, 'full_lanes': full}
+
+
+@app.route('/health/live')
+def health_live():
+    """Liveness – proces běží a obsluhuje requesty; do databáze nesahá."""
+    return jsonify({'status': 'alive', 'pid': os.getpid(), 'timestamp': datetime.now().isoformat()}), 200
+
+
+@app.route('/health/ready')
+def health_ready():
+    """Readiness – podrobné kontroly s prahy; 503 při 'fail', 'degraded' při 'warn'."""
+    overall, checks = readiness.run()
+    db.session.remove()
+    if overall == health.FAIL:
+        app.logger.warning(f'Readiness: {", ".join(n for n, c in checks.items() if c["status"] == health.FAIL)} selhalo')
+    status = {health.OK: 'ready', health.WARN: 'degraded', health.FAIL: 'unready'}[overall]
+    return jsonify({
+        'status': status,
+        'checks': checks,
+        'timestamp': datetime.now().isoformat()
+    }), 503 if overall == health.FAIL else 200
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Metriky pro Prometheus (text format). Volitelně chráněno tokenem METRICS_TOKEN."""
+    token = app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization', '') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 if __name__ == '__main__':
     # V produkci (např. na PythonAnywhere) běží aplikace přes WSGI server,
     # takže tento blok se typicky nepoužívá. Debug necháváme vypnutý.
-    app.run(debug=False)
\ No newline at end of file
+    create_app().run(debug=False)
\ No newline at end of file
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Online zálohy SQLite bez zastavení aplikace.
+
+Kopírovat soubor `odbery.db` za běhu nejde – pod WAL je část dat jen ve
+`-wal` souboru a kopie může zachytit rozepsanou stránku. Záloha proto jde přes
+SQLite backup API (`sqlite3.Connection.backup`) po `BACKUP_STEP_PAGES`
+stránkách: každý krok drží na zdroji jen krátký sdílený zámek a mezi kroky se
+na `BACKUP_STEP_SLEEP_MS` uvolní, takže zápisy z poboček nečekají. Když zdroj
+mezi kroky změní jiné spojení, SQLite začne kopírovat znovu od začátku – další
+pokus proto jde s dvojnásobným krokem a poslední pokus zkopíruje vše najednou.
+
+Kopie se ověří (`PRAGMA quick_check`), zkomprimuje gzipem do
+`<BACKUP_DIR>/<název>-RRRRMMDD-HHMMSS.db.gz` (nejdřív jako dočasný soubor, pak
+os.replace) a ponechá se jen `BACKUP_KEEP` nejnovějších záloh každé databáze.
+Spouští ji úloha údržby `backup` nebo admin tlačítkem (Admin → Zálohy).
+"""
+
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+SUFFIX = '.db.gz'
+STAMP_FORMAT = '%Y%m%d-%H%M%S'
+MAX_ATTEMPTS = 4  # krok 1×, 2×, 4×, pak celá databáze najednou
+
+
+class BackupError(RuntimeError):
+    """Záloha se nepovedla nebo už jiná běží."""
+
+
+class _Restarted(Exception):
+    """Zdroj se mezi kroky změnil a SQLite kopíruje znovu od začátku."""
+
+
+def _parse_name(name):
+    """'odbery-20250101-120000.db.gz' → ('odbery', datetime); cizí soubory → None."""
+    if not name.endswith(SUFFIX) or name.startswith('.'):
+        return None
+    stem, _, stamp = name[:-len(SUFFIX)].rpartition('-')
+    stem, _, day = stem.rpartition('-')
+    try:
+        return stem, datetime.strptime(f'{day}-{stamp}', STAMP_FORMAT)
+    except ValueError:
+        return None
+
+
+class Backup:
+    """Adresář se zálohami SQLite databází a jejich rotace (Flask rozšíření)."""
+
+    def __init__(self, app=None, directory=None, keep=14, step_pages=256, step_sleep_ms=20):
+        self.directory = directory
+        self.keep = keep
+        self.step_pages = step_pages
+        self.step_sleep_s = step_sleep_ms / 1000.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('BACKUP_DIR') or self.directory
+        self.keep = app.config.get('BACKUP_KEEP', self.keep)
+        self.step_pages = app.config.get('BACKUP_STEP_PAGES', self.step_pages)
+        self.step_sleep_s = app.config.get('BACKUP_STEP_SLEEP_MS', self.step_sleep_s * 1000) / 1000.0
+        app.extensions['backup'] = self
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def snapshots(self):
+        """Zálohy od nejnovější: [{'name', 'stem', 'path', 'bytes', 'created'}]."""
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in os.listdir(self.directory):
+            parsed = _parse_name(name)
+            if parsed is None:
+                continue
+            path = os.path.join(self.directory, name)
+            found.append({'name': name, 'stem': parsed[0], 'path': path, 'bytes': os.path.getsize(path),
+                          'created': parsed[1]})
+        return sorted(found, key=lambda s: (s['created'], s['name']), reverse=True)
+
+    def run(self, source_path, now=None):
+        """Zazálohuje jednu databázi; vrací {'name', 'pages', 'steps', 'attempts', 'bytes', 'ms'}."""
+        if not self._lock.acquire(blocking=False):
+            raise BackupError('záloha už běží')
+        try:
+            return self._run(source_path, now or datetime.now())
+        finally:
+            self._lock.release()
+
+    def _run(self, source_path, now):
+        started = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        name = f'{stem}-{now.strftime(STAMP_FORMAT)}{SUFFIX}'
+        tmp_db = os.path.join(self.directory, f'.{name}.tmp.db')
+        tmp_gz = os.path.join(self.directory, f'.{name}.tmp')
+        stats = {'pages': 0, 'steps': 0, 'attempts': 0}
+        try:
+            source = sqlite3.connect(f'file:{os.path.abspath(source_path)}?mode=ro', uri=True)
+            try:
+                target = sqlite3.connect(tmp_db)
+                try:
+                    self._copy(source, target, stats)
+                    check = target.execute('PRAGMA quick_check').fetchone()[0]
+                    if check != 'ok':
+                        raise BackupError(f'kopie neprošla kontrolou: {check}')
+                finally:
+                    target.close()
+            finally:
+                source.close()
+            with open(tmp_db, 'rb') as raw, open(tmp_gz, 'wb') as out:
+                with gzip.GzipFile(filename=f'{stem}.db', fileobj=out, mode='wb', compresslevel=6) as gz:
+                    shutil.copyfileobj(raw, gz, 1024 * 1024)
+                out.flush()
+                os.fsync(out.fileno())
+            path = os.path.join(self.directory, name)
+            os.replace(tmp_gz, path)
+        finally:
+            for leftover in (tmp_db, tmp_gz):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        self.rotate(stem)
+        return dict(stats, name=name, bytes=os.path.getsize(path),
+                    ms=round((time.perf_counter() - started) * 1000, 1))
+
+    def _copy(self, source, target, stats):
+        """Backup API po krocích s pauzou; při restartu kopie (změna zdroje) větší krok, nakonec vše naráz."""
+        for attempt in range(MAX_ATTEMPTS):
+            pages = self.step_pages * 2 ** attempt if attempt < MAX_ATTEMPTS - 1 else -1
+            state = {'remaining': None}
+            stats['attempts'] = attempt + 1
+
+            def progress(status, remaining, total, state=state):
+                # Po kroku musí zbývat méně stránek; jinak SQLite kvůli změně zdroje začal znovu
+                if state['remaining'] is not None and remaining >= state['remaining']:
+                    raise _Restarted()
+                state['remaining'] = remaining
+                stats['pages'] = total
+                stats['steps'] += 1
+                if remaining:
+                    time.sleep(self.step_sleep_s)  # zdroj je mezi kroky volný pro zapisovatele
+
+            try:
+                source.backup(target, pages=pages, progress=progress)
+                return
+            except _Restarted:
+                continue
+            except sqlite3.Error as e:
+                raise BackupError(f'záloha selhala: {e}') from e
+        raise BackupError('zdroj se měnil během všech pokusů o zálohu')
+
+    def rotate(self, stem):
+        """Smaže starší zálohy databáze `stem` nad počet BACKUP_KEEP; vrací smazané názvy."""
+        own = [s for s in self.snapshots() if s['stem'] == stem]
+        removed = []
+        for snapshot in own[self.keep:]:
+            os.remove(snapshot['path'])
+            removed.append(snapshot['name'])
+        return removed
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarky aplikace Odběry.
+
+    python -m bench.generate --database sqlite:///bench.db      # syntetická data
+    python -m bench.routes --database sqlite:///bench.db        # časy rout -> JSON
+
+Skripty nastavují DATABASE_URL ještě před importem app.py, protože aplikace
+čte konfiguraci při importu. Relativní SQLite cesta se (stejně jako u
+odbery.db) ukládá do složky instance/.
+"""
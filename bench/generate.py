@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Generátor syntetických dat pro benchmarky.
+
+Naplní skutečné schéma aplikace realistickými objemy: pobočky s nerovnoměrným
+provozem, uživatele přiřazené k více pobočkám, statisíce odběrů, reklamací
+a jejich historie (Akce, ReklamaceLog) s českými jmény a nerovnoměrným
+rozložením značek. Stejný seed a stejné datum konce dávají stejná data.
+
+Použití:
+    python -m bench.generate --database sqlite:///bench.db
+    python -m bench.generate --database sqlite:///bench.db --scale 0.1 --seed 7
+
+POZOR: cílová databáze se smaže a vytvoří znovu. Na odbery.db skript
+odmítne běžet bez --force.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+SITE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SITE_DIR not in sys.path:
+    sys.path.insert(0, SITE_DIR)
+
+DEFAULT_COUNTS = {
+    'pobocky': 15,
+    'users': 60,
+    'odbery': 300000,
+    'reklamace': 120000,
+}
+AKCE_PER_ODBER = 2.0  # průměrný počet záznamů v Akce na odběr
+LOG_PER_REKLAMACE = 3.0  # průměrný počet záznamů v ReklamaceLog na reklamaci
+HISTORY_DAYS = 3 * 365
+BATCH_SIZE = 5000
+BENCH_PASSWORD = 'bench123'
+ADMIN_PIN = '0000'
+
+MESTA = [
+    'Teplice', 'Děčín', 'Ústí nad Labem', 'Most', 'Chomutov', 'Litoměřice',
+    'Louny', 'Žatec', 'Bílina', 'Varnsdorf', 'Rumburk', 'Roudnice nad Labem',
+    'Kadaň', 'Jirkov', 'Litvínov', 'Lovosice', 'Šluknov', 'Krupka',
+]
+ULICE = ['Masarykova', 'Náměstí Svobody', 'Husova', 'Palackého', 'Dlouhá', 'Krátká',
+         'Nádražní', 'Školní', 'Zahradní', 'Komenského', 'Jiráskova', 'Tyršova']
+JMENA_M = ['Jan', 'Petr', 'Josef', 'Pavel', 'Martin', 'Tomáš', 'Jaroslav', 'Miroslav',
+           'Zdeněk', 'Václav', 'Michal', 'František', 'Jiří', 'Lukáš', 'Jakub', 'David',
+           'Ondřej', 'Karel', 'Milan', 'Vojtěch', 'Filip', 'Radek', 'Roman', 'Stanislav']
+JMENA_Z = ['Marie', 'Jana', 'Eva', 'Hana', 'Anna', 'Lenka', 'Kateřina', 'Lucie', 'Věra',
+           'Alena', 'Petra', 'Veronika', 'Jaroslava', 'Tereza', 'Martina', 'Michaela',
+           'Jitka', 'Helena', 'Ludmila', 'Zdeňka', 'Ivana', 'Monika', 'Eliška', 'Klára']
+PRIJMENI = [('Novák', 'Nováková'), ('Svoboda', 'Svobodová'), ('Novotný', 'Novotná'),
+            ('Dvořák', 'Dvořáková'), ('Černý', 'Černá'), ('Procházka', 'Procházková'),
+            ('Kučera', 'Kučerová'), ('Veselý', 'Veselá'), ('Horák', 'Horáková'),
+            ('Němec', 'Němcová'), ('Marek', 'Marková'), ('Pospíšil', 'Pospíšilová'),
+            ('Pokorný', 'Pokorná'), ('Hájek', 'Hájková'), ('Král', 'Králová'),
+            ('Jelínek', 'Jelínková'), ('Růžička', 'Růžičková'), ('Beneš', 'Benešová'),
+            ('Fiala', 'Fialová'), ('Sedláček', 'Sedláčková'), ('Doležal', 'Doležalová'),
+            ('Zeman', 'Zemanová'), ('Kolář', 'Kolářová'), ('Navrátil', 'Navrátilová'),
+            ('Čermák', 'Čermáková'), ('Urban', 'Urbanová'), ('Vaněk', 'Vaňková'),
+            ('Blažek', 'Blažková'), ('Kříž', 'Křížová'), ('Kovář', 'Kovářová')]
+# Značky s vahami – pár značek tvoří většinu reklamací (jako v obchodech)
+ZNACKY = [('Nike', 30), ('Adidas', 24), ('Puma', 12), ('Skechers', 9), ('New Balance', 7),
+          ('Reebok', 5), ('Asics', 4), ('Salomon', 3), ('Converse', 2), ('Vans', 2),
+          ('Crocs', 1), ('Geox', 1), ('Ecco', 1), ('Baťa', 1)]
+MODELY = ['Air Max 90', 'Revolution 6', 'Superstar', 'Runfalcon', 'Suede Classic', 'Go Walk',
+          '574', 'Club C', 'Gel-Contend', 'Speedcross', 'Chuck Taylor', 'Old Skool', 'Classic Clog']
+BARVY = ['černá', 'bílá', 'šedá', 'modrá', 'červená', 'zelená', 'béžová', 'růžová', None]
+ZAVADY = ['Odlepená podrážka', 'Prasklý svršek u špičky', 'Utržený pásek', 'Prošlapaná stélka',
+          'Rozpáraný šev na patě', 'Odbarvení materiálu', 'Vadný zip', 'Prasklá podrážka',
+          'Odřená pata zevnitř', 'Uvolněná ozdoba']
+STAVY_ODBER = [('vydáno', 78), ('aktivní', 10), ('nevyzvednuto', 8), ('smazano', 4)]
+STAVY_REKLAMACE = [('Výměna kus za kus', 45), ('Zamítnuto', 25), ('Posláno do Ústí', 18), ('Čeká', 12)]
+POZNAMKY = [None, None, None, 'Zavolat po 15:00', 'Zákazník přijde v sobotu', 'Velikost 42',
+            'Nechat odložené do pátku', 'Platba kartou']
+
+
+def _weighted(rng, choices):
+    values = [c[0] for c in choices]
+    weights = [c[1] for c in choices]
+    return rng.choices(values, weights=weights)[0]
+
+
+class DataGenerator:
+    """Deterministický zdroj řádků (slovníků) pro jednotlivé tabulky.
+
+    Každá tabulka má vlastní generátor náhodných čísel odvozený ze seedu,
+    takže změna počtu reklamací neovlivní vygenerované odběry.
+    """
+
+    def __init__(self, seed=42, counts=None, end_date=None):
+        self.seed = seed
+        self.counts = dict(DEFAULT_COUNTS, **(counts or {}))
+        self.end_date = end_date or date.today()
+        self.start_date = self.end_date - timedelta(days=HISTORY_DAYS)
+        rng = self._rng('pobocky')
+        # Zipfovo rozložení provozu – první pobočky jsou "velké obchody"
+        self.pobocka_weights = [1.0 / (i + 1) ** 0.8 for i in range(self.counts['pobocky'])]
+        rng.shuffle(self.pobocka_weights)
+        self.pobocka_ids = list(range(1, self.counts['pobocky'] + 1))
+        self._staff = {}
+
+    def _rng(self, table):
+        return random.Random(f'{self.seed}:{table}')
+
+    def _jmeno(self, rng):
+        prijmeni = rng.choice(PRIJMENI)
+        if rng.random() < 0.55:
+            return f'{rng.choice(JMENA_Z)} {prijmeni[1]}'
+        return f'{rng.choice(JMENA_M)} {prijmeni[0]}'
+
+    def _telefon(self, rng):
+        return '+420' + str(rng.choice((6, 7))) + ''.join(str(rng.randrange(10)) for _ in range(8))
+
+    def _datum(self, rng):
+        # Novější data jsou častější (provoz roste), ale historie sahá 3 roky zpět
+        offset = int(HISTORY_DAYS * (1 - rng.random() ** 0.7))
+        return self.start_date + timedelta(days=min(offset, HISTORY_DAYS))
+
+    def _cas(self, rng, den):
+        return datetime.combine(den, datetime.min.time()) + timedelta(
+            hours=rng.randint(8, 17), minutes=rng.randrange(60), seconds=rng.randrange(60))
+
+    def _pobocka(self, rng):
+        return rng.choices(self.pobocka_ids, weights=self.pobocka_weights)[0]
+
+    def pobocky(self):
+        rng = self._rng('pobocky-rows')
+        for pid in self.pobocka_ids:
+            mesto = MESTA[(pid - 1) % len(MESTA)]
+            cislo = (pid - 1) // len(MESTA)
+            yield {
+                'id': pid,
+                'nazev': mesto if cislo == 0 else f'{mesto} {cislo + 1}',
+                'adresa': f'{rng.choice(ULICE)} {rng.randint(1, 250)}, {mesto}',
+                'firma': rng.choice(['Obuv s.r.o.', 'Sport Sever a.s.', None]),
+            }
+
+    def users(self, password_hash):
+        """Admin (id 1, PIN 0000) + prodavači s PINy 1001, 1002, … a heslem BENCH_PASSWORD."""
+        rng = self._rng('users')
+        yield {'id': 1, 'username': 'admin', 'password': password_hash, 'pin': ADMIN_PIN,
+               'pobocka_id': None, 'role': 'admin', 'jmeno': 'Administrátor'}
+        for uid in range(2, self.counts['users'] + 1):
+            yield {
+                'id': uid,
+                'username': f'prodavac{uid:03d}',
+                'password': password_hash,
+                'pin': str(1000 + uid - 1),
+                'pobocka_id': self._pobocka(rng),
+                'role': 'admin' if rng.random() < 0.05 else 'user',
+                'jmeno': self._jmeno(rng),
+            }
+
+    def user_pobocky(self):
+        """Více poboček na uživatele – většina 1, část 2–4 (výpomoc mezi obchody)."""
+        rng = self._rng('user_pobocky')
+        for uid in range(2, self.counts['users'] + 1):
+            pocet = _weighted(rng, [(1, 60), (2, 25), (3, 10), (4, 5)])
+            pocet = min(pocet, len(self.pobocka_ids))
+            for pid in sorted(rng.sample(self.pobocka_ids, pocet)):
+                self._staff.setdefault(pid, []).append(f'prodavac{uid:03d}')
+                yield {'user_id': uid, 'pobocka_id': pid}
+
+    def _uzivatel(self, rng, pobocka_id):
+        staff = self._staff.get(pobocka_id)
+        return rng.choice(staff) if staff else 'admin'
+
+    def odbery(self):
+        rng = self._rng('odbery')
+        for oid in range(1, self.counts['odbery'] + 1):
+            placeno = rng.random() < 0.35
+            yield {
+                'id': oid,
+                'pobocka_id': self._pobocka(rng),
+                'jmeno': self._jmeno(rng),
+                'kdo_zadal': self._jmeno(rng),
+                'telefon': self._telefon(rng),
+                'placeno_predem': placeno,
+                'datum': self._datum(rng),
+                'castka': None if placeno else float(rng.randrange(290, 4990, 10)),
+                'poznamky': rng.choice(POZNAMKY),
+                'stav': _weighted(rng, STAVY_ODBER),
+            }
+
+    def akce(self, odbery):
+        """Historie odběrů – založení + změny stavu/poznámek (iteruje přes vygenerované odběry)."""
+        rng = self._rng('akce')
+        aid = 0
+        for odber in odbery:
+            pocet = max(1, int(rng.expovariate(1.0 / AKCE_PER_ODBER)))
+            cas = self._cas(rng, odber['datum'])
+            for i in range(pocet):
+                aid += 1
+                if i == 0:
+                    text = f"Přidán odběr: {odber['jmeno']}"
+                elif i == pocet - 1 and odber['stav'] != 'aktivní':
+                    text = f"Stav změněn na {odber['stav']}"
+                else:
+                    text = f"Upraveny poznámky: {rng.choice(POZNAMKY[3:])}"
+                yield {
+                    'id': aid,
+                    'odber_id': odber['id'],
+                    'uzivatel': self._uzivatel(rng, odber['pobocka_id']),
+                    'akce': text,
+                    'datum': cas,
+                    'pobocka_id': odber['pobocka_id'],
+                }
+                cas += timedelta(days=rng.randint(0, 10), minutes=rng.randrange(600))
+
+    def reklamace(self):
+        rng = self._rng('reklamace')
+        archiv_do = self.end_date - timedelta(days=180)
+        for rid in range(1, self.counts['reklamace'] + 1):
+            pobocka_id = self._pobocka(rng)
+            prijem = self._datum(rng)
+            stav = _weighted(rng, STAVY_REKLAMACE)
+            archived = stav != 'Čeká' and prijem < archiv_do and rng.random() < 0.85
+            created = self._cas(rng, prijem)
+            yield {
+                'id': rid,
+                'pobocka_id': pobocka_id,
+                'zakaznik': self._jmeno(rng),
+                'telefon': self._telefon(rng),
+                'znacka': _weighted(rng, ZNACKY),
+                'model': rng.choice(MODELY),
+                'barva': rng.choice(BARVY),
+                'datum_prijmu': prijem,
+                'datum_zakoupeni': prijem - timedelta(days=rng.randint(10, 720)),
+                'popis_zavady': rng.choice(ZAVADY),
+                'stav': stav,
+                'sleva_procent': float(rng.choice((10, 15, 20, 30))) if stav == 'Zamítnuto' and rng.random() < 0.3 else None,
+                'reseni': None if stav == 'Čeká' else rng.choice(['Vyměněno za nový pár', 'Předáno dodavateli', 'Vada způsobena nošením']),
+                'cena': float(rng.randrange(490, 3990, 10)),
+                'poznamky': rng.choice(POZNAMKY),
+                'zavolano_zakaznikovi': stav != 'Čeká' and rng.random() < 0.7,
+                'prijal': self._uzivatel(rng, pobocka_id),
+                'archived': archived,
+                'archived_at': created + timedelta(days=rng.randint(30, 120)) if archived else None,
+                'created_at': created,
+            }
+
+    def reklamace_log(self, reklamace):
+        rng = self._rng('reklamace_log')
+        lid = 0
+        for rek in reklamace:
+            pocet = max(1, int(rng.expovariate(1.0 / LOG_PER_REKLAMACE)))
+            cas = rek['created_at']
+            for i in range(pocet):
+                lid += 1
+                if i == 0:
+                    text = f"Založena reklamace ({rek['znacka']})"
+                elif i == pocet - 1 and rek['stav'] != 'Čeká':
+                    text = f"Změna stavu: Čeká → {rek['stav']}"
+                else:
+                    text = rng.choice(['Zavoláno zákazníkovi', 'Upraveny poznámky', 'Upravena reklamace'])
+                yield {
+                    'id': lid,
+                    'reklamace_id': rek['id'],
+                    'uzivatel': self._uzivatel(rng, rek['pobocka_id']),
+                    'akce': text,
+                    'datum': cas,
+                    'pobocka_id': rek['pobocka_id'],
+                }
+                cas += timedelta(days=rng.randint(0, 14), minutes=rng.randrange(600))
+
+
+def _insert_batches(db, table, rows, on_batch=None):
+    """Hromadný INSERT po dávkách (executemany) – vrací počet vložených řádků."""
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(table.insert(), batch)
+            total += len(batch)
+            batch = []
+            if on_batch:
+                on_batch(total)
+    if batch:
+        db.session.execute(table.insert(), batch)
+        total += len(batch)
+    return total
+
+
+def _tee(rows, sink, keys):
+    """Předá řádky dál a zároveň si ponechá sloupce potřebné pro navazující historii."""
+    for row in rows:
+        sink.append({k: row[k] for k in keys})
+        yield row
+
+
+def populate(generator, verbose=True):
+    """Smaže a znovu vytvoří schéma a naplní ho daty z generátoru. Vrací počty řádků."""
+    from werkzeug.security import generate_password_hash
+    from app import create_app, db, User, Pobocka, Odber, Akce, Reklamace, ReklamaceLog, user_pobocky
+    import migrations
+    app = create_app()
+
+    def log(msg):
+        if verbose:
+            print(msg, flush=True)
+
+    counts = {}
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        migrations.stamp(db.engine)
+        if db.engine.dialect.name == 'sqlite':
+            # Jednorázové plnění – trvanlivost zápisu tu nehraje roli
+            db.session.execute(db.text('PRAGMA synchronous=OFF'))
+        password_hash = generate_password_hash(BENCH_PASSWORD)  # hash jednou, ne pro každého uživatele
+        steps = [
+            ('pobocka', Pobocka.__table__, lambda: generator.pobocky()),
+            ('user', User.__table__, lambda: generator.users(password_hash)),
+            ('user_pobocky', user_pobocky, lambda: generator.user_pobocky()),
+        ]
+        for name, table, rows in steps:
+            counts[name] = _insert_batches(db, table, rows())
+            log(f'  {name}: {counts[name]}')
+        db.session.commit()
+
+        for name, table, hist_name, hist_table, rows, history, keys in (
+            ('odber', Odber.__table__, 'akce', Akce.__table__, generator.odbery, generator.akce,
+             ('id', 'pobocka_id', 'jmeno', 'datum', 'stav')),
+            ('reklamace', Reklamace.__table__, 'reklamace_log', ReklamaceLog.__table__, generator.reklamace,
+             generator.reklamace_log, ('id', 'pobocka_id', 'znacka', 'stav', 'created_at')),
+        ):
+            started = time.perf_counter()
+            generated = []
+            counts[name] = _insert_batches(
+                db, table, _tee(rows(), generated, keys),
+                on_batch=lambda n, name=name: log(f'  {name}: {n}…') if n % (BATCH_SIZE * 20) == 0 else None)
+            db.session.commit()
+            counts[hist_name] = _insert_batches(db, hist_table, history(generated))
+            db.session.commit()
+            log(f'  {name}: {counts[name]}, {hist_name}: {counts[hist_name]} ({time.perf_counter() - started:.1f} s)')
+
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute(db.text('ANALYZE'))
+        elif db.engine.dialect.name == 'postgresql':
+            # Sekvence po vložení explicitních id
+            for table in (Pobocka.__table__, User.__table__, Odber.__table__, Akce.__table__,
+                          Reklamace.__table__, ReklamaceLog.__table__):
+                db.session.execute(db.text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                    f"COALESCE((SELECT MAX(id) FROM {table.name}), 1))"))
+            db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Naplní databázi syntetickými daty pro benchmarky.')
+    parser.add_argument('--database', default='sqlite:///bench.db',
+                        help='SQLAlchemy URL cílové DB (default sqlite:///bench.db -> instance/bench.db)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scale', type=float, default=1.0, help='násobek výchozích počtů odběrů a reklamací')
+    parser.add_argument('--pobocky', type=int, default=DEFAULT_COUNTS['pobocky'])
+    parser.add_argument('--users', type=int, default=DEFAULT_COUNTS['users'])
+    parser.add_argument('--odbery', type=int, default=None)
+    parser.add_argument('--reklamace', type=int, default=None)
+    parser.add_argument('--end-date', type=date.fromisoformat, default=None,
+                        help='datum nejnovějších záznamů (YYYY-MM-DD, default dnes)')
+    parser.add_argument('--force', action='store_true', help='povolí přepsat produkční odbery.db')
+    args = parser.parse_args(argv)
+
+    if 'odbery.db' in args.database and not args.force:
+        parser.error('odmítám přepsat produkční odbery.db (použijte --force)')
+    os.environ['DATABASE_URL'] = args.database
+
+    counts = {
+        'pobocky': args.pobocky,
+        'users': max(args.users, 1),
+        'odbery': args.odbery if args.odbery is not None else int(DEFAULT_COUNTS['odbery'] * args.scale),
+        'reklamace': args.reklamace if args.reklamace is not None else int(DEFAULT_COUNTS['reklamace'] * args.scale),
+    }
+    generator = DataGenerator(seed=args.seed, counts=counts, end_date=args.end_date)
+    print(f'Generuji data do {args.database} (seed {args.seed}, konec {generator.end_date})')
+    started = time.perf_counter()
+    result = populate(generator)
+    print(f'Hotovo za {time.perf_counter() - started:.1f} s: {result}')
+    print(f'Přihlášení: admin PIN {ADMIN_PIN}, prodavači PIN 1001–{1000 + counts["users"] - 1}, heslo {BENCH_PASSWORD}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Zátěžový test proti skutečnému serveru (run_waitress.py) s N souběžnými klienty.
+
+Spustí waitress nad vygenerovanou databází (bench.generate) a přehrává
+realistický mix provozu: prodavači zakládají odběry a reklamace, mění stavy,
+ukládají poznámky přes /update_notes, admini otevírají přehledy a statistiky.
+Na konci vypíše propustnost, p50/p95/p99 latence podle akce a chybovost
+včetně zamčení SQLite (čítač odbery_db_lock_errors_total z /metrics).
+
+Použití:
+    python -m bench.generate --database sqlite:///bench.db --scale 0.2
+    python -m bench.loadtest --database sqlite:///bench.db --clients 16 --duration 60 --threads 8
+    python -m bench.loadtest --url http://127.0.0.1:8080 --clients 8    # už běžící server
+
+Klient používá jen standardní knihovnu (urllib + cookie jar), aby výsledky
+neovlivňovala další závislost.
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+SITE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SITE_DIR not in sys.path:
+    sys.path.insert(0, SITE_DIR)
+
+from bench.generate import ADMIN_PIN, JMENA_M, JMENA_Z, PRIJMENI, POZNAMKY, ZAVADY, ZNACKY, MODELY  # noqa: E402
+from bench.routes import RESULTS_DIR, git_commit  # noqa: E402
+from profiler import percentile  # noqa: E402
+
+CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+LOCK_METRIC_RE = re.compile(r'^odbery_db_lock_errors_total(?:\{[^}]*\})? (\S+)$', re.M)
+
+# Váhy akcí pro prodavače a adminy – (název, váha)
+STAFF_MIX = [
+    ('branch_view', 25), ('odber_create', 10), ('odber_status', 10), ('odber_notes', 15),
+    ('reklamace_view', 15), ('reklamace_create', 5), ('reklamace_status', 8),
+]
+ADMIN_MIX = [
+    ('index', 10), ('admin_dashboard', 25), ('admin_statistiky', 20), ('admin_archiv', 20),
+    ('reklamace_view', 15), ('export_csv', 10),
+]
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Přesměrování nesledujeme – 302 po POST je úspěch a měříme jen samotný request."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Stats:
+    """Sdílené výsledky všech klientů (zápis pod zámkem – zátěž generuje server, ne tohle)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.conn_errors = defaultdict(int)
+
+    def record(self, action, status, elapsed_ms):
+        with self.lock:
+            self.latencies[action].append(elapsed_ms)
+            self.statuses[action][status] += 1
+
+    def error(self, action):
+        with self.lock:
+            self.conn_errors[action] += 1
+
+
+class Client:
+    """Jeden přihlášený uživatel s vlastní session (cookie jar) a CSRF tokenem."""
+
+    def __init__(self, base_url, pin, pobocky, odbery, reklamace, stats, rng, timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.pin = pin
+        self.pobocky = pobocky
+        self.odbery = odbery
+        self.reklamace = reklamace
+        self.stats = stats
+        self.rng = rng
+        self.timeout = timeout
+        self.csrf = None
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, action, path, data=None, json_body=None):
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                status, payload = resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        except (urllib.error.URLError, OSError):
+            if action:
+                self.stats.error(action)
+            return None, b''
+        if action:
+            self.stats.record(action, status, (time.perf_counter() - started) * 1000)
+        return status, payload
+
+    def _remember_csrf(self, payload):
+        match = CSRF_RE.search(payload.decode('utf-8', 'replace'))
+        if match:
+            self.csrf = match.group(1)
+
+    def login(self):
+        _status, payload = self.request(None, '/admin/login')
+        self._remember_csrf(payload)
+        status, _ = self.request('login', '/admin/login', data={'pin': self.pin, 'csrf_token': self.csrf or ''})
+        return status == 302
+
+    # --- akce ---------------------------------------------------------------
+
+    def _jmeno(self):
+        prijmeni = self.rng.choice(PRIJMENI)
+        if self.rng.random() < 0.55:
+            return f'{self.rng.choice(JMENA_Z)} {prijmeni[1]}'
+        return f'{self.rng.choice(JMENA_M)} {prijmeni[0]}'
+
+    def _telefon(self):
+        return str(self.rng.choice((6, 7))) + ''.join(str(self.rng.randrange(10)) for _ in range(8))
+
+    def branch_view(self):
+        status, payload = self.request('branch_view', f'/branch/{self.rng.choice(self.pobocky)}')
+        if status == 200:
+            self._remember_csrf(payload)
+
+    def odber_create(self):
+        if not self.csrf:
+            self.branch_view()
+        self.request('odber_create', f'/branch/{self.rng.choice(self.pobocky)}', data={
+            'csrf_token': self.csrf or '',
+            'jmeno': self._jmeno(),
+            'telefon': self._telefon(),
+            'datum': date.today().isoformat(),
+            'castka': str(self.rng.randrange(290, 4990, 10)),
+            'poznamky': self.rng.choice(POZNAMKY) or '',
+        })
+
+    def odber_status(self):
+        self.request('odber_status', f'/update/{self.rng.choice(self.odbery)}',
+                     data={'action': self.rng.choice(('vydano', 'nevyzvednuto'))})
+
+    def odber_notes(self):
+        self.request('odber_notes', f'/update_notes/{self.rng.choice(self.odbery)}',
+                     json_body={'poznamky': f'{self.rng.choice(POZNAMKY[3:])} ({datetime.now():%H:%M:%S})'})
+
+    def reklamace_view(self):
+        status, payload = self.request('reklamace_view', f'/reklamace/branch/{self.rng.choice(self.pobocky)}')
+        if status == 200:
+            self._remember_csrf(payload)
+
+    def reklamace_create(self):
+        if not self.csrf:
+            self.reklamace_view()
+        self.request('reklamace_create', f'/reklamace/branch/{self.rng.choice(self.pobocky)}', data={
+            'csrf_token': self.csrf or '',
+            'zakaznik': self._jmeno(),
+            'telefon': self._telefon(),
+            'znacka': self.rng.choices([z[0] for z in ZNACKY], weights=[z[1] for z in ZNACKY])[0],
+            'model': self.rng.choice(MODELY),
+            'datum_prijmu': date.today().isoformat(),
+            'datum_zakoupeni': (date.today() - timedelta(days=self.rng.randint(10, 600))).isoformat(),
+            'popis_zavady': self.rng.choice(ZAVADY),
+            'stav': 'Čeká',
+        })
+
+    def reklamace_status(self):
+        self.request('reklamace_status', f'/reklamace/{self.rng.choice(self.reklamace)}/status',
+                     data={'action': self.rng.choice(('ceka', 'vymena', 'poslano_usti', 'zamitnuto'))})
+
+    def index(self):
+        self.request('index', '/')
+
+    def admin_dashboard(self):
+        self.request('admin_dashboard', '/admin/dashboard')
+
+    def admin_statistiky(self):
+        self.request('admin_statistiky', f'/admin/statistiky?rok={date.today().year}')
+
+    def admin_archiv(self):
+        self.request('admin_archiv', '/admin/reklamace-archiv')
+
+    def export_csv(self):
+        self.request('export_csv', f'/reklamace/branch/{self.rng.choice(self.pobocky)}/export.csv')
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(database, threads, log_path, workers=1):
+    """Spustí run_waitress.py jako podproces a počká, až /health odpoví."""
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=database, PORT=str(port), WAITRESS_HOST='127.0.0.1',
+               WAITRESS_THREADS=str(threads), WAITRESS_WORKERS=str(workers))
+    log = open(log_path, 'w', encoding='utf-8')
+    proc = subprocess.Popen([sys.executable, os.path.join(SITE_DIR, 'run_waitress.py')],
+                            env=env, stdout=log, stderr=subprocess.STDOUT, cwd=SITE_DIR)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f'Server skončil při startu (kód {proc.returncode}), viz {log_path}')
+        try:
+            with urllib.request.urlopen(base_url + '/health', timeout=2) as resp:
+                if resp.status == 200:
+                    return proc, base_url
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit(f'Server nenastartoval do 60 s, viz {log_path}')
+
+
+def read_lock_errors(base_url, token=''):
+    """Součet odbery_db_lock_errors_total z /metrics (None, pokud metriky nejsou dostupné)."""
+    req = urllib.request.Request(base_url + '/metrics')
+    if token:
+        req.add_header('Authorization', f'Bearer {token}')
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            text = resp.read().decode('utf-8')
+    except (urllib.error.URLError, OSError):
+        return None
+    return sum(float(v) for v in LOCK_METRIC_RE.findall(text))
+
+
+def load_fixtures(database, rng, sample=2000):
+    """Přihlašovací PINy a vzorek ID z databáze – čte se přes modely aplikace."""
+    os.environ['DATABASE_URL'] = database
+    from app import create_app, db, User, Odber, Reklamace, user_pobocky
+    app = create_app()
+
+    with app.app_context():
+        users = User.query.order_by(User.id).all()
+        assignments = defaultdict(set)
+        for user_id, pobocka_id in db.session.execute(db.select(user_pobocky.c.user_id, user_pobocky.c.pobocka_id)):
+            assignments[user_id].add(pobocka_id)
+        staff, admins = [], []
+        for user in users:
+            if not user.pin:
+                continue
+            if user.is_admin():
+                admins.append(user.pin)
+            else:
+                pobocky = assignments[user.id] | ({user.pobocka_id} if user.pobocka_id else set())
+                if pobocky:
+                    staff.append((user.pin, sorted(pobocky)))
+        pobocky_by_id = defaultdict(lambda: {'odbery': [], 'reklamace': []})
+        max_odber = db.session.query(db.func.max(Odber.id)).scalar() or 0
+        max_rekl = db.session.query(db.func.max(Reklamace.id)).scalar() or 0
+        ids = rng.sample(range(1, max_odber + 1), min(sample, max_odber))
+        for oid, pid in db.session.query(Odber.id, Odber.pobocka_id).filter(Odber.id.in_(ids)):
+            pobocky_by_id[pid]['odbery'].append(oid)
+        ids = rng.sample(range(1, max_rekl + 1), min(sample, max_rekl))
+        for rid, pid in db.session.query(Reklamace.id, Reklamace.pobocka_id).filter(Reklamace.id.in_(ids)):
+            pobocky_by_id[pid]['reklamace'].append(rid)
+        all_pobocky = sorted(pobocky_by_id)
+        db.session.remove()
+    return staff, admins, dict(pobocky_by_id), all_pobocky
+
+
+def worker(client, mix, stop_at, max_requests):
+    if not client.login():
+        client.stats.error('login')
+        return
+    actions = [m[0] for m in mix]
+    weights = [m[1] for m in mix]
+    done = 0
+    while time.time() < stop_at and (not max_requests or done < max_requests):
+        getattr(client, client.rng.choices(actions, weights=weights)[0])()
+        done += 1
+
+
+def summarize(stats, elapsed, lock_errors):
+    rows = {}
+    total = errors_5xx = rejected = conn = 0
+    for action in sorted(set(stats.latencies) | set(stats.conn_errors)):
+        lat = stats.latencies.get(action, [])
+        statuses = dict(stats.statuses.get(action, {}))
+        count = len(lat)
+        e5 = sum(n for s, n in statuses.items() if s >= 500)
+        r503 = statuses.get(503, 0)
+        ce = stats.conn_errors.get(action, 0)
+        total += count
+        errors_5xx += e5
+        rejected += r503
+        conn += ce
+        rows[action] = {
+            'count': count,
+            'rps': round(count / elapsed, 2) if elapsed else 0,
+            'p50_ms': round(percentile(lat, 50), 1),
+            'p95_ms': round(percentile(lat, 95), 1),
+            'p99_ms': round(percentile(lat, 99), 1),
+            'statuses': {str(k): v for k, v in sorted(statuses.items())},
+            'errors_5xx': e5,
+            'connection_errors': ce,
+        }
+    all_lat = [v for lat in stats.latencies.values() for v in lat]
+    return {
+        'requests': total,
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(total / elapsed, 2) if elapsed else 0,
+        'p50_ms': round(percentile(all_lat, 50), 1),
+        'p95_ms': round(percentile(all_lat, 95), 1),
+        'p99_ms': round(percentile(all_lat, 99), 1),
+        'errors_5xx': errors_5xx,
+        'rejected_503': rejected,
+        'connection_errors': conn,
+        'error_rate': round((errors_5xx + conn) / (total + conn), 4) if (total + conn) else 0,
+        'sqlite_lock_errors': lock_errors,
+        'actions': rows,
+    }
+
+
+def print_report(summary):
+    print(f"\n{'akce':20} {'počet':>7} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'5xx':>5} {'conn':>5}  stavy")
+    for action, r in summary['actions'].items():
+        print(f"{action:20} {r['count']:>7} {r['rps']:>8.2f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+              f"{r['p99_ms']:>9.1f} {r['errors_5xx']:>5} {r['connection_errors']:>5}  {r['statuses']}")
+    print(f"\nCelkem {summary['requests']} requestů za {summary['elapsed_s']} s = {summary['throughput_rps']} req/s")
+    print(f"Latence p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms")
+    print(f"Chyby: 5xx {summary['errors_5xx']} (z toho 503 {summary['rejected_503']}), "
+          f"spojení {summary['connection_errors']}, chybovost {summary['error_rate'] * 100:.2f} %")
+    lock = summary['sqlite_lock_errors']
+    print(f"Zamčení databáze (database is locked): {'nedostupné' if lock is None else int(lock)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Zátěžový test aplikace pod waitress.')
+    parser.add_argument('--database', default='sqlite:///bench.db')
+    parser.add_argument('--url', help='cílový server (bez spuštění vlastního waitress)')
+    parser.add_argument('--clients', type=int, default=8, help='počet souběžných klientů')
+    parser.add_argument('--admins', type=int, default=1, help='kolik z klientů jsou admini')
+    parser.add_argument('--duration', type=float, default=30, help='délka testu v sekundách')
+    parser.add_argument('--requests', type=int, default=0, help='max. počet requestů na klienta (0 = dle času)')
+    parser.add_argument('--threads', type=int, default=8, help='WAITRESS_THREADS spuštěného serveru')
+    parser.add_argument('--workers', type=int, default=1, help='WAITRESS_WORKERS spuštěného serveru (procesy)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--metrics-token', default=os.environ.get('METRICS_TOKEN', ''))
+    parser.add_argument('--output', help='uložit výsledek jako JSON')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    staff, admins, by_pobocka, all_pobocky = load_fixtures(args.database, rng)
+    if not all_pobocky or (not staff and args.clients > args.admins):
+        raise SystemExit('V databázi nejsou data – nejdřív spusťte python -m bench.generate')
+    admins = admins or [ADMIN_PIN]
+
+    proc = None
+    base_url = args.url
+    if not base_url:
+        os.makedirs(os.path.join(SITE_DIR, 'logs'), exist_ok=True)
+        log_path = os.path.join(SITE_DIR, 'logs', 'loadtest_server.log')
+        proc, base_url = start_server(args.database, args.threads, log_path, args.workers)
+        print(f'Server {base_url} (workerů {args.workers}, vláken {args.threads}), log {log_path}')
+
+    try:
+        stats = Stats()
+        clients = []
+        for i in range(args.clients):
+            client_rng = random.Random(args.seed * 1000 + i)
+            if i < args.admins:
+                pin, pobocky, mix = admins[i % len(admins)], all_pobocky, ADMIN_MIX
+            else:
+                pin, pobocky = staff[i % len(staff)]
+                mix = STAFF_MIX
+            odbery = [o for p in pobocky for o in by_pobocka.get(p, {}).get('odbery', [])]
+            reklamace = [r for p in pobocky for r in by_pobocka.get(p, {}).get('reklamace', [])]
+            if not odbery or not reklamace:
+                pobocky = [p for p in all_pobocky if by_pobocka[p]['odbery'] and by_pobocka[p]['reklamace']][:1] or pobocky
+                odbery = by_pobocka.get(pobocky[0], {}).get('odbery') or [1]
+                reklamace = by_pobocka.get(pobocky[0], {}).get('reklamace') or [1]
+                pin = admins[0]  # fallback: pobočka bez dat -> admin má přístup všude
+            clients.append((Client(base_url, pin, pobocky, odbery, reklamace, stats, client_rng), mix))
+
+        lock_before = read_lock_errors(base_url, args.metrics_token)
+        print(f'{args.clients} klientů ({args.admins} admin), {args.duration:.0f} s…', flush=True)
+        started = time.time()
+        threads = [threading.Thread(target=worker, args=(client, mix, started + args.duration, args.requests), daemon=True)
+                   for client, mix in clients]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - started
+        lock_after = read_lock_errors(base_url, args.metrics_token)
+        lock_errors = lock_after - lock_before if lock_before is not None and lock_after is not None else None
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    summary = summarize(stats, elapsed, lock_errors)
+    print_report(summary)
+
+    commit, dirty = git_commit()
+    summary.update({
+        'commit': commit, 'dirty': dirty, 'datum': datetime.now().isoformat(timespec='seconds'),
+        'database': args.database, 'clients': args.clients, 'admins': args.admins,
+        'waitress_threads': None if args.url else args.threads,
+        'waitress_workers': None if args.url else args.workers,
+    })
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}-{commit or 'nogit'}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f'Výsledky uloženy do {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Audit plánů dotazů: projde hlavní routy, zaznamená každý SQL příkaz a jeho
+EXPLAIN (SQLite: EXPLAIN QUERY PLAN, PostgreSQL: EXPLAIN) a vypíše ty,
+které dělají plný průchod tabulkou bez indexu, řadí přes dočasný B-strom
+nebo obsahují korelovaný poddotaz. Výstup je seskupený podle routy a místa
+volání v app.py (případně šablony), takže je vidět, který kód dotaz poslal.
+
+Použití:
+    python -m bench.generate --database sqlite:///bench.db --scale 0.2
+    python -m bench.plan_audit --database sqlite:///bench.db
+    python -m bench.plan_audit --database postgresql://… --json audit.json --strict
+
+--strict vrací nenulový exit kód, pokud něco najde (pro CI po přidání indexů).
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import traceback
+from collections import OrderedDict
+
+SITE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SITE_DIR not in sys.path:
+    sys.path.insert(0, SITE_DIR)
+
+APP_FILE = os.path.join(SITE_DIR, 'app.py')
+TEMPLATES_DIR = os.path.join(SITE_DIR, 'templates')
+# Malé číselníkové tabulky – plný průchod je u nich levnější než index
+SMALL_TABLES = {'pobocka', 'user', 'users', 'user_pobocky'}
+
+_SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?! USING (?:COVERING )?INDEX)(?: AS \w+)?$')
+_SQLITE_TEMP = re.compile(r'USE TEMP B-TREE')
+_SQLITE_CORRELATED = re.compile(r'CORRELATED')
+_PG_SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+_PG_SORT = re.compile(r'^\s*(?:->\s*)?Sort\b')
+_PG_SUBPLAN = re.compile(r'SubPlan')
+
+
+def classify_plan(dialect_name, plan, include_small=False):
+    """Vrací seznam nálezů [(druh, řádek plánu)] pro jeden plán."""
+    findings = []
+    for line in plan:
+        text = line.strip()
+        if dialect_name == 'sqlite':
+            scan = _SQLITE_SCAN.match(text)
+            if scan and (include_small or scan.group(1) not in SMALL_TABLES):
+                findings.append(('full-scan', text))
+            if _SQLITE_TEMP.search(text):
+                findings.append(('temp-btree', text))
+            if _SQLITE_CORRELATED.search(text):
+                findings.append(('correlated', text))
+        elif dialect_name == 'postgresql':
+            seq = _PG_SEQ_SCAN.search(text)
+            if seq and (include_small or seq.group(1) not in SMALL_TABLES):
+                findings.append(('full-scan', text))
+            if _PG_SORT.match(line):
+                findings.append(('temp-btree', text))
+            if _PG_SUBPLAN.search(text):
+                findings.append(('correlated', text))
+    return findings
+
+
+def call_site(stack=None):
+    """Nejvnitřnější rámec v app.py nebo v šabloně – "app.py:1234 admin_dashboard"."""
+    for frame in reversed(stack or traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename == APP_FILE:
+            return f'app.py:{frame.lineno} {frame.name}'
+        if filename.startswith(TEMPLATES_DIR):
+            return f'{os.path.relpath(filename, SITE_DIR)}:{frame.lineno}'
+    return '(mimo app.py)'
+
+
+def audit(routes=None, include_small=False):
+    from sqlalchemy import event
+    from app import create_app, db, Pobocka, Odber, Reklamace
+    from bench.routes import build_routes
+    from slow_query import explain
+
+    app = create_app({'WTF_CSRF_ENABLED': False})
+    captured = []
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            captured.append((statement, parameters, call_site()))
+
+    with app.app_context():
+        route_list = build_routes(db, Pobocka, Odber, Reklamace)
+        engine = db.engine
+        db.session.remove()
+
+    client = app.test_client()
+    if client.post('/admin/login', data={'pin': '0000'}).status_code != 302:
+        raise SystemExit('Přihlášení admina (PIN 0000) selhalo – je databáze vygenerovaná přes bench.generate?')
+
+    results = OrderedDict()
+    raw = engine.raw_connection()
+    try:
+        for name, url in route_list:
+            if routes and name not in routes:
+                continue
+            captured.clear()
+            event.listen(engine, 'before_cursor_execute', _capture)
+            try:
+                status = client.get(url).status_code
+            finally:
+                event.remove(engine, 'before_cursor_execute', _capture)
+            sites = OrderedDict()
+            seen = set()
+            for statement, parameters, site in captured:
+                if (statement, site) in seen:
+                    continue
+                seen.add((statement, site))
+                try:
+                    plan = explain(raw.driver_connection, engine.dialect.name, statement, parameters)
+                except Exception as e:
+                    plan = [f'(EXPLAIN selhal: {e})']
+                findings = classify_plan(engine.dialect.name, plan, include_small)
+                if findings:
+                    sites.setdefault(site, []).append({
+                        'sql': ' '.join(statement.split()),
+                        'plan': plan,
+                        'findings': findings,
+                    })
+            results[name] = {'url': url, 'status': status, 'statements': len(captured), 'sites': sites}
+    finally:
+        raw.close()
+    return engine.dialect.name, results
+
+
+def print_report(dialect_name, results):
+    total = 0
+    for name, r in results.items():
+        count = sum(len(items) for items in r['sites'].values())
+        total += count
+        marker = 'OK' if not count else f'{count} nálezů'
+        print(f"\n== {name} ({r['url']}) – {r['statements']} SQL, {marker}")
+        for site, items in r['sites'].items():
+            print(f'  {site}')
+            for item in items:
+                kinds = ', '.join(sorted({k for k, _ in item['findings']}))
+                sql = item['sql'] if len(item['sql']) <= 160 else item['sql'][:157] + '...'
+                print(f'    [{kinds}] {sql}')
+                for _kind, line in item['findings']:
+                    print(f'        {line}')
+    print(f'\n{dialect_name}: celkem {total} podezřelých dotazů')
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Najde plné průchody tabulkou, řazení přes temp B-tree a korelované poddotazy podle rout.')
+    parser.add_argument('--database', default='sqlite:///bench.db')
+    parser.add_argument('--route', action='append', help='auditovat jen vybrané routy (lze opakovat)')
+    parser.add_argument('--all-tables', action='store_true', help='hlásit i průchody malými číselníky (pobočky, uživatelé)')
+    parser.add_argument('--json', help='uložit výsledek jako JSON')
+    parser.add_argument('--strict', action='store_true', help='nenulový exit kód, pokud je nějaký nález')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = args.database
+    dialect_name, results = audit(routes=args.route, include_small=args.all_tables)
+    total = print_report(dialect_name, results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'dialect': dialect_name, 'routes': results}, f, ensure_ascii=False, indent=2)
+    if args.strict and total:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Měření času jednotlivých rout přes Flask test client (bez sítě a waitress).
+
+Každá routa se zavolá jednou na zahřátí a pak --repeat krát; do JSON se uloží
+min/medián/p95/max času, počet SQL dotazů, stavový kód a velikost odpovědi.
+Výsledek se ukládá do bench/results/ s commitem v názvu, aby šly porovnat
+běhy napříč commity (--compare starsi.json).
+
+Použití:
+    python -m bench.generate --database sqlite:///bench.db
+    python -m bench.routes --database sqlite:///bench.db --repeat 5
+    python -m bench.routes --database sqlite:///bench.db --compare bench/results/<soubor>.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+
+SITE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SITE_DIR not in sys.path:
+    sys.path.insert(0, SITE_DIR)
+
+RESULTS_DIR = os.path.join(SITE_DIR, 'bench', 'results')
+
+
+def git_commit():
+    """Krátký hash HEAD a příznak neuložených změn (nebo None mimo git)."""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=SITE_DIR,
+                                         stderr=subprocess.DEVNULL, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=SITE_DIR, stderr=subprocess.DEVNULL, text=True).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+
+def build_routes(db, Pobocka, Odber, Reklamace):
+    """Seznam (název, URL) – pobočka s největším provozem, ať měříme nejhorší případ."""
+    top_odber = (db.session.query(Odber.pobocka_id, db.func.count(Odber.id))
+                 .group_by(Odber.pobocka_id).order_by(db.func.count(Odber.id).desc()).first())
+    top_reklamace = (db.session.query(Reklamace.pobocka_id, db.func.count(Reklamace.id))
+                     .group_by(Reklamace.pobocka_id).order_by(db.func.count(Reklamace.id).desc()).first())
+    fallback = db.session.query(db.func.min(Pobocka.id)).scalar() or 1
+    pid = top_odber[0] if top_odber else fallback
+    rid = top_reklamace[0] if top_reklamace else fallback
+    rok = date.today().year
+    return [
+        ('index', '/'),
+        ('branch', f'/branch/{pid}'),
+        ('reklamace_branch', f'/reklamace/branch/{rid}'),
+        ('reklamace_branch_filtr', f'/reklamace/branch/{rid}?stav=Čeká&q=Nov'),
+        ('reklamace_branch_archiv', f'/reklamace/branch/{rid}?archived=1'),
+        ('admin_dashboard', '/admin/dashboard'),
+        ('admin_statistiky', f'/admin/statistiky?rok={rok}'),
+        ('admin_statistiky_mesic', f'/admin/statistiky?rok={rok}&mesic=3&pobocka={rid}'),
+        ('admin_reklamace_archiv', '/admin/reklamace-archiv'),
+        ('admin_reklamace_archiv_hledani', '/admin/reklamace-archiv?q=Nike&archived=1'),
+        ('admin_historie', f'/admin/historie?pobocka={pid}&q=odběr'),
+        ('reklamace_export_csv', f'/reklamace/branch/{rid}/export.csv'),
+        ('admin_export_all', '/admin/export/all.csv'),
+        ('admin_export_excel', '/admin/export/all.xlsx'),
+    ]
+
+
+def row_counts(db, models):
+    return {m.__tablename__: db.session.query(db.func.count(m.id)).scalar() for m in models}
+
+
+def run(repeat=5, only=None, verbose=True):
+    from app import create_app, db, profiler, Pobocka, Odber, Akce, Reklamace, ReklamaceLog, User
+    from profiler import percentile
+
+    app = create_app({'WTF_CSRF_ENABLED': False})
+    last = {}
+    profiler.listeners.append(lambda endpoint, record: last.update(record))
+
+    with app.app_context():
+        routes = build_routes(db, Pobocka, Odber, Reklamace)
+        counts = row_counts(db, (Pobocka, User, Odber, Akce, Reklamace, ReklamaceLog))
+        db.session.remove()
+
+    client = app.test_client()
+    login = client.post('/admin/login', data={'pin': '0000'})
+    if login.status_code != 302:
+        raise SystemExit('Přihlášení admina (PIN 0000) selhalo – je databáze vygenerovaná přes bench.generate?')
+
+    results = {}
+    for name, url in routes:
+        if only and name not in only:
+            continue
+        client.get(url)  # zahřátí: kompilace šablon, cache SQL
+        times, sql_counts = [], []
+        status = size = None
+        for _ in range(repeat):
+            last.clear()
+            started = time.perf_counter()
+            response = client.get(url)
+            body = response.get_data()
+            times.append((time.perf_counter() - started) * 1000)
+            sql_counts.append(last.get('sql_count', 0))
+            status, size = response.status_code, len(body)
+        times.sort()
+        results[name] = {
+            'url': url,
+            'status': status,
+            'bytes': size,
+            'sql_count': max(sql_counts),
+            'min_ms': round(times[0], 2),
+            'median_ms': round(statistics.median(times), 2),
+            'p95_ms': round(percentile(times, 95), 2),
+            'max_ms': round(times[-1], 2),
+        }
+        if verbose:
+            r = results[name]
+            print(f"{name:34} {r['status']:>4} {r['median_ms']:>10.1f} ms {r['p95_ms']:>10.1f} ms "
+                  f"{r['sql_count']:>6} SQL {r['bytes'] / 1024:>9.1f} kB", flush=True)
+
+    commit, dirty = git_commit()
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'datum': datetime.now().isoformat(timespec='seconds'),
+        'database': app.config['SQLALCHEMY_DATABASE_URI'],
+        'python': platform.python_version(),
+        'repeat': repeat,
+        'rows': counts,
+        'routes': results,
+    }
+
+
+def compare(old, new):
+    """Vypíše změnu mediánu a počtu SQL dotazů proti staršímu výsledku."""
+    print(f"\nPorovnání s {old.get('commit')} ({old.get('datum')}):")
+    for name, r in new['routes'].items():
+        before = old.get('routes', {}).get(name)
+        if not before:
+            print(f'{name:34} (nová routa)')
+            continue
+        delta = (r['median_ms'] - before['median_ms']) / before['median_ms'] * 100 if before['median_ms'] else 0
+        print(f"{name:34} {before['median_ms']:>10.1f} -> {r['median_ms']:>10.1f} ms ({delta:+.0f} %)  "
+              f"SQL {before['sql_count']} -> {r['sql_count']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Změří časy rout přes Flask test client a uloží JSON.')
+    parser.add_argument('--database', default='sqlite:///bench.db')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--route', action='append', help='měřit jen vybrané routy (lze opakovat)')
+    parser.add_argument('--output', help='cesta k JSON (default bench/results/<datum>-<commit>.json)')
+    parser.add_argument('--compare', help='starší JSON výsledek k porovnání')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = args.database
+    print(f"{'routa':34} {'kód':>4} {'medián':>13} {'p95':>13} {'dotazy':>10} {'velikost':>12}")
+    result = run(repeat=max(args.repeat, 1), only=args.route)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{result['commit'] or 'nogit'}{'-dirty' if result['dirty'] else ''}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f'\nVýsledky uloženy do {output}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Měření studeného startu workeru: import app.py, create_app() a první request.
+
+Každé měření běží v novém procesu Pythonu (jako nový worker waitress nebo
+sběr testů), vypíše se medián a maximum přes --repeat běhů. Zároveň hlídá,
+že import nesahá do databáze (SQL příkazy před prvním requestem) a nenačítá
+openpyxl. S --warmup se před prvním requestem spustí warm_up_app() – rozdíl
+mezi prvním a druhým requestem (stránka se šablonou) ukazuje, co zahřátí ušetří.
+S --importtime vypíše nejpomalejší moduly z `python -X importtime`.
+
+Použití:
+    python -m bench.startup --database sqlite:///bench.db --repeat 5
+    python -m bench.startup --database sqlite:///bench.db --warmup
+    python -m bench.startup --importtime
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SITE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Spouští se v čistém podprocesu, výsledek vrací jako JSON na posledním řádku
+_PROBE = r'''
+import json, os, sys, time
+t0 = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+sql = []
+event.listen(Engine, 'before_cursor_execute', lambda *a: sql.append(a[2]))
+t1 = time.perf_counter()
+import app as app_module
+t2 = time.perf_counter()
+app = app_module.create_app({'WTF_CSRF_ENABLED': False})
+t3 = time.perf_counter()
+sql_before_request = len(sql)
+if os.environ.get('BENCH_WARMUP') == '1':
+    app_module.warm_up_app()
+t4 = time.perf_counter()
+client = app.test_client()
+status = client.get('/admin/login').status_code
+t5 = time.perf_counter()
+client.get('/admin/login')
+t6 = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t2 - t1) * 1000,
+    'create_app_ms': (t3 - t2) * 1000,
+    'warmup_ms': (t4 - t3) * 1000,
+    'first_request_ms': (t5 - t4) * 1000,
+    'second_request_ms': (t6 - t5) * 1000,
+    'total_ms': (t5 - t0) * 1000,
+    'sql_before_request': sql_before_request,
+    'openpyxl_loaded': 'openpyxl' in sys.modules,
+    'status': status,
+}))
+'''
+
+METRICS = ('import_ms', 'create_app_ms', 'warmup_ms', 'first_request_ms', 'second_request_ms', 'total_ms')
+
+
+def probe(database, warmup=False):
+    env = dict(os.environ, DATABASE_URL=database, BENCH_WARMUP='1' if warmup else '0')
+    out = subprocess.run([sys.executable, '-c', _PROBE], cwd=SITE_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def import_profile(limit=15):
+    """Nejpomalější moduly (kumulativně) při importu app.py."""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=SITE_DIR,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self, cumulative, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        rows.append((int(cumulative), name))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Změří studený start workeru (import, create_app, první request).')
+    parser.add_argument('--database', default='sqlite:///bench.db')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', action='store_true', help='před prvním requestem spustit warm_up_app()')
+    parser.add_argument('--importtime', action='store_true', help='vypsat nejpomalejší importované moduly')
+    args = parser.parse_args(argv)
+
+    runs = [probe(args.database, args.warmup) for _ in range(max(args.repeat, 1))]
+    for metric in METRICS:
+        values = [r[metric] for r in runs]
+        print(f'{metric:18} medián {statistics.median(values):8.1f} ms   max {max(values):8.1f} ms')
+    last = runs[-1]
+    print(f"SQL před prvním requestem: {max(r['sql_before_request'] for r in runs)}, "
+          f"openpyxl načten: {'ano' if any(r['openpyxl_loaded'] for r in runs) else 'ne'}, "
+          f"/admin/login: {last['status']}")
+
+    if args.importtime:
+        print('\nNejpomalejší importy (kumulativně):')
+        for cumulative, name in import_profile():
+            print(f'{cumulative / 1000:10.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Horká a studená data – archivované reklamace mimo živou tabulku.
+
+Archivované reklamace (archived = True) se po `ARCHIVE_MOVE_DAYS` dnech dávkově
+přesunou do tabulky `reklamace_archive` (a jejich záznamy z reklamace_log do
+`reklamace_log_archive`), takže tabulka `reklamace` drží jen otevřené a čerstvě
+archivované reklamace a dotazy poboček i indexy zůstávají malé.
+
+Studené tabulky mohou ležet ve vlastním SQLite souboru (`ARCHIVE_DB`): připojí
+se ke každému spojení příkazem ATTACH jako databáze `archive`. SQLite hledá
+nekvalifikované názvy tabulek i v připojených databázích, takže dotazy zůstávají
+stejné a archiv i exporty čtou obě tabulky jedním dotazem přes UNION ALL
+(`union_view`). Bez ARCHIVE_DB (a vždy na PostgreSQL) jsou studené tabulky ve
+stejné databázi.
+"""
+
+import os
+
+from sqlalchemy import Column, Index, MetaData, Table, delete, func, insert, select, union_all
+
+ATTACH_NAME = 'archive'
+
+
+def cold_table(metadata, source, name, keep_ids=True, indexes=()):
+    """Kopie sloupců horké tabulky bez cizích klíčů (připojený soubor je nevynutí).
+
+    keep_ids=False: vlastní autoincrement id – pro řádky, jejichž id se na
+    horké tabulce může po přesunu znovu přidělit (SQLite bere MAX(id) + 1).
+    """
+    columns = []
+    for column in source.columns:
+        if column.primary_key:
+            if keep_ids:
+                columns.append(Column(column.name, column.type, primary_key=True, autoincrement=False))
+            else:
+                columns.append(Column(column.name, column.type, primary_key=True))
+        else:
+            columns.append(Column(column.name, column.type, nullable=column.nullable))
+    table = Table(name, metadata, *columns, info={'cold': True})
+    for names in indexes:
+        Index(f"ix_{name}_{'_'.join(names)}", *[table.c[n] for n in names])
+    return table
+
+
+def cold_tables(metadata):
+    return [t for t in metadata.sorted_tables if t.info.get('cold')]
+
+
+def attach(dbapi_connection, path):
+    """ATTACH souboru archivu ke každému novému SQLite spojení (volá connect listener)."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f'ATTACH DATABASE ? AS {ATTACH_NAME}', (path,))
+        cursor.execute(f'PRAGMA {ATTACH_NAME}.journal_mode=WAL')
+    finally:
+        cursor.close()
+
+
+def resolve_path(path, instance_path):
+    """Relativní cesta k archivu je vůči instance/ – stejně jako sqlite:///odbery.db."""
+    if not path or os.path.isabs(path):
+        return path
+    return os.path.join(instance_path, path)
+
+
+def is_attached(conn):
+    if conn.dialect.name != 'sqlite':
+        return False
+    return ATTACH_NAME in {row[1] for row in conn.exec_driver_sql('PRAGMA database_list')}
+
+
+def create_cold_tables(conn, metadata):
+    """Vytvoří studené tabulky – v připojeném souboru archivu, pokud je, jinak vedle horkých."""
+    schema = ATTACH_NAME if is_attached(conn) else None
+    target = MetaData()
+    for table in cold_tables(metadata):
+        table.to_metadata(target, schema=schema).create(conn, checkfirst=True)
+
+
+def union_view(hot, cold, name, names=None):
+    """Poddotaz hot UNION ALL cold – jen vyjmenované sloupce (None = všechny, pro aliased(Model, ...)).
+
+    SQLite poddotaz s UNION ALL v joinu nebo pod agregací nezplošťuje a čte
+    všechny jeho sloupce – seznamy a statistiky proto berou jen ty, které potřebují.
+    """
+    names = names or [c.name for c in hot.columns]
+    return union_all(
+        select(*[hot.c[n] for n in names]),
+        select(*[cold.c[n] for n in names]),
+    ).subquery(name)
+
+
+def move_batch(conn, hot, cold, hot_log, cold_log, ids):
+    """Přesune reklamace `ids` i s logem. Nejdřív zápis do archivu, pak smazání z horké tabulky.
+
+    S připojeným souborem není commit atomický přes oba soubory – po pádu mezi
+    nimi zůstane řádek v obou a další běh ho v archivu přepíše (proto ten DELETE).
+    """
+    conn.execute(delete(cold_log).where(cold_log.c.reklamace_id.in_(ids)))
+    conn.execute(delete(cold).where(cold.c.id.in_(ids)))
+    names = [c.name for c in hot.columns]
+    conn.execute(insert(cold).from_select(names, select(*[hot.c[n] for n in names]).where(hot.c.id.in_(ids))))
+    log_names = [c.name for c in hot_log.columns if not c.primary_key]
+    logs = conn.execute(insert(cold_log).from_select(
+        log_names, select(*[hot_log.c[n] for n in log_names]).where(hot_log.c.reklamace_id.in_(ids))
+        .order_by(hot_log.c.id))).rowcount
+    conn.execute(delete(hot_log).where(hot_log.c.reklamace_id.in_(ids)))
+    conn.execute(delete(hot).where(hot.c.id.in_(ids)))
+    return logs
+
+
+def move_archived(engine, hot, cold, hot_log, cold_log, before, batch_size=500):
+    """Dávkově přesune reklamace archivované před `before`. Každá dávka je vlastní transakce.
+
+    Reklamace s nejvyšším id v horké tabulce zůstává – SQLite by jinak její id
+    přidělil nové reklamaci a v archivu by byly dvě se stejným číslem.
+    Vrací (počet reklamací, počet záznamů logu).
+    """
+    moved = logs = 0
+    max_id = select(func.max(hot.c.id)).scalar_subquery()
+    while True:
+        with engine.begin() as conn:
+            ids = [row[0] for row in conn.execute(
+                select(hot.c.id)
+                .where(hot.c.archived == True, hot.c.archived_at < before, hot.c.id < max_id)  # noqa: E712
+                .order_by(hot.c.id).limit(batch_size))]
+            if not ids:
+                return moved, logs
+            logs += move_batch(conn, hot, cold, hot_log, cold_log, ids)
+            moved += len(ids)
+
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Liveness a readiness – oddělené kontroly pro load balancer a monitoring.
+
+/health/live jen potvrdí, že proces odpovídá (bez databáze) – restartovat
+worker má smysl jen tehdy, když neodpovídá vůbec. /health/ready projde
+registrované kontroly (verze migrací, saturace poolu, latence zápisového
+zámku, velikost WAL, zahřátí, fronty) a každou porovná s prahy z konfigurace:
+'ok', 'warn' (instance je zpomalená, ale obsluhuje) nebo 'fail' (503 –
+balancer má poslat provoz jinam).
+"""
+
+import os
+import time
+
+OK = 'ok'
+WARN = 'warn'
+FAIL = 'fail'
+_RANK = {OK: 0, WARN: 1, FAIL: 2}
+
+
+def grade(value, warn, fail):
+    """Stav podle prahů (None = práh vypnutý); vyšší hodnota je horší."""
+    if fail is not None and value >= fail:
+        return FAIL
+    if warn is not None and value >= warn:
+        return WARN
+    return OK
+
+
+def pool_usage(engine):
+    """(vypůjčená připojení, kapacita poolu) – kapacita None u poolů bez limitu."""
+    pool = engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return 0, None
+    capacity = pool.size() + max(pool._max_overflow, 0) if hasattr(pool, 'size') else None
+    return pool.checkedout(), capacity or None
+
+
+def wal_bytes(engine):
+    """Velikost SQLite WAL souboru (None mimo souborovou SQLite)."""
+    if engine.dialect.name != 'sqlite' or engine.url.database in (None, '', ':memory:'):
+        return None
+    wal_path = engine.url.database + '-wal'
+    return os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+
+
+def write_probe_ms(engine, timeout_ms):
+    """Jak dlouho trvá získat zápisový zámek – prázdná transakce, nic se nezapíše.
+
+    SQLite: BEGIN IMMEDIATE čeká na zámek jiných zapisovatelů (nejvýš timeout_ms).
+    PostgreSQL: txid_current() přidělí transakci ID jako každý zápis.
+    """
+    with engine.connect() as conn:
+        started = time.perf_counter()
+        if engine.dialect.name == 'sqlite':
+            conn.exec_driver_sql(f'PRAGMA busy_timeout={int(timeout_ms)}')
+            try:
+                conn.exec_driver_sql('BEGIN IMMEDIATE')
+                conn.exec_driver_sql('ROLLBACK')
+            finally:
+                conn.exec_driver_sql('PRAGMA busy_timeout=15000')
+        else:
+            if engine.dialect.name == 'postgresql':
+                conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{int(timeout_ms)}ms'")
+                conn.exec_driver_sql('SELECT txid_current()')
+            else:
+                conn.exec_driver_sql('SELECT 1')
+            conn.rollback()
+        return (time.perf_counter() - started) * 1000
+
+
+class Readiness:
+    """Registr kontrol pro /health/ready. Kontrola vrací dict s klíčem 'status' a hodnotami."""
+
+    def __init__(self, app=None):
+        self.checks = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['readiness'] = self
+
+    def check(self, name):
+        def decorator(func):
+            self.checks[name] = func
+            return func
+        return decorator
+
+    def run(self):
+        """Spustí všechny kontroly; výjimka v kontrole = 'fail'. Vrací (celkový stav, výsledky)."""
+        results = {}
+        overall = OK
+        for name, func in self.checks.items():
+            started = time.perf_counter()
+            try:
+                result = dict(func())
+            except Exception as e:
+                result = {'status': FAIL, 'error': str(e)}
+            result['ms'] = round((time.perf_counter() - started) * 1000, 1)
+            results[name] = result
+            if _RANK[result['status']] > _RANK[overall]:
+                overall = result['status']
+        return overall, results
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Hromadný import odběrů a reklamací z CSV a XLSX (převod z papíru nebo jiného systému).
+
+Soubor se čte po řádcích – CSV přes csv.reader nad proudem, XLSX přes
+openpyxl v režimu read_only – a celý se do paměti nenačítá. Každý řádek se
+ověří pravidly odvozenými z validátorů formuláře, přes který by jinak vznikl
+(PridatOdberForm, ReklamaceForm: povinná pole, délky, 9místný telefon, volby
+výběru), plus kontrolou navíc (záruka 2 roky u reklamací). Platné řádky se
+vkládají po dávkách `IMPORT_BATCH_SIZE` jedním executemany a ke každé dávce
+se stejně hromadně zapíše auditní záznam (Akce / ReklamaceLog). Dávka je
+vlastní krátká transakce; chybné řádky se přeskočí a vrátí s číslem řádku.
+"""
+
+import csv
+import io
+import re
+import time
+import unicodedata
+from datetime import date, datetime
+
+from sqlalchemy import select
+from wtforms import BooleanField, DateField, FloatField, SelectField
+from wtforms.fields.core import UnboundField
+from wtforms.validators import DataRequired, Length, Regexp
+
+CSV_DELIMITERS = ',;\t'
+TRUE_VALUES = {'1', 'ano', 'a', 'true', 'yes', 'y', 'x'}
+FALSE_VALUES = {'', '0', 'ne', 'n', 'false', 'no'}
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d. %m. %Y', '%d.%m.%y', '%d/%m/%Y')
+MAX_ERRORS = 1000  # víc chyb se jen počítá, přehled by byl nečitelný
+
+
+class RowError(ValueError):
+    """Řádek nejde importovat – zpráva jde do přehledu chyb."""
+
+
+def normalize_header(text):
+    """'Datum přijmu' i 'datum_prijmu' → 'datumprijmu' (bez diakritiky, mezer a podtržítek)."""
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+
+def zaruka_do(datum_zakoupeni):
+    """Konec dvouleté záruky; zboží koupené 29. 2. má záruku do 28. 2."""
+    try:
+        return date(datum_zakoupeni.year + 2, datum_zakoupeni.month, datum_zakoupeni.day)
+    except ValueError:
+        return date(datum_zakoupeni.year + 2, 2, 28)
+
+
+def normalize_phone(value):
+    """'+420 777 123 456', '420777123456' i '777123456' → '777123456' (pravidlo formuláře je 9 číslic)."""
+    digits = re.sub(r'[\s\-/]', '', value)
+    if digits.startswith('+'):
+        digits = digits[1:]
+    if len(digits) == 12 and digits.startswith('420'):
+        digits = digits[3:]
+    return digits
+
+
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise RowError(f'neplatné datum {value!r} (očekáváno RRRR-MM-DD nebo DD.MM.RRRR)')
+
+
+def parse_float(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value.replace(' ', '').replace('\xa0', '').replace('Kč', '').replace(',', '.'))
+    except ValueError:
+        raise RowError(f'neplatné číslo {value!r}')
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise RowError(f'neplatná hodnota ano/ne {value!r}')
+
+
+class FieldRule:
+    """Pravidlo jednoho sloupce importu – typ, povinnost, max. délka, regex, povolené volby."""
+
+    def __init__(self, name, label=None, kind='str', required=False, max_len=None, regex=None,
+                 regex_message=None, required_message=None, choices=None):
+        self.name = name
+        self.label = label or name
+        self.kind = kind
+        self.required = required
+        self.max_len = max_len
+        self.regex = re.compile(regex) if isinstance(regex, str) else regex
+        self.regex_message = regex_message
+        self.required_message = required_message
+        self.choices = choices
+
+    def parse(self, raw):
+        """Hodnota buňky → hodnota pro tabulku (None = prázdné). Chyba = RowError."""
+        if raw is None or (isinstance(raw, str) and not raw.strip()):
+            if self.required:
+                raise RowError(self.required_message or f'chybí {self.label}')
+            return False if self.kind == 'bool' else None
+        if self.kind == 'date':
+            return parse_date(raw.strip() if isinstance(raw, str) else raw)
+        if self.kind == 'float':
+            return parse_float(raw.strip() if isinstance(raw, str) else raw)
+        if self.kind == 'bool':
+            return parse_bool(raw)
+        value = str(raw).strip()
+        if isinstance(raw, float) and raw.is_integer():
+            value = str(int(raw))  # XLSX vrací čísla (telefon) jako float
+        if self.name == 'telefon':
+            value = normalize_phone(value)
+        if self.max_len and len(value) > self.max_len:
+            raise RowError(f'{self.label}: max. {self.max_len} znaků')
+        if self.regex and not self.regex.match(value):
+            raise RowError(self.regex_message or f'{self.label}: neplatný formát')
+        if self.choices and value not in self.choices:
+            raise RowError(f"{self.label}: {value!r} není jedna z hodnot {', '.join(self.choices)}")
+        return value
+
+
+def form_rules(form_class, exclude=(), required=(), optional=()):
+    """Pravidla sloupců z validátorů WTForms formuláře – import ověřuje totéž co webový formulář.
+
+    `required` doplní povinnost, kterou view kontroluje mimo formulář (např. datum zakoupení);
+    `optional` smí v souboru chybět, hodnotu doplní build (např. výchozí stav).
+    """
+    unbound = sorted(((name, field) for name in dir(form_class)
+                      if isinstance(field := getattr(form_class, name), UnboundField)),
+                     key=lambda item: item[1].creation_counter)
+    rules = []
+    for name, field in unbound:
+        if name in exclude:
+            continue
+        label = field.args[0] if field.args else field.kwargs.get('label', name)
+        rule = FieldRule(name, label, required=name in required)
+        cls = field.field_class
+        if issubclass(cls, DateField):
+            rule.kind = 'date'
+        elif issubclass(cls, FloatField):
+            rule.kind = 'float'
+        elif issubclass(cls, BooleanField):
+            rule.kind = 'bool'
+        elif issubclass(cls, SelectField) and field.kwargs.get('choices'):
+            rule.choices = [choice[0] for choice in field.kwargs['choices']]
+        for validator in field.kwargs.get('validators') or ():
+            if isinstance(validator, DataRequired) and name not in optional:
+                rule.required = True
+                rule.required_message = validator.message
+            elif isinstance(validator, Length) and validator.max != -1:
+                rule.max_len = validator.max
+            elif isinstance(validator, Regexp):
+                rule.regex = validator.regex
+                rule.regex_message = validator.message
+        rules.append(rule)
+    return rules
+
+
+class ImportSpec:
+    """Co se importuje: pravidla sloupců, tvorba řádku tabulky, kontrola navíc a auditní záznam.
+
+    build(values, ctx) → dict pro tabulku; check(values) → None nebo text chyby;
+    log_text(values) → text auditního záznamu v log_table (cizí klíč log_fk).
+    """
+
+    def __init__(self, table, rules, build, log_table, log_fk, log_text, check=None):
+        self.table = table
+        self.rules = rules
+        self.build = build
+        self.log_table = log_table
+        self.log_fk = log_fk
+        self.log_text = log_text
+        self.check = check
+
+    def columns(self, header):
+        """Mapování hlavičky souboru na pravidla – podle názvu pole i popisku formuláře."""
+        by_key = {}
+        for rule in self.rules:
+            by_key.setdefault(normalize_header(rule.name), rule)
+            by_key.setdefault(normalize_header(rule.label), rule)
+        mapping = {}
+        for column in header:
+            rule = by_key.get(normalize_header(column))
+            if rule is not None and rule.name not in mapping.values():
+                mapping[column] = rule.name
+        missing = [r.label for r in self.rules if r.required and r.name not in mapping.values()]
+        if missing:
+            raise RowError(f"v hlavičce chybí povinné sloupce: {', '.join(missing)}")
+        return mapping
+
+    def validate(self, row, mapping):
+        rules = {rule.name: rule for rule in self.rules}
+        values = {}
+        errors = []
+        for name, rule in rules.items():
+            column = next((c for c, n in mapping.items() if n == name), None)
+            try:
+                values[name] = rule.parse(row.get(column) if column is not None else None)
+            except RowError as e:
+                errors.append(str(e))
+        if not errors and self.check:
+            error = self.check(values)
+            if error:
+                errors.append(error)
+        if errors:
+            raise RowError('; '.join(errors))
+        return values
+
+
+def read_rows(stream, filename):
+    """(číslo řádku, {sloupec: hodnota}) ze souboru CSV nebo XLSX – bez načtení celého souboru.
+
+    `stream` je binární soubor (upload z formuláře nebo open(..., 'rb') z CLI).
+    Prvním prvkem je seznam sloupců hlavičky (číslo řádku 1).
+    """
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        try:
+            # openpyxl je těžký import – jen při importu XLSX
+            from openpyxl import load_workbook
+        except ImportError:
+            raise RowError('Import XLSX není dostupný. Nainstalujte openpyxl: pip install openpyxl')
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = [str(c).strip() if c is not None else '' for c in next(rows, ())]
+            yield 1, header
+            for line, cells in enumerate(rows, start=2):
+                yield line, dict(zip(header, cells))
+        finally:
+            workbook.close()
+        return
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    first = text.readline()
+    delimiter = max(CSV_DELIMITERS, key=first.count)
+    # mezery za oddělovačem („jmeno; telefon“) patří pryč i v klíčích řádků, jinak je mapování nenajde
+    header = [h.strip() for h in next(csv.reader([first], delimiter=delimiter), [])]
+    yield 1, header
+    reader = csv.reader(text, delimiter=delimiter)
+    for line, cells in enumerate(reader, start=2):
+        yield line, dict(zip(header, cells))
+
+
+def run_import(engine, spec, rows, pobocka_id, uzivatel, now, batch_size=2000, dry_run=False):
+    """Ověří řádky a platné vloží po dávkách (dávka = transakce: executemany tabulky + auditu).
+
+    Vrací přehled: počet řádků, importovaných, dávek, chyby [(řádek, text)], čas v ms.
+    """
+    started = time.perf_counter()
+    result = {'rows': 0, 'imported': 0, 'batches': 0, 'errors': [], 'error_count': 0}
+    ctx = {'pobocka_id': pobocka_id, 'uzivatel': uzivatel, 'now': now}
+
+    def error(line, message):
+        result['error_count'] += 1
+        if len(result['errors']) < MAX_ERRORS:
+            result['errors'].append((line, message))
+
+    def finish():
+        # čas patří do přehledu i u prázdného souboru nebo chybné hlavičky
+        result['ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    def flush(batch):
+        if not batch or dry_run:
+            result['imported'] += 0 if dry_run else len(batch)
+            return
+        table, log_table = spec.table, spec.log_table
+        records = [record for record, _values in batch]
+        with engine.begin() as conn:
+            if conn.dialect.name == 'sqlite':
+                # SQLite seřazený RETURNING u executemany neumí (SQLAlchemy by vkládal po řádku);
+                # zapisovatel drží zámek celé databáze, takže posledních N id jsou právě vložené řádky
+                conn.execute(table.insert(), records)
+                ids = sorted(conn.execute(select(table.c.id).order_by(table.c.id.desc())
+                                          .limit(len(records))).scalars())
+            else:
+                # PostgreSQL: INSERT … VALUES (…), (…) RETURNING id ve stejném pořadí jako řádky
+                ids = conn.execute(table.insert().returning(table.c.id, sort_by_parameter_order=True),
+                                   records).scalars().all()
+            conn.execute(log_table.insert(), [
+                {spec.log_fk: new_id, 'uzivatel': uzivatel, 'akce': spec.log_text(values), 'datum': now,
+                 'pobocka_id': pobocka_id}
+                for new_id, (_record, values) in zip(ids, batch)])
+        result['imported'] += len(batch)
+        result['batches'] += 1
+
+    rows = iter(rows)
+    try:
+        _line, header = next(rows)
+        mapping = spec.columns(header)
+    except StopIteration:
+        error(1, 'prázdný soubor')
+        return finish()
+    except RowError as e:
+        error(1, str(e))
+        return finish()
+    batch = []
+    for line, row in rows:
+        if not any(v not in (None, '') and not (isinstance(v, str) and not v.strip()) for v in row.values()):
+            continue  # prázdný řádek (Excel je často má na konci)
+        result['rows'] += 1
+        try:
+            values = spec.validate(row, mapping)
+        except RowError as e:
+            error(line, str(e))
+            continue
+        if dry_run:
+            result['imported'] += 1
+            continue
+        batch.append((spec.build(values, ctx), values))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    flush(batch)
+    return finish()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Asynchronní logování – request vlákno jen vloží záznam do fronty.
+
+Souborové handlery (logs/app.log, logs/slow_queries.log, logs/access.log) se
+přesunou za `QueueListener`, který je obsluhuje v jednom vlákně na pozadí;
+loggerům zůstane jen `QueueHandler` (vložení do `queue.SimpleQueue`, nikdy
+neblokuje). Každý request navíc zapíše jeden strukturovaný JSON řádek do
+logs/access.log (routa, pobočka, uživatel, stav, časy, počet SQL), aby šly
+logy zpracovat strojově (jq, Loki, …).
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+ACCESS_LOGGER = 'odbery.access'
+access_logger = logging.getLogger(ACCESS_LOGGER)
+
+
+class JsonFormatter(logging.Formatter):
+    """Jeden JSON objekt na řádek; pole z `extra={'access': {...}}` jdou na nejvyšší úroveň."""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+        }
+        fields = getattr(record, 'access', None)
+        if fields:
+            data.update(fields)
+        else:
+            data['message'] = record.getMessage()
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class LogQueue:
+    """Přesune handlery vybraných loggerů za frontu a jedno vlákno QueueListener."""
+
+    def __init__(self, app=None):
+        self.queue = queue.SimpleQueue()
+        self.listener = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, loggers=None):
+        access_path = app.config.get('ACCESS_LOG')
+        if access_path and not access_logger.handlers:
+            os.makedirs(os.path.dirname(access_path) or '.', exist_ok=True)
+            handler = RotatingFileHandler(access_path, maxBytes=10240000, backupCount=10, encoding='utf-8')
+            handler.setFormatter(JsonFormatter())
+            access_logger.addHandler(handler)
+            access_logger.setLevel(logging.INFO)
+            access_logger.propagate = False
+        if loggers is None:
+            loggers = [app.logger, logging.getLogger('odbery.slow_query'), access_logger]
+        self.install(loggers)
+        app.extensions['log_queue'] = self
+
+    def install(self, loggers):
+        """Handlery loggerů obsluhuje vlákno listeneru; logger si nechá jen QueueHandler."""
+        moved = []
+        for logger in loggers:
+            handlers = [h for h in logger.handlers if not isinstance(h, QueueHandler)]
+            if not handlers:
+                continue
+            for handler in handlers:
+                logger.removeHandler(handler)
+                # Listener má jednu frontu pro všechny loggery – handler bere jen záznamy svého loggeru
+                handler.addFilter(logging.Filter(logger.name))
+                moved.append(handler)
+            logger.addHandler(QueueHandler(self.queue))
+        if not moved:
+            return
+        if self.listener is not None:
+            self.listener.stop()
+            moved = list(self.listener.handlers) + moved
+        self.listener = QueueListener(self.queue, *moved, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Dopíše frontu a ukončí vlákno (při ukončení procesu)."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
+def worker_log_path(path, worker_id):
+    """logs/app.log → logs/app.worker2.log – každý worker rotuje vlastní soubor."""
+    if not path or not worker_id:
+        return path
+    root, ext = os.path.splitext(path)
+    return f'{root}.worker{worker_id}{ext}'
+
+
+def access_record(request, endpoint, record, user_id=None):
+    """Pole JSON access záznamu – bez query stringu (hledání obsahuje jména a telefony zákazníků)."""
+    view_args = request.view_args or {}
+    return {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': endpoint,
+        'route': request.url_rule.rule if request.url_rule else None,
+        'branch': view_args.get('pobocka_id'),
+        'user': user_id,
+        'status': record['status'],
+        'wall_ms': round(record['wall_ms'], 1),
+        'sql_ms': round(record['sql_ms'], 1),
+        'sql_count': record['sql_count'],
+        'render_ms': round(record['render_ms'], 1),
+        'bytes': record['size'],
+        'ip': request.remote_addr,
+    }
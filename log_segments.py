@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Retence logu akcí – staré záznamy Akce a ReklamaceLog mimo živé tabulky.
+
+Záznamy starší než `LOG_RETENTION_DAYS` přesune úloha údržby `log_retention`
+do měsíčních segmentů `<LOG_SEGMENT_DIR>/<stream>/<RRRR-MM>.ndjson.gz` (jeden
+JSON objekt na řádek, gzip). Segment se jen doplňuje: každá dávka je nový gzip
+člen na konci souboru (gzip.open čte členy za sebou jako jeden proud), takže se
+starý obsah nikdy nepřepisuje. Malý `index.json` drží pro každý segment počet
+řádků, rozsah dat, pobočky a id přesunutých řádků (jako intervaly) – vyhledávání
+z admin historie otevře jen segmenty, které mohou odpovídat filtru, a čte je od
+nejnovějšího měsíce.
+
+Každý záznam nese `id` zdrojového řádku a `zdroj` (tabulku – log reklamací ze
+studeného archivu má vlastní řadu id). Dávka přesunutá znovu po pádu před
+commitem se podle nich do segmentu ani do indexu podruhé nezapíše.
+"""
+
+import bisect
+import gzip
+import json
+import os
+from datetime import datetime
+
+SEGMENT_SUFFIX = '.ndjson.gz'
+INDEX_NAME = 'index.json'
+
+
+def _month(datum):
+    return datum.strftime('%Y-%m')
+
+
+def _record_key(record):
+    """Identita záznamu pro čtení bez duplicit – (zdroj, id); segmenty zapsané před ukládáním id podle obsahu."""
+    if 'id' in record:
+        return record.get('zdroj', ''), record['id']
+    return tuple(sorted((k, str(v)) for k, v in record.items()))
+
+
+def _contains(ranges, value):
+    """Je `value` v seřazených disjunktních intervalech [[od, do], …]?"""
+    i = bisect.bisect_right(ranges, [value, float('inf')]) - 1
+    return i >= 0 and ranges[i][0] <= value <= ranges[i][1]
+
+
+def _add_ranges(ranges, values):
+    """Sloučí hodnoty do intervalů – dávky id jdou vzestupně, takže seznam zůstává krátký."""
+    merged = []
+    for start, end in sorted([list(r) for r in ranges] + [[v, v] for v in values]):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class SegmentStore:
+    """Adresář s komprimovanými měsíčními segmenty logu a jejich indexem (Flask rozšíření)."""
+
+    def __init__(self, app=None, root=None):
+        self.root = root
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.root = app.config.get('LOG_SEGMENT_DIR') or self.root
+        app.extensions['log_segments'] = self
+
+    def path(self, stream, month):
+        return os.path.join(self.root, stream, month + SEGMENT_SUFFIX)
+
+    def load_index(self):
+        """{stream: {měsíc: {'rows', 'od', 'do', 'pobocky', 'bytes'}}} – prázdný, dokud nic není přesunuto."""
+        try:
+            with open(os.path.join(self.root, INDEX_NAME), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_index(self, index):
+        path = os.path.join(self.root, INDEX_NAME)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)  # čtenář vidí starý nebo nový index, nikdy rozepsaný
+
+    def append(self, stream, records):
+        """Připíše záznamy (dict s 'datum' jako datetime, 'id' a 'zdroj') do segmentů podle měsíce.
+
+        Data jsou na disku (fsync) dřív, než volající smaže řádky z databáze. Záznamy,
+        jejichž (zdroj, id) už segment má, se přeskočí. Vrací počet zapsaných.
+        """
+        by_month = {}
+        for record in records:
+            by_month.setdefault(_month(record['datum']), []).append(record)
+        if not by_month:
+            return 0
+        index = self.load_index()
+        segments = index.setdefault(stream, {})
+        os.makedirs(os.path.join(self.root, stream), exist_ok=True)
+        written = 0
+        for month, rows in sorted(by_month.items()):
+            entry = segments.get(month, {})
+            known = entry.get('ids', {})
+            rows = [r for r in rows if 'id' not in r or not _contains(known.get(r.get('zdroj', ''), []), r['id'])]
+            if not rows:
+                continue
+            path = self.path(stream, month)
+            with open(path, 'ab') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as gz:
+                    for record in rows:
+                        line = dict(record, datum=record['datum'].isoformat())
+                        gz.write(json.dumps(line, ensure_ascii=False).encode('utf-8') + b'\n')
+                raw.flush()
+                os.fsync(raw.fileno())
+            dates = [r['datum'].isoformat() for r in rows]
+            entry = segments.setdefault(month, {'rows': 0, 'od': min(dates), 'do': max(dates), 'pobocky': []})
+            entry['rows'] += len(rows)
+            entry['od'] = min(entry['od'], min(dates))
+            entry['do'] = max(entry['do'], max(dates))
+            entry['pobocky'] = sorted(set(entry['pobocky']) | {r['pobocka_id'] for r in rows})
+            entry['bytes'] = os.path.getsize(path)
+            ids = entry.setdefault('ids', {})
+            for zdroj in {r.get('zdroj', '') for r in rows if 'id' in r}:
+                ids[zdroj] = _add_ranges(ids.get(zdroj, []), [r['id'] for r in rows if r.get('zdroj', '') == zdroj])
+            written += len(rows)
+        self._save_index(index)
+        return written
+
+    def read(self, stream, month):
+        """Záznamy jednoho segmentu; useknutý poslední člen (právě se zapisuje) se přeskočí."""
+        path = self.path(stream, month)
+        if not os.path.exists(path):
+            return
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    record = json.loads(line)
+                    record['datum'] = datetime.fromisoformat(record['datum'])
+                    yield record
+            except (EOFError, json.JSONDecodeError):
+                return
+
+    def search(self, streams=None, pobocky=None, od=None, do=None, q=None, limit=200):
+        """Nejnovější záznamy odpovídající filtru – (stream, záznam), seřazené od nejnovějšího.
+
+        Segmenty mimo rozsah dat nebo bez hledaných poboček se podle indexu vůbec
+        neotevřou; po měsíci, kterým se naplní `limit`, se čtení zastaví.
+        """
+        index = self.load_index()
+        pobocky = set(pobocky) if pobocky else None
+        needle = q.lower() if q else None
+        months = {}
+        for stream, segments in index.items():
+            if streams and stream not in streams:
+                continue
+            for month, entry in segments.items():
+                if od and entry['do'] < od.isoformat():
+                    continue
+                if do and entry['od'] > do.isoformat():
+                    continue
+                if pobocky and not pobocky.intersection(entry['pobocky']):
+                    continue
+                months.setdefault(month, []).append(stream)
+        found = []
+        seen = set()
+        for month in sorted(months, reverse=True):
+            for stream in months[month]:
+                for record in self.read(stream, month):
+                    if pobocky and record['pobocka_id'] not in pobocky:
+                        continue
+                    if od and record['datum'] < od:
+                        continue
+                    if do and record['datum'] > do:
+                        continue
+                    if needle and needle not in f"{record['uzivatel']} {record['akce']}".lower():
+                        continue
+                    key = (stream, _record_key(record))
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    found.append((stream, record))
+            if len(found) >= limit:
+                break
+        found.sort(key=lambda item: item[1]['datum'], reverse=True)
+        return found[:limit]
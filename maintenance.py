@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Plánovaná údržba – automatická archivace, propadlé odběry, statistiky plánovače, WAL.
+
+Úlohy se registrují dekorátorem `@maintenance.job(název, every=sekundy)` a
+spouští je samostatný proces (`flask --app app maintenance --loop`, případně
+cron bez --loop), ne webové workery – při několika workerech by každý pouštěl
+stejnou údržbu. Hromadné změny běží po malých dávkách, každá dávka je vlastní
+krátká transakce a mezi dávkami je pauza, aby zápisy z poboček nečekaly na
+zámek. Každý běh úlohy se zapíše (délka, počet řádků a dávek, stav) do tabulky
+maintenance_run a podle ní se pozná, které úlohy jsou na řadě.
+"""
+
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+OK = 'ok'
+SKIPPED = 'skipped'
+ERROR = 'error'
+
+
+class JobContext:
+    """Předává se úloze: dávkové zpracování a počitadla řádků a dávek."""
+
+    def __init__(self, engine, chunk_size, pause_s):
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.pause_s = pause_s
+        self.rows = 0
+        self.chunks = 0
+        self.status = OK
+        self.detail = ''
+
+    def chunked(self, select_ids, apply):
+        """Opakuje select_ids(conn, limit) → apply(conn, ids), dokud jsou řádky; dávka = transakce."""
+        while True:
+            with self.engine.begin() as conn:
+                ids = select_ids(conn, self.chunk_size)
+                if not ids:
+                    return self.rows
+                affected = apply(conn, ids)
+            self.rows += len(ids) if affected is None else affected
+            self.chunks += 1
+            time.sleep(self.pause_s)
+
+    def skip(self, detail):
+        self.status = SKIPPED
+        self.detail = detail
+
+
+class Maintenance:
+    """Registr úloh údržby (Flask rozšíření) – běh přes run() / run_due()."""
+
+    def __init__(self, app=None, run_table=None):
+        self.jobs = {}
+        self.run_table = run_table
+        self.history = deque(maxlen=100)
+        self.chunk_size = 200
+        self.pause_s = 0.05
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.chunk_size = app.config.get('MAINT_CHUNK_SIZE', 200)
+        self.pause_s = app.config.get('MAINT_CHUNK_PAUSE_MS', 50) / 1000.0
+        app.extensions['maintenance'] = self
+
+    def job(self, name, every):
+        """Zaregistruje úlohu func(ctx) spouštěnou nejvýš jednou za `every` sekund."""
+        def decorator(func):
+            self.jobs[name] = (func, every)
+            return func
+        return decorator
+
+    def last_runs(self, engine):
+        """{úloha: čas posledního běhu} z tabulky maintenance_run."""
+        table = self.run_table
+        with engine.connect() as conn:
+            rows = conn.execute(select(table.c.job, func.max(table.c.started_at)).group_by(table.c.job))
+            return {job: started for job, started in rows}
+
+    def due(self, engine, now=None):
+        now = now or datetime.now()
+        last = self.last_runs(engine)
+        return [name for name, (_func, every) in self.jobs.items()
+                if last.get(name) is None or (now - last[name]).total_seconds() >= every]
+
+    def run(self, engine, names=None, logger=None):
+        """Spustí úlohy (výchozí všechny) a zapíše jejich výsledky. Výjimka v úloze = stav 'error'."""
+        results = []
+        for name in names or list(self.jobs):
+            func, _every = self.jobs[name]
+            ctx = JobContext(engine, self.chunk_size, self.pause_s)
+            started_at = datetime.now()
+            started = time.perf_counter()
+            try:
+                func(ctx)
+            except Exception as e:
+                ctx.status = ERROR
+                ctx.detail = str(e)[:500]
+            result = {
+                'job': name,
+                'started_at': started_at,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+                'rows': ctx.rows,
+                'chunks': ctx.chunks,
+                'status': ctx.status,
+                'detail': ctx.detail,
+            }
+            if self.run_table is not None:
+                with engine.begin() as conn:
+                    conn.execute(self.run_table.insert().values(**result))
+            self.history.append(result)
+            results.append(result)
+            if logger:
+                log = logger.error if ctx.status == ERROR else logger.info
+                log(f"Údržba {name}: {ctx.status}, {ctx.rows} řádků v {ctx.chunks} dávkách "
+                    f"za {result['duration_ms']} ms {ctx.detail}".rstrip())
+        return results
+
+    def run_due(self, engine, logger=None):
+        names = self.due(engine)
+        return self.run(engine, names, logger) if names else []
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Metriky ve formátu Prometheus (text exposition format 0.0.4) pro endpoint /metrics.
+
+Čítače a histogramy jsou rozdělené po vláknech: každé vlákno waitress zapisuje
+jen do vlastního "shardu" bez zámku a teprve scrape je sečte. Zámek se bere
+jen jednou při registraci nového vlákna a při čtení. Hodnoty typu gauge
+(stav poolu, velikost WAL) se počítají až při scrape přes callbacky.
+
+S více procesy (WAITRESS_WORKERS) má každý worker vlastní registr; štítek
+`worker` v `const_labels` odliší jeho řady, sčítá je až Prometheus.
+"""
+
+import bisect
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Shard:
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+class Registry:
+    """Registr metrik – zápis bez zámků (per-thread shardy), čtení sčítá shardy."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._gauge_callbacks = []
+        self.const_labels = ()  # štítky přidané ke každé řadě, např. (('worker', '2'),)
+
+    def describe(self, name, kind, help_text, buckets=None):
+        self._meta[name] = (kind, help_text, tuple(buckets or DEFAULT_BUCKETS))
+
+    def gauge_callback(self, callback):
+        """Zaregistruje funkci vracející [(name, labels_dict, value), ...] při scrape."""
+        self._gauge_callbacks.append(callback)
+        return callback
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = _Shard()
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        buckets = self._meta[name][2]
+        hist = histograms.get(key)
+        if hist is None:
+            hist = histograms[key] = [0] * (len(buckets) + 2)  # buckety + sum + count
+        idx = bisect.bisect_left(buckets, value)
+        if idx < len(buckets):  # hodnoty nad posledním bucketem počítá jen +Inf (count)
+            hist[idx] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+    def _collect(self):
+        counters, histograms = {}, {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # dict.copy() je pod GIL atomické – vlákno může mezitím dál zapisovat
+            for key, value in shard.counters.copy().items():
+                counters[key] = counters.get(key, 0) + value
+            for key, hist in shard.histograms.copy().items():
+                total = histograms.setdefault(key, [0] * len(hist))
+                for i, value in enumerate(list(hist)):
+                    total[i] += value
+        return counters, histograms
+
+    def render(self):
+        counters, histograms = self._collect()
+        gauges = []
+        for callback in self._gauge_callbacks:
+            try:
+                gauges.extend(callback())
+            except Exception:
+                continue
+        const = self.const_labels
+        by_name = {}
+        for (name, labels), value in counters.items():
+            by_name.setdefault(name, []).append(_line(name, const + labels, value))
+        for name, labels, value in gauges:
+            by_name.setdefault(name, []).append(_line(name, const + tuple(sorted(labels.items())), value))
+        for lines in by_name.values():
+            lines.sort()
+        # Histogramy až po seřazení – buckety musí zůstat v pořadí podle hranice
+        for (name, labels), hist in sorted(histograms.items()):
+            labels = const + labels
+            lines = by_name.setdefault(name, [])
+            buckets = self._meta[name][2]
+            cumulative = 0
+            for bound, count in zip(buckets, hist):
+                cumulative += count
+                lines.append(_line(name + '_bucket', labels + (('le', _fmt(bound)),), cumulative))
+            lines.append(_line(name + '_bucket', labels + (('le', '+Inf'),), hist[-1]))
+            lines.append(_line(name + '_sum', labels, hist[-2]))
+            lines.append(_line(name + '_count', labels, hist[-1]))
+        out = []
+        for name in sorted(by_name):
+            kind, help_text, _ = self._meta.get(name, ('untyped', '', None))
+            out.append(f'# HELP {name} {help_text}')
+            out.append(f'# TYPE {name} {kind}')
+            out.extend(by_name[name])
+        return '\n'.join(out) + '\n'
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _line(name, labels, value):
+    if labels:
+        label_str = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+        return f'{name}{{{label_str}}} {_fmt(value)}'
+    return f'{name} {_fmt(value)}'
+
+
+registry = Registry()
+registry.describe('odbery_http_requests_total', 'counter', 'Počet HTTP requestů podle endpointu, metody a stavu.')
+registry.describe('odbery_http_request_duration_seconds', 'histogram', 'Doba zpracování requestu podle endpointu a stavu.')
+registry.describe('odbery_sql_statements_total', 'counter', 'Počet SQL příkazů vykonaných v requestech podle endpointu.')
+registry.describe('odbery_sql_compile_cache_total', 'counter', 'Cache kompilace SQL v SQLAlchemy – zásahy a minutí.')
+registry.describe('odbery_db_lock_errors_total', 'counter', 'Chyby "database is locked" / lock timeout z databáze.')
+registry.describe('odbery_cache_requests_total', 'counter', 'Požadavky na aplikační cache podle výsledku (hit/miss).')
+registry.describe('odbery_db_pool_size', 'gauge', 'Velikost connection poolu.')
+registry.describe('odbery_db_pool_checked_out', 'gauge', 'Počet právě půjčených připojení z poolu.')
+registry.describe('odbery_db_pool_overflow', 'gauge', 'Počet připojení nad rámec velikosti poolu.')
+registry.describe('odbery_sqlite_wal_bytes', 'gauge', 'Velikost WAL souboru SQLite v bajtech.')
+registry.describe('odbery_admission_active', 'gauge', 'Právě obsluhované requesty v pruhu admission control.')
+registry.describe('odbery_admission_waiting', 'gauge', 'Requesty čekající ve frontě pruhu admission control.')
+registry.describe('odbery_admission_rejected_total', 'counter', 'Requesty odmítnuté s 503 v pruhu admission control.')
+
+
+def observe_request(endpoint, method, status, duration_seconds, sql_count=0):
+    registry.inc('odbery_http_requests_total', (('endpoint', endpoint), ('method', method), ('status', str(status))))
+    registry.observe('odbery_http_request_duration_seconds', (('endpoint', endpoint), ('status', str(status))),
+                     duration_seconds)
+    if sql_count:
+        registry.inc('odbery_sql_statements_total', (('endpoint', endpoint),), sql_count)
+
+
+def cache_hit(cache_name):
+    registry.inc('odbery_cache_requests_total', (('cache', cache_name), ('result', 'hit')))
+
+
+def cache_miss(cache_name):
+    registry.inc('odbery_cache_requests_total', (('cache', cache_name), ('result', 'miss')))
+
+
+_HIT_LABELS = (('result', 'hit'),)
+_MISS_LABELS = (('result', 'miss'),)
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _count_compile_cache(conn, cursor, statement, parameters, context, executemany):
+    cache_hit_state = getattr(context, 'cache_hit', None)
+    if cache_hit_state is CACHE_HIT:
+        registry.inc('odbery_sql_compile_cache_total', _HIT_LABELS)
+    elif cache_hit_state is CACHE_MISS:
+        registry.inc('odbery_sql_compile_cache_total', _MISS_LABELS)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _count_lock_errors(exception_context):
+    message = str(exception_context.original_exception).lower()
+    if 'database is locked' in message or 'lock timeout' in message or 'deadlock' in message:
+        registry.inc('odbery_db_lock_errors_total', (('dialect', exception_context.dialect.name),))
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Převod dat z SQLite (odbery.db) do PostgreSQL.
+
+Schéma cílové databáze vytvoří stejné migrace jako `init-db` (bez výchozích
+poboček a admina), tabulka `user` se na PostgreSQL jmenuje `users`. Data se
+čtou z SQLite po tabulkách v pořadí cizích klíčů a po dávkách `--chunk` řádků
+podle primárního klíče (keyset, žádný OFFSET). Každá dávka jde do PostgreSQL
+jedním příkazem COPY a ve stejné transakci se do tabulky `migrace_stav` zapíše
+poslední zkopírovaný klíč – přerušený převod stačí spustit znovu a pokračuje
+za poslední potvrzenou dávkou. Na konci se nastaví sekvence id na MAX(id)
+a obě databáze se porovnají: počty řádků a kontrolní součet obsahu tabulky.
+
+Použití:
+    python migrate_to_postgres.py instance/odbery.db --target postgresql://…
+    python migrate_to_postgres.py odbery.db --archive instance/archiv.db   (cíl z DATABASE_URL)
+    python migrate_to_postgres.py odbery.db --restart       (vyprázdní cíl a začne znovu)
+    python migrate_to_postgres.py odbery.db --verify-only   (jen porovnání)
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from datetime import date, datetime
+
+from sqlalchemy import (Boolean, Column, DateTime, Integer, MetaData, String, Table, Text, create_engine, delete,
+                        event, func, insert, select, text, tuple_, update)
+
+import cold_storage
+
+CHUNK_ROWS = 20000
+PROGRESS_EVERY = 50  # dávek mezi průběžnými výpisy
+SKIP_TABLES = {'schema_version'}  # verze schématu zapisují migrace cílové databáze
+RENAMED = {'users': 'user'}  # tabulka na PostgreSQL → v SQLite ("user" je v PostgreSQL rezervované slovo)
+
+state_metadata = MetaData()
+migrace_stav = Table(
+    'migrace_stav', state_metadata,
+    Column('tabulka', String(100), primary_key=True),
+    Column('posledni_klic', Text, nullable=True),  # JSON seznam hodnot primárního klíče
+    Column('radku', Integer, nullable=False, default=0),
+    Column('hotovo', Boolean, nullable=False, default=False),
+    Column('zmeneno', DateTime, nullable=False),
+)
+
+
+class MigraceError(RuntimeError):
+    """Převod nelze spustit nebo dokončit – zpráva je pro obsluhu."""
+
+
+def _value_text(value):
+    """Hodnota jako text – stejně pro COPY i kontrolní součet (SQLite a PostgreSQL vrací stejné typy)."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _copy_field(value):
+    """Pole pro COPY … FROM STDIN (textový formát): NULL = \\N, zpětné lomítko a řídicí znaky escapované."""
+    value = _value_text(value)
+    if value is None:
+        return '\\N'
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def row_digest(row):
+    """64bitový otisk řádku; součet otisků nezávisí na pořadí, v jakém databáze řádky vrátí."""
+    data = '\x1f'.join('\x00' if v is None else v for v in map(_value_text, row)).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
+def plan(source_md, target_md):
+    """[(zdrojová tabulka, cílová tabulka, [sloupce])] v pořadí cizích klíčů cílového schématu."""
+    by_name = {}
+    for table in source_md.tables.values():
+        by_name.setdefault(table.name, table)  # hlavní databáze má přednost před připojeným archivem
+    steps = []
+    for target in target_md.sorted_tables:
+        if target.name in SKIP_TABLES or target.name == migrace_stav.name:
+            continue
+        source = by_name.get(target.name, by_name.get(RENAMED.get(target.name)))
+        if source is None:
+            continue
+        if not source.primary_key.columns:
+            raise MigraceError(f'tabulka {source.name} nemá primární klíč – nelze kopírovat po dávkách')
+        columns = [c.name for c in target.columns if c.name in source.columns]
+        steps.append((source, target, columns))
+    return steps
+
+
+def _write_chunk(conn, target, columns, rows):
+    if conn.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_field(v) for v in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        quote = conn.dialect.identifier_preparer.quote
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {quote(target.name)} ({', '.join(quote(c) for c in columns)}) FROM STDIN",
+                               buffer)
+        finally:
+            cursor.close()
+    else:
+        # Jiný cíl než PostgreSQL (zkouška převodu do SQLite souboru) – executemany
+        conn.execute(insert(target), [dict(zip(columns, row)) for row in rows])
+
+
+def copy_table(source_conn, target_engine, source, target, columns, chunk_rows=CHUNK_ROWS, log=print):
+    """Zkopíruje tabulku po dávkách; dávka a posun v migrace_stav jsou jedna transakce cíle."""
+    pk = list(source.primary_key.columns)
+    key_index = [columns.index(c.name) for c in pk]
+    with target_engine.connect() as conn:
+        state = conn.execute(select(migrace_stav).where(migrace_stav.c.tabulka == target.name)).first()
+    if state is not None and state.hotovo:
+        return state.radku
+    if state is None:
+        with target_engine.begin() as conn:
+            if conn.execute(select(func.count()).select_from(target)).scalar():
+                raise MigraceError(f'cílová tabulka {target.name} už obsahuje data, která nepocházejí z tohoto '
+                                   'převodu – spusťte s --restart')
+            conn.execute(insert(migrace_stav).values(tabulka=target.name, radku=0, hotovo=False,
+                                                     zmeneno=datetime.now()))
+        last, copied = None, 0
+    else:
+        last, copied = (json.loads(state.posledni_klic) if state.posledni_klic else None), state.radku
+        log(f'{target.name}: pokračuje za {copied} řádky')
+
+    query = select(*[source.c[name] for name in columns]).order_by(*pk).limit(chunk_rows)
+    key = pk[0] if len(pk) == 1 else tuple_(*pk)
+    started = time.perf_counter()
+    chunks = 0
+    while True:
+        chunk = query
+        if last is not None:
+            chunk = chunk.where(key > (last[0] if len(pk) == 1 else tuple_(*last)))
+        rows = source_conn.execute(chunk).all()
+        done = len(rows) < chunk_rows
+        with target_engine.begin() as conn:
+            if rows:
+                _write_chunk(conn, target, columns, rows)
+                last = [rows[-1][i] for i in key_index]
+                copied += len(rows)
+            conn.execute(update(migrace_stav).where(migrace_stav.c.tabulka == target.name).values(
+                posledni_klic=json.dumps(last) if last is not None else None, radku=copied, hotovo=done,
+                zmeneno=datetime.now()))
+        chunks += 1
+        if done:
+            break
+        if chunks % PROGRESS_EVERY == 0:
+            log(f'{target.name}: {copied} řádků…')
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    log(f'{target.name}: {copied} řádků ({copied / elapsed:,.0f} řádků/s)')
+    return copied
+
+
+def fix_sequences(target_engine, steps):
+    """Sekvence id na PostgreSQL nastaví na MAX(id) – COPY s explicitním id sekvenci neposouvá."""
+    with target_engine.begin() as conn:
+        if conn.dialect.name != 'postgresql':
+            return
+        for _source, target, _columns in steps:
+            pk = list(target.primary_key.columns)
+            if len(pk) != 1 or not isinstance(pk[0].type, Integer):
+                continue
+            conn.execute(text(
+                f'SELECT setval(pg_get_serial_sequence(:tabulka, :sloupec), COALESCE(MAX({pk[0].name}), 1), '
+                f'MAX({pk[0].name}) IS NOT NULL) FROM {conn.dialect.identifier_preparer.quote(target.name)} '
+                'WHERE pg_get_serial_sequence(:tabulka, :sloupec) IS NOT NULL'),
+                {'tabulka': target.name, 'sloupec': pk[0].name})
+
+
+def table_checksum(conn, table, columns):
+    """(počet řádků, součet otisků) celé tabulky – čte se proudem, bez načtení do paměti."""
+    count, total = 0, 0
+    result = conn.execution_options(stream_results=True, yield_per=CHUNK_ROWS).execute(
+        select(*[table.c[name] for name in columns]))
+    for row in result:
+        count += 1
+        total = (total + row_digest(row)) % (1 << 64)
+    return count, f'{total:016x}'
+
+
+def verify(source_engine, target_engine, steps, log=print):
+    """Porovná počty řádků a kontrolní součty; vrací seznam tabulek, které nesedí."""
+    mismatched = []
+    with source_engine.connect() as source_conn, target_engine.connect() as target_conn:
+        for source, target, columns in steps:
+            expected = table_checksum(source_conn, source, columns)
+            actual = table_checksum(target_conn, target, columns)
+            ok = expected == actual
+            log(f"{target.name:24} {actual[0]:>10} řádků  {actual[1]}  "
+                f"{'OK' if ok else f'NESEDÍ (SQLite {expected[0]} řádků, {expected[1]})'}")
+            if not ok:
+                mismatched.append(target.name)
+    return mismatched
+
+
+def restart(target_engine, steps):
+    """Vyprázdní cílové tabulky a stav převodu (--restart)."""
+    with target_engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            quote = conn.dialect.identifier_preparer.quote
+            names = ', '.join(quote(target.name) for _s, target, _c in steps)
+            conn.execute(text(f'TRUNCATE {names} RESTART IDENTITY CASCADE'))
+        else:
+            for _source, target, _columns in reversed(steps):
+                conn.execute(delete(target))
+        conn.execute(delete(migrace_stav))
+
+
+def load_plan(source_engine, target_engine, archive=False):
+    """Plán převodu z reflexe obou databází (archive=True: i studené tabulky z připojeného ARCHIVE_DB)."""
+    source_md = MetaData()
+    source_md.reflect(source_engine)
+    if archive:
+        source_md.reflect(source_engine, schema=cold_storage.ATTACH_NAME)
+    target_md = MetaData()
+    target_md.reflect(target_engine)
+    return plan(source_md, target_md)
+
+
+def migrate(source_engine, target_engine, chunk_rows=CHUNK_ROWS, restart_all=False, log=print, archive=False):
+    """Zkopíruje všechna data; cílové schéma už musí existovat. Vrací plán (pro verify)."""
+    steps = load_plan(source_engine, target_engine, archive)
+    state_metadata.create_all(target_engine)
+    if restart_all:
+        restart(target_engine, steps)
+    with source_engine.connect() as source_conn:
+        for source, target, columns in steps:
+            copy_table(source_conn, target_engine, source, target, columns, chunk_rows, log)
+    fix_sequences(target_engine, steps)
+    return steps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Převod dat aplikace z SQLite do PostgreSQL (COPY po dávkách).')
+    parser.add_argument('source', help='SQLite soubor (např. instance/odbery.db) nebo sqlite:/// URL')
+    parser.add_argument('--target', default=os.environ.get('DATABASE_URL', ''),
+                        help='PostgreSQL URL (výchozí DATABASE_URL)')
+    parser.add_argument('--archive', help='soubor studeného archivu (ARCHIVE_DB), pokud je mimo hlavní databázi')
+    parser.add_argument('--chunk', type=int, default=CHUNK_ROWS, help='řádků na jeden COPY a jednu transakci')
+    parser.add_argument('--restart', action='store_true', help='vyprázdnit cílové tabulky a začít znovu')
+    parser.add_argument('--verify-only', action='store_true', help='nic nekopírovat, jen porovnat')
+    args = parser.parse_args(argv)
+
+    target_url = args.target.strip()
+    if target_url.startswith('postgres://'):
+        target_url = 'postgresql://' + target_url[11:]
+    if not target_url.startswith('postgresql'):
+        parser.error('cíl musí být PostgreSQL (--target nebo DATABASE_URL)')
+    source_url = args.source if '://' in args.source else f'sqlite:///{os.path.abspath(args.source)}'
+    if source_url.startswith('sqlite:///') and not os.path.exists(source_url[len('sqlite:///'):]):
+        parser.error(f'soubor {args.source} neexistuje')
+
+    source_engine = create_engine(source_url)
+    if args.archive:
+        archive_path = os.path.abspath(args.archive)
+        event.listen(source_engine, 'connect', lambda dbapi_conn, _record: cold_storage.attach(dbapi_conn, archive_path))
+    target_engine = create_engine(target_url, connect_args={'options': '-c synchronous_commit=off'})
+
+    # Metadata aplikace pro PostgreSQL (tabulka users) – app.py čte DATABASE_URL při importu
+    os.environ['DATABASE_URL'] = target_url
+    import migrations
+    from app import db
+
+    if migrations.current_version(source_engine) < migrations.LATEST_VERSION:
+        print('Zdrojová databáze nemá aktuální schéma – nejdřív spusťte: python migrations.py upgrade')
+        return 2
+    print(f'Zdroj: {source_engine.url.render_as_string(hide_password=True)}')
+    print(f'Cíl:   {target_engine.url.render_as_string(hide_password=True)}')
+    started = time.perf_counter()
+    try:
+        if args.verify_only:
+            steps = load_plan(source_engine, target_engine, bool(args.archive))
+        else:
+            for number in migrations.upgrade(target_engine, db.metadata):
+                print(f'  cílové schéma: migrace {number}')
+            steps = migrate(source_engine, target_engine, args.chunk, args.restart, print, bool(args.archive))
+    except MigraceError as e:
+        print(f'Chyba: {e}')
+        return 1
+    mismatched = verify(source_engine, target_engine, steps)
+    print(f'Hotovo za {time.perf_counter() - started:.1f} s.')
+    if mismatched:
+        print(f"Nesedí: {', '.join(mismatched)} – spusťte převod znovu s --restart")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Verzované migrace schématu.
+
+Aktuální verze je uložená v tabulce `schema_version` (jeden řádek na aplikovanou
+migraci). Běžný start procesu tak udělá jediný dotaz na MAX(version) a pokud je
+schéma aktuální, žádné DDL nespouští. Jednotlivé kroky jsou idempotentní (sloupec
+se přidá jen tehdy, když v tabulce chybí) a fungují na SQLite i PostgreSQL,
+takže je lze pustit i na databázi, která vznikla před zavedením verzí.
+
+Nová migrace = nová funkce na konec MIGRATIONS s další verzí. Existující kroky
+se nemění, protože už na produkčních databázích proběhly.
+
+Použití:
+    python migrations.py status
+    python migrations.py upgrade
+"""
+
+import sys
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, Date, DateTime, Float, Integer, MetaData, String, Table, inspect, text
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+
+import cold_storage
+
+schema_metadata = MetaData()
+schema_version = Table(
+    'schema_version', schema_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('popis', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def _literal(conn, value):
+    """Výchozí hodnota sloupce v DDL podle dialektu (SQLite nemá true/false)."""
+    if isinstance(value, bool):
+        if conn.dialect.name == 'postgresql':
+            return 'true' if value else 'false'
+        return '1' if value else '0'
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+def add_missing_columns(conn, table, columns):
+    """Přidá do tabulky sloupce, které v ní chybí. columns = [(název, typ, výchozí hodnota)]."""
+    existing = {c['name'] for c in inspect(conn).get_columns(table)}
+    quote = conn.dialect.identifier_preparer.quote
+    added = []
+    for name, type_, default in columns:
+        if name in existing:
+            continue
+        ddl = f'ALTER TABLE {quote(table)} ADD COLUMN {quote(name)} {type_.compile(dialect=conn.dialect)}'
+        if default is not None:
+            ddl += f' DEFAULT {_literal(conn, default)}'
+        conn.execute(text(ddl))
+        added.append(name)
+    return added
+
+
+def _baseline(conn, metadata):
+    """Chybějící tabulky a sloupce, které dřív doplňoval migrate_db() při každém startu."""
+    # Studené tabulky vytváří až migrace 3 – případně v připojeném souboru archivu
+    metadata.create_all(conn, tables=[t for t in metadata.sorted_tables if not t.info.get('cold')])
+    user_table = 'users' if 'users' in metadata.tables else 'user'  # na PostgreSQL je "user" rezervované
+    add_missing_columns(conn, user_table, [
+        ('pin', String(10), None),
+        ('pobocka_id', Integer(), None),
+        ('role', String(20), 'user'),
+        ('jmeno', String(100), None),
+    ])
+    add_missing_columns(conn, 'reklamace', [
+        ('zavolano_zakaznikovi', Boolean(), False),
+        ('prijal', String(100), None),
+        ('barva', String(50), None),
+        ('datum_zakoupeni', Date(), None),
+        ('sleva_procent', Float(), None),
+        ('archived', Boolean(), False),
+        ('archived_at', DateTime(), None),
+    ])
+    add_missing_columns(conn, 'pobocka', [
+        ('adresa', String(200), None),
+        ('firma', String(200), None),
+    ])
+
+
+def _stav_sleva_na_zamitnuto(conn, metadata):
+    """Stav Sleva zanikl – sleva je teď jen sloupec u zamítnuté reklamace."""
+    conn.execute(text("UPDATE reklamace SET stav = 'Zamítnuto' WHERE stav = 'Sleva'"))
+
+
+def _studeny_archiv(conn, metadata):
+    """Tabulky reklamace_archive a reklamace_log_archive (přesun dělá `flask --app app archive-move`)."""
+    cold_storage.create_cold_tables(conn, metadata)
+
+
+def _maintenance_run(conn, metadata):
+    """Záznamy běhů údržby (maintenance.py)."""
+    metadata.tables['maintenance_run'].create(conn, checkfirst=True)
+
+
+def _zasilky(conn, metadata):
+    """Zásilky reklamací do Ústí a jejich položky."""
+    metadata.tables['zasilka'].create(conn, checkfirst=True)
+    metadata.tables['zasilka_polozka'].create(conn, checkfirst=True)
+
+
+def _auto_vacuum_incremental(conn, metadata):
+    """SQLite: auto_vacuum=INCREMENTAL pro úlohu údržby vacuum – jednorázový VACUUM přepíše celý soubor.
+
+    Nové databáze dostanou režim už v _sqlite_on_connect (před první tabulkou), tady
+    se převádějí existující. VACUUM neběží v transakci; krok je první příkaz
+    transakce migrace a pysqlite před PRAGMA/VACUUM žádné BEGIN neposílá.
+    """
+    if conn.dialect.name != 'sqlite':
+        return  # PostgreSQL má autovacuum
+    if conn.exec_driver_sql('PRAGMA main.auto_vacuum').scalar() == 2:
+        return
+    conn.exec_driver_sql('PRAGMA main.auto_vacuum=INCREMENTAL')
+    conn.exec_driver_sql('VACUUM main')
+
+
+# (verze, popis, funkce(conn, metadata)) – jen přidávat na konec
+MIGRATIONS = [
+    (1, 'Výchozí schéma a sloupce doplňované dřív při startu', _baseline),
+    (2, 'Reklamace ve stavu Sleva převedeny na Zamítnuto', _stav_sleva_na_zamitnuto),
+    (3, 'Studený archiv reklamací a jejich logu', _studeny_archiv),
+    (4, 'Tabulka maintenance_run s během úloh údržby', _maintenance_run),
+    (5, 'Zásilky reklamací do Ústí (manifesty)', _zasilky),
+    (6, 'SQLite auto_vacuum=INCREMENTAL (jednorázový VACUUM)', _auto_vacuum_incremental),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(engine):
+    """Aktuální verze schématu – jediný dotaz; 0, pokud tabulka schema_version ještě není."""
+    with engine.connect() as conn:
+        try:
+            return conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+        except (OperationalError, ProgrammingError):
+            return 0
+
+
+def pending(version):
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def upgrade(engine, metadata, logger=None):
+    """Aplikuje čekající migrace, každou ve vlastní transakci. Vrací seznam aplikovaných verzí."""
+    version = current_version(engine)
+    todo = pending(version)
+    if not todo:
+        return []
+    schema_metadata.create_all(engine)
+    applied = []
+    for number, popis, step in todo:
+        try:
+            with engine.begin() as conn:
+                step(conn, metadata)
+                conn.execute(schema_version.insert().values(version=number, popis=popis, applied_at=datetime.now()))
+        except IntegrityError:
+            # Stejnou verzi mezitím aplikoval jiný proces (víc workerů startuje naráz)
+            if logger:
+                logger.info(f'Migrace {number} už byla aplikována jiným procesem')
+            continue
+        applied.append(number)
+        if logger:
+            logger.info(f'Migrace {number}: {popis}')
+    return applied
+
+
+def stamp(engine, version=LATEST_VERSION):
+    """Označí schéma jako migrované do dané verze bez spuštění kroků (po create_all na prázdné DB)."""
+    schema_metadata.create_all(engine)
+    with engine.begin() as conn:
+        done = {row[0] for row in conn.execute(text('SELECT version FROM schema_version'))}
+        for number, popis, _step in MIGRATIONS:
+            if number <= version and number not in done:
+                conn.execute(schema_version.insert().values(version=number, popis=popis, applied_at=datetime.now()))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else 'status'
+    if command not in ('status', 'upgrade'):
+        print('Použití: python migrations.py [status|upgrade]')
+        return 2
+
+    from app import create_app, db
+
+    app = create_app()
+    with app.app_context():
+        version = current_version(db.engine)
+        print(f'Databáze: {db.engine.url.render_as_string(hide_password=True)}')
+        print(f'Verze schématu: {version} (nejnovější {LATEST_VERSION})')
+        if command == 'status':
+            for number, popis, _step in pending(version):
+                print(f'  čeká {number}: {popis}')
+            return 0
+        applied = upgrade(db.engine, db.metadata, app.logger)
+        popisy = {number: popis for number, popis, _step in MIGRATIONS}
+        for number in applied:
+            print(f'  aplikována {number}: {popisy[number]}')
+        if not applied:
+            print('Schéma je aktuální.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
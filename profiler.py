@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Profilování requestů – čas celého requestu, čas v SQL, počet dotazů,
+čas renderování Jinja šablon a velikost odpovědi.
+
+Statistiky se sbírají přes SQLAlchemy události `before/after_cursor_execute`
+a Flask signály `before_render_template` / `template_rendered`. Pro každý
+endpoint se drží posledních N vzorků, ze kterých admin stránka /admin/perf
+počítá percentily. Admin může pro jediný request zapnout cProfile hlavičkou
+`X-Profile: 1`.
+"""
+
+import cProfile
+import io
+import math
+import pstats
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import before_render_template, g, has_app_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = 'X-Profile'
+
+
+def current_stats():
+    """Vrací rozpracované statistiky aktuálního requestu (nebo None mimo request)."""
+    if not has_app_context():
+        return None
+    return g.get('_perf')
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._perf_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    start = getattr(context, '_perf_start', None)
+    if stats is None or start is None:
+        return
+    stats['sql_count'] += 1
+    stats['sql_time'] += time.perf_counter() - start
+
+
+def percentile(values, pct):
+    """Percentil z neseřazeného seznamu (metoda nejbližšího pořadí)."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+class RequestProfiler:
+    """Flask rozšíření sbírající per-request metriky a agregace podle endpointu."""
+
+    def __init__(self, app=None, is_allowed_to_profile=None):
+        self.is_allowed_to_profile = is_allowed_to_profile or (lambda: False)
+        self.samples_per_endpoint = 500
+        self.listeners = []  # volají se s (endpoint, záznam) po každém requestu
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()  # cProfile smí běžet jen v jednom vlákně naráz
+        self.profiles = deque(maxlen=10)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.samples_per_endpoint = app.config.get('PROFILER_SAMPLES', 500)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.extensions['profiler'] = self
+
+    def _before_request(self):
+        g._perf = {
+            'start': time.perf_counter(),
+            'sql_count': 0,
+            'sql_time': 0.0,
+            'render_time': 0.0,
+            'render_start': None,
+        }
+        if request.headers.get(PROFILE_HEADER) == '1' and self.is_allowed_to_profile():
+            if self._profile_lock.acquire(blocking=False):
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:
+                    # Jiný profiler (debugger, coverage) už běží
+                    self._profile_lock.release()
+                else:
+                    g._perf_profile = profile
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = current_stats()
+        if stats is not None:
+            stats['render_start'] = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = current_stats()
+        if stats is not None and stats['render_start'] is not None:
+            stats['render_time'] += time.perf_counter() - stats['render_start']
+            stats['render_start'] = None
+
+    def _after_request(self, response):
+        stats = g.pop('_perf', None)
+        profile_id = self._stop_profile(response)
+        if stats is None:
+            return response
+        if response.content_length is not None:
+            size = response.content_length
+        elif not response.is_streamed:
+            size = len(response.get_data())
+        else:
+            size = 0
+        record = {
+            'status': response.status_code,
+            'wall_ms': (time.perf_counter() - stats['start']) * 1000,
+            'sql_ms': stats['sql_time'] * 1000,
+            'sql_count': stats['sql_count'],
+            'render_ms': stats['render_time'] * 1000,
+            'size': size,
+        }
+        endpoint = request.endpoint or '(404)'
+        self._add_sample(endpoint, record)
+        for listener in self.listeners:
+            listener(endpoint, record)
+        if profile_id is not None:
+            response.headers['X-Profile-Id'] = str(profile_id)
+        return response
+
+    def _teardown_request(self, exception=None):
+        # Pojistka pro případ, že after_request neproběhl (výjimka mimo view)
+        profile = g.pop('_perf_profile', None)
+        if profile is not None:
+            profile.disable()
+            self._profile_lock.release()
+
+    def _stop_profile(self, response):
+        profile = g.pop('_perf_profile', None)
+        if profile is None:
+            return None
+        profile.disable()
+        self._profile_lock.release()
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(40)
+        profile_id = int(time.time() * 1000)
+        self.profiles.appendleft({
+            'id': profile_id,
+            'endpoint': request.endpoint,
+            'path': request.full_path,
+            'status': response.status_code,
+            'datum': datetime.now(),
+            'text': out.getvalue(),
+        })
+        return profile_id
+
+    def _add_sample(self, endpoint, record):
+        samples = self._samples.get(endpoint)
+        if samples is None:
+            with self._lock:
+                samples = self._samples.setdefault(endpoint, deque(maxlen=self.samples_per_endpoint))
+        samples.append(record)
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+        self.profiles.clear()
+
+    def summary(self):
+        """Percentily podle endpointu, seřazené podle p95 času requestu (nejpomalejší nahoře)."""
+        rows = []
+        for endpoint, samples in list(self._samples.items()):
+            records = list(samples)
+            if not records:
+                continue
+            wall = [r['wall_ms'] for r in records]
+            sql_ms = [r['sql_ms'] for r in records]
+            sql_count = [r['sql_count'] for r in records]
+            render = [r['render_ms'] for r in records]
+            size = [r['size'] for r in records]
+            rows.append({
+                'endpoint': endpoint,
+                'count': len(records),
+                'errors': sum(1 for r in records if r['status'] >= 500),
+                'wall_p50': percentile(wall, 50),
+                'wall_p95': percentile(wall, 95),
+                'wall_p99': percentile(wall, 99),
+                'sql_ms_p50': percentile(sql_ms, 50),
+                'sql_ms_p95': percentile(sql_ms, 95),
+                'sql_count_p50': percentile(sql_count, 50),
+                'sql_count_max': max(sql_count),
+                'render_p95': percentile(render, 95),
+                'size_p50': percentile(size, 50),
+            })
+        rows.sort(key=lambda r: r['wall_p95'], reverse=True)
+        return rows
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Rozpočet dotazů na request – ochrana před "utečenými" reportovacími dotazy.
+
+Každá třída rout má časový limit (ms) pro SQL. Počítá se jen čas strávený v
+databázi (součet příkazů requestu) – renderování šablon, openpyxl ani jiná práce
+v Pythonu se do rozpočtu nezapočítá. Na SQLite limit vynucuje progress handler,
+který porovná dosavadní čas SQL včetně běžícího příkazu s rozpočtem; na PostgreSQL
+`SET LOCAL statement_timeout` se zbývajícím rozpočtem před každým příkazem. Přerušený dotaz skončí
+výjimkou, kterou routa pozná přes `is_query_budget_exceeded()` a zobrazí
+srozumitelnou hlášku místo toho, aby vlákno a připojení držela minuty.
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BUDGET_MESSAGE = 'Výsledky jsou příliš náročné na výpočet – zužte prosím filtr (rok, měsíc, pobočka).'
+
+# Jak často SQLite volá progress handler (počet instrukcí VM)
+_PROGRESS_STEPS = 1000
+
+_state = threading.local()
+
+
+def _remaining():
+    """Zbývající rozpočet SQL v sekundách (včetně běžícího příkazu); None = bez limitu."""
+    budget = getattr(_state, 'budget', None)
+    if budget is None:
+        return None
+    spent = _state.spent
+    started = getattr(_state, 'statement_start', None)
+    if started is not None:
+        spent += time.monotonic() - started
+    return budget - spent
+
+
+def _progress_handler():
+    remaining = _remaining()
+    if remaining is not None and remaining < 0:
+        _state.exceeded = True
+        return 1  # nenulová hodnota = přerušit dotaz
+    return 0
+
+
+def _statement_done():
+    started = getattr(_state, 'statement_start', None)
+    if started is not None:
+        _state.spent += time.monotonic() - started
+        _state.statement_start = None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    remaining = _remaining()
+    if remaining is None:
+        return
+    _state.statement_start = time.monotonic()
+    if conn.dialect.name == 'sqlite':
+        # Handler se instaluje jednou na DBAPI připojení; termín čte z thread-local stavu
+        if not conn.info.get('_budget_handler'):
+            conn.connection.driver_connection.set_progress_handler(_progress_handler, _PROGRESS_STEPS)
+            conn.info['_budget_handler'] = True
+    elif conn.dialect.name == 'postgresql':
+        # Timeout platí pro jeden příkaz – nastavuje se před každým na zbytek rozpočtu
+        # (jednou za transakci by pozdější příkazy dostaly celý rozpočet znovu)
+        remaining_ms = max(int(remaining * 1000), 1)
+        cursor.execute(f'SET LOCAL statement_timeout = {remaining_ms}')
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _statement_done()
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    _statement_done()  # i přerušený příkaz spotřeboval svůj čas
+
+
+def is_query_budget_exceeded(error):
+    """True, pokud výjimka vznikla přerušením dotazu kvůli rozpočtu."""
+    orig = getattr(error, 'orig', error)
+    if isinstance(orig, sqlite3.OperationalError) and 'interrupted' in str(orig):
+        return True
+    return getattr(orig, 'pgcode', None) == '57014'  # query_canceled
+
+
+def budget_exceeded():
+    """True, pokud v aktuálním requestu už nějaký dotaz narazil na limit."""
+    return bool(getattr(_state, 'exceeded', False))
+
+
+@contextmanager
+def limit(ms):
+    """Omezí čas SQL v bloku na `ms` milisekund (pro CLI skripty a testy)."""
+    previous = getattr(_state, 'budget', None), getattr(_state, 'spent', 0.0)
+    _state.budget, _state.spent = ms / 1000.0, 0.0
+    _state.statement_start = None
+    _state.exceeded = False
+    try:
+        yield
+    finally:
+        _state.budget, _state.spent = previous
+
+
+class QueryBudget:
+    """Flask rozšíření – nastaví rozpočet SQL podle třídy routy na začátku requestu."""
+
+    def __init__(self, app=None, classify=None):
+        self.classify = classify or (lambda endpoint: 'interactive')
+        self.budgets = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.budgets = dict(app.config.get('QUERY_BUDGET_MS', {}))
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['query_budget'] = self
+
+    def _before_request(self):
+        _state.exceeded = False
+        budget_ms = self.budgets.get(self.classify(request.endpoint))
+        _state.budget = budget_ms / 1000.0 if budget_ms else None
+        _state.spent = 0.0
+        _state.statement_start = None
+
+    def _teardown_request(self, exception=None):
+        _state.budget = None
+        _state.statement_start = None
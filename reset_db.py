@@ -9,7 +9,9 @@ Spustit: python reset_db.py
 
 import os
 import sys
-from app import app, db, User, Pobocka, Odber, Reklamace, Akce, ReklamaceLog
+from app import create_app, db, User, Pobocka, Odber, Reklamace, Akce, ReklamaceLog
+
+app = create_app()
 
 def reset_database():
     """Vytvoří novou čistou databázi."""
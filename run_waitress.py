@@ -3,10 +3,29 @@
 """
 Spuštění aplikace přes Waitress – dostupná z celé sítě (0.0.0.0).
 Použití: python run_waitress.py
+
+Víc procesů (WAITRESS_WORKERS=4, jen Linux/macOS): supervisor otevře naslouchací
+socket a spustí N workerů, které ho sdílejí – každý má vlastní GIL, takže
+renderování šablon a exporty škálují přes jádra. Spadlý worker se restartuje,
+SIGHUP provede postupný reload (nový worker nastartuje a teprve pak se starý
+ukončí; rozběhnuté requesty dokončí), SIGTERM/Ctrl+C vše ukončí.
+Pool připojení, SQLite cache a sloty admission control se dělí mezi workery
+(viz worker_env). Každý worker dostane číslo (WAITRESS_WORKER_ID): metriky nesou
+štítek worker a logy se píší do vlastních souborů (logs/app.worker1.log, …), aby
+se rotace workerů nepřetahovaly o jeden soubor.
+
+Jen za proces zůstávají: /admin/perf (percentily a pomalé dotazy v paměti),
+/health/ready (fronty admission control) a /metrics – scrape vrátí metriky toho
+workeru, který request obsloužil; součet dává až sum() v Prometheu.
 """
 
 import os
+import select
+import signal
+import socket
+import subprocess
 import sys
+import time
 
 # Cesta k adresáři site (kde je app.py)
 SITE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -14,15 +33,195 @@ if SITE_DIR not in sys.path:
     sys.path.insert(0, SITE_DIR)
 os.chdir(SITE_DIR)
 
-from app import app
-from waitress import serve
-
 # Host 0.0.0.0 = naslouchá na všech rozhraních (přístup z jiných počítačů v síti)
 # Port lze změnit přes proměnnou prostředí PORT (např. PORT=5000)
 HOST = os.environ.get("WAITRESS_HOST", "0.0.0.0")
 PORT = int(os.environ.get("PORT", "8080"))
+# Počet vláken na proces – stejná hodnota řídí i rozdělení slotů v admission control (app.py)
+THREADS = int(os.environ.get("WAITRESS_THREADS", "8"))
+WORKERS = int(os.environ.get("WAITRESS_WORKERS", "1"))
+# Horní mez připojení do DB za všechny workery dohromady (0 = bez limitu, např. Neon free = 100)
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", "0"))
+SQLITE_CACHE_KB = int(os.environ.get("SQLITE_CACHE_KB", "64000"))
+# Sloty těžkých admin pruhů za všechny workery dohromady (výchozí hodnoty jako v app.py)
+ADMISSION_REPORT_SLOTS = int(os.environ.get("ADMISSION_REPORT_SLOTS", "2"))
+ADMISSION_EXPORT_SLOTS = int(os.environ.get("ADMISSION_EXPORT_SLOTS", "1"))
+ADMISSION_QUEUE = int(os.environ.get("ADMISSION_QUEUE", "4"))
+# Jak dlouho smí worker při ukončení dokončovat rozběhnuté requesty (s)
+GRACEFUL_TIMEOUT = float(os.environ.get("WAITRESS_GRACEFUL_TIMEOUT", "30"))
+READY_TIMEOUT = 60.0
 
-if __name__ == "__main__":
-    print(f"Waitress: http://{HOST}:{PORT}")
+
+def worker_env(workers, threads, max_connections=0, sqlite_cache_kb=64000,
+               report_slots=2, export_slots=1, admission_queue=4):
+    """Proměnné prostředí pro jeden worker: pool = vlákna, ale v součtu nejvýš max_connections.
+
+    Sloty report/export se dělí stejně – každý worker si ale nechá aspoň 1 slot.
+    """
+    pool_size, overflow = threads, 2
+    if max_connections:
+        pool_size = max(1, min(threads, max_connections // workers))
+        overflow = 0
+    return {
+        "DB_POOL_SIZE": str(pool_size),
+        "DB_MAX_OVERFLOW": str(overflow),
+        # Page cache je na připojení – celková paměť nesmí růst s počtem workerů
+        "SQLITE_CACHE_KB": str(max(2000, sqlite_cache_kb // workers)),
+        # Semafory admission control jsou v každém procesu zvlášť – limit platí za celý server
+        "ADMISSION_REPORT_SLOTS": str(max(1, report_slots // workers)),
+        "ADMISSION_EXPORT_SLOTS": str(max(1, export_slots // workers)),
+        "ADMISSION_QUEUE": str(admission_queue // workers),
+    }
+
+
+def serve_worker(sock, ready_fd=None):
+    """Běh jednoho workeru nad sdíleným socketem; SIGTERM = přestat přijímat a dokončit requesty."""
+    from waitress.server import create_server
+    from app import create_app, warm_up_app
+
+    app = create_app()
+    warm_up_app()  # socket sdílí ostatní workery – tenhle začne přijímat až zahřátý
+    server = create_server(app, sockets=[sock], threads=THREADS)
+    stopping = []
+
+    def _stop(signum, frame):
+        if not stopping:
+            stopping.append(time.monotonic() + GRACEFUL_TIMEOUT)
+            server.accepting = False
+            app.logger.info(f"Worker {os.getpid()}: ukončuji, dokončuji rozběhnuté requesty")
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    if ready_fd is not None:
+        os.write(ready_fd, b"1")
+        os.close(ready_fd)
+
+    while True:
+        server.asyncore.loop(timeout=1.0, map=server._map, use_poll=server.adj.asyncore_use_poll, count=1)
+        if not stopping:
+            continue
+        busy = False
+        for channel in list(server.active_channels.values()):
+            if channel.requests or channel.total_outbufs_len:
+                busy = True
+            else:
+                channel.will_close = True  # nečinná keep-alive spojení zavřít hned
+        if (not busy and not server.active_channels) or time.monotonic() > stopping[0]:
+            break
+    server.task_dispatcher.shutdown()
+
+
+class Supervisor:
+    """Drží naslouchací socket a N workerů (podprocesy se zděděným socketem)."""
+
+    def __init__(self, sock, workers):
+        self.sock = sock
+        self.workers = workers
+        self.procs = []
+        self.env = dict(os.environ, **worker_env(workers, THREADS, DB_MAX_CONNECTIONS, SQLITE_CACHE_KB,
+                                                 ADMISSION_REPORT_SLOTS, ADMISSION_EXPORT_SLOTS, ADMISSION_QUEUE))
+        self.reload_requested = False
+        self.stop_requested = False
+        self.restarts = []  # časy posledních restartů kvůli pádu – ochrana proti smyčce
+
+    def spawn(self, index, wait_ready=False):
+        """Spustí worker na pozici `index` – číslo pozice (od 1) je jeho štítek v metrikách a logech."""
+        fd = self.sock.fileno()
+        args = [sys.executable, os.path.abspath(__file__), "--worker-fd", str(fd)]
+        env = dict(self.env, WAITRESS_WORKER_ID=str(index + 1))
+        if not wait_ready:
+            return subprocess.Popen(args, env=env, pass_fds=(fd,), cwd=SITE_DIR)
+        # Worker zapíše do roury, jakmile je aplikace načtená a server vytvořený
+        read_fd, write_fd = os.pipe()
+        proc = subprocess.Popen(args + ["--ready-fd", str(write_fd)], env=env,
+                                pass_fds=(fd, write_fd), cwd=SITE_DIR)
+        os.close(write_fd)
+        try:
+            ready, _, _ = select.select([read_fd], [], [], READY_TIMEOUT)
+            if not ready or not os.read(read_fd, 1):
+                print(f"Worker {proc.pid} nenastartoval do {READY_TIMEOUT:.0f} s", flush=True)
+                self.terminate(proc)
+                return None
+        finally:
+            os.close(read_fd)
+        return proc
+
+    def terminate(self, proc):
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(GRACEFUL_TIMEOUT + 5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+    def rolling_reload(self):
+        """Po jednom: nový worker (nový kód) musí nastartovat dřív, než se starý ukončí."""
+        print(f"Reload: postupně nahrazuji {len(self.procs)} workerů", flush=True)
+        for i, old in enumerate(list(self.procs)):
+            new = self.spawn(i, wait_ready=True)
+            if new is None:
+                print("Reload přerušen – starý worker zůstává v provozu", flush=True)
+                return
+            self.procs[i] = new
+            self.terminate(old)
+        print("Reload dokončen", flush=True)
+
+    def run(self):
+        signal.signal(signal.SIGHUP, lambda *a: setattr(self, "reload_requested", True))
+        signal.signal(signal.SIGTERM, lambda *a: setattr(self, "stop_requested", True))
+        signal.signal(signal.SIGINT, lambda *a: setattr(self, "stop_requested", True))
+        self.procs = [self.spawn(i) for i in range(self.workers)]
+        while not self.stop_requested:
+            time.sleep(0.5)
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_reload()
+            for i, proc in enumerate(self.procs):
+                if proc.poll() is None:
+                    continue
+                now = time.monotonic()
+                self.restarts = [t for t in self.restarts if now - t < 60] + [now]
+                if len(self.restarts) > 5 * self.workers:
+                    print("Workery opakovaně padají, čekám 10 s před dalším restartem", flush=True)
+                    time.sleep(10)
+                print(f"Worker {proc.pid} skončil (kód {proc.returncode}), spouštím nový", flush=True)
+                self.procs[i] = self.spawn(i)
+        print("Ukončuji workery…", flush=True)
+        for proc in self.procs:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+        for proc in self.procs:
+            self.terminate(proc)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if "--worker-fd" in argv:
+        fd = int(argv[argv.index("--worker-fd") + 1])
+        ready_fd = int(argv[argv.index("--ready-fd") + 1]) if "--ready-fd" in argv else None
+        serve_worker(socket.socket(fileno=fd), ready_fd)
+        return
+
+    if WORKERS > 1 and os.name == "posix":
+        sock = socket.create_server((HOST, PORT), reuse_port=False, backlog=1024)
+        sock.set_inheritable(True)
+        print(f"Waitress: http://{HOST}:{PORT} (workerů: {WORKERS}, vláken na worker: {THREADS})")
+        print("Reload: kill -HUP <pid supervisoru>, ukončení: Ctrl+C")
+        Supervisor(sock, WORKERS).run()
+        return
+
+    if WORKERS > 1:
+        print("Víc workerů je podporováno jen na Linux/macOS – spouštím jeden proces")
+    from app import create_app, warm_up_app
+    from waitress import serve
+
+    app = create_app()
+    warm_up_app()
+    print(f"Waitress: http://{HOST}:{PORT} (vláken: {THREADS})")
     print("Ukončení: Ctrl+C")
-    serve(app, host=HOST, port=PORT)
+    serve(app, host=HOST, port=PORT, threads=THREADS)
+
+
+if __name__ == "__main__":
+    main()
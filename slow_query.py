@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Záznam pomalých SQL dotazů včetně plánu (EXPLAIN).
+
+Každý příkaz delší než `SLOW_QUERY_MS` se zapíše do samostatného rotovaného
+logu (logs/slow_queries.log) se svým SQL, tvarem parametrů (typy, ne hodnoty –
+v parametrech jsou jména a telefony zákazníků), délkou, routou a výstupem
+`EXPLAIN QUERY PLAN` (SQLite) nebo `EXPLAIN` (PostgreSQL). Posledních N záznamů
+je vidět i na admin stránce /admin/perf.
+"""
+
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+
+
+def param_shape(parameters):
+    """Popis parametrů bez hodnot, např. 'int, str×3' nebo '{id: int}'."""
+    if parameters is None:
+        return ''
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{k}: {type(v).__name__}' for k, v in parameters.items()) + '}'
+    parts = []
+    for value in parameters:
+        name = type(value).__name__
+        if parts and parts[-1][0] == name:
+            parts[-1][1] += 1
+        else:
+            parts.append([name, 1])
+    return ', '.join(name if count == 1 else f'{name}×{count}' for name, count in parts)
+
+
+def explain(dbapi_connection, dialect_name, statement, parameters):
+    """Vrátí plán dotazu jako seznam řádků (prázdný, pokud EXPLAIN nejde spustit)."""
+    if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+        return []
+    cursor = dbapi_connection.cursor()
+    try:
+        if dialect_name == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ())
+            rows = cursor.fetchall()
+            depth = {0: -1}
+            lines = []
+            for node_id, parent, _unused, detail in rows:
+                depth[node_id] = depth.get(parent, -1) + 1
+                lines.append('  ' * depth[node_id] + detail)
+            return lines
+        if dialect_name == 'postgresql':
+            # EXPLAIN běží v transakci requestu – jeho chyba (nepodporovaný příkaz, statement_timeout)
+            # by ji přepnula do stavu aborted; savepoint ji po chybě vrátí do použitelného stavu
+            cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                cursor.execute('EXPLAIN ' + statement, parameters)
+                lines = [row[0] for row in cursor.fetchall()]
+            except Exception:
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+                raise
+            cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+            return lines
+        return []
+    finally:
+        cursor.close()
+
+
+class SlowQueryLog:
+    """Flask rozšíření – posluchač na všech SQLAlchemy enginech aplikace."""
+
+    def __init__(self, app=None):
+        self.threshold_ms = 0
+        self.entries = deque(maxlen=100)
+        self.logger = logging.getLogger('odbery.slow_query')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.threshold_ms = app.config.get('SLOW_QUERY_MS', 250)
+        self.entries = deque(maxlen=app.config.get('SLOW_QUERY_KEEP', 100))
+        log_path = app.config.get('SLOW_QUERY_LOG')
+        if log_path and not self.logger.handlers:
+            os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+            handler = RotatingFileHandler(log_path, maxBytes=10240000, backupCount=5, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.extensions['slow_query'] = self
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_slow_query_start', None)
+        if not self.threshold_ms or start is None:
+            return
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+        plan = []
+        if not executemany:
+            # EXPLAIN jde přímo přes DBAPI kurzor, takže znovu nespouští SQLAlchemy události
+            try:
+                plan = explain(cursor.connection, conn.dialect.name, statement, parameters)
+            except Exception as e:
+                plan = [f'(EXPLAIN selhal: {e})']
+        self.record(statement, parameters if not executemany else None, duration_ms, plan)
+
+    def record(self, statement, parameters, duration_ms, plan):
+        entry = {
+            'datum': datetime.now(),
+            'duration_ms': duration_ms,
+            'route': request.endpoint if has_request_context() else '(mimo request)',
+            'sql': statement.strip(),
+            'params': param_shape(parameters),
+            'plan': plan,
+        }
+        self.entries.appendleft(entry)
+        self.logger.info(
+            '%.1f ms [%s] params=(%s)\n%s\nPLAN:\n%s\n',
+            entry['duration_ms'], entry['route'], entry['params'], entry['sql'],
+            '\n'.join(plan) or '(bez plánu)',
+        )
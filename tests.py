@@ -5,16 +5,95 @@ Testy pro aplikaci Odběry
 Spustit: python tests.py
 """
 
+import gzip
+import io
+import json
+import logging
+import threading
 import unittest
 import os
+import sqlite3
+import subprocess
 import sys
-from datetime import date
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 
 # Přidáme cestu k aplikaci
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, db, User, Pobocka, Odber, Reklamace
+from app import create_app, db, admission, get_current_time as app_now, slow_queries, User, Pobocka, Odber, Reklamace, Akce, ReklamaceLog
+import app as app_module
 from werkzeug.security import generate_password_hash
+from flask import g
+from sqlalchemy import create_engine, event, inspect as sa_inspect
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, raiseload
+import admission as admission_module
+import query_budget
+import slow_query
+import migrations
+import migrate_to_postgres
+import backup
+import run_waitress
+import warmup
+import health
+import log_queue
+import cold_storage
+from importer import read_rows, run_import
+from bench.generate import DataGenerator
+from bench import loadtest, plan_audit
+
+# Testy běží proti databázi v paměti – import app.py sám do žádné databáze nesahá
+app = create_app({
+    'TESTING': True,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+    'WTF_CSRF_ENABLED': False,
+    'SECRET_KEY': 'test-secret-key',
+})
+
+
+# Strict mode: každý ORM dotaz v testech dostane raiseload('*'), takže líné načtení
+# relace, které by poslalo SQL, skončí výjimkou místo tichého N+1 v produkci.
+# Vypnutí pro ladění: STRICT_LOADING=0 python tests.py
+STRICT_LOADING = os.environ.get('STRICT_LOADING', '1') != '0'
+
+
+def _raiseload_everything(execute_state):
+    """Posluchač do_orm_execute – relace načítat jen explicitně (joinedload/selectinload)."""
+    if execute_state.is_select and not execute_state.is_column_load and not execute_state.is_relationship_load:
+        execute_state.statement = execute_state.statement.options(raiseload('*', sql_only=True))
+
+
+@contextmanager
+def count_queries():
+    """Zachytí SQL příkazy poslané do databáze v bloku – vrací jejich seznam."""
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', _record)
+
+
+# Maximální počet SQL příkazů na request (včetně načtení uživatele a session).
+# Rozpočty nesmí záviset na počtu poboček ani řádků – test je měří s více pobočkami.
+ROUTE_QUERY_BUDGETS = {
+    '/': 8,
+    '/reklamace': 6,
+    '/branch/{pobocka_id}': 5,
+    '/reklamace/branch/{pobocka_id}': 5,
+    '/admin/dashboard': 12,
+    '/admin/statistiky': 8,
+    '/admin/reklamace-archiv': 5,
+    '/admin/historie': 5,
+    '/admin/user/{user_id}/edit': 6,
+}
 
 
 class TestCase(unittest.TestCase):
@@ -55,9 +134,13 @@ class TestCase(unittest.TestCase):
         db.session.add(self.test_user)
         
         db.session.commit()
+        if STRICT_LOADING:
+            event.listen(Session, 'do_orm_execute', _raiseload_everything)
     
     def tearDown(self):
         """Uklízení po testu."""
+        if STRICT_LOADING:
+            event.remove(Session, 'do_orm_execute', _raiseload_everything)
         db.session.remove()
         db.drop_all()
         self.app_context.pop()
@@ -202,6 +285,826 @@ class TestCase(unittest.TestCase):
             response = self.app.get(f'/branch/{pobocka.id}')
             self.assertEqual(response.status_code, 200, f"Uživatel nemá přístup k pobočce {pobocka.nazev}")
 
+    def _create_branch_data(self, pocet_pobocek=5):
+        """Více poboček s odběry, reklamacemi a historií – aby se N+1 projevilo v počtu dotazů."""
+        dnes = date.today()
+        pobocky = [self.test_pobocka]
+        for i in range(pocet_pobocek - 1):
+            pobocka = Pobocka(nazev=f'Pobočka {i + 2}')
+            db.session.add(pobocka)
+            pobocky.append(pobocka)
+        db.session.flush()
+        for pobocka in pobocky:
+            for j, stav in enumerate(('aktivní', 'aktivní', 'vydáno', 'nevyzvednuto')):
+                db.session.add(Odber(pobocka_id=pobocka.id, jmeno=f'Zákazník {j}', kdo_zadal='Test Admin',
+                                     telefon='+420777123456', datum=dnes - timedelta(days=j * 5), stav=stav, castka=100.0))
+            for j, stav in enumerate(('Čeká', 'Výměna kus za kus', 'Zamítnuto')):
+                reklamace = Reklamace(pobocka_id=pobocka.id, zakaznik=f'Zákazník {j}', znacka='Nike', model='Air',
+                                      datum_prijmu=dnes, datum_zakoupeni=dnes - timedelta(days=30),
+                                      popis_zavady='Odlepená podrážka', stav=stav, archived=(j == 2))
+                db.session.add(reklamace)
+                db.session.flush()
+                db.session.add(ReklamaceLog(reklamace_id=reklamace.id, uzivatel='testadmin', akce='Založena',
+                                            datum=app_now(), pobocka_id=pobocka.id))
+            db.session.add(Akce(odber_id=0, uzivatel='testadmin', akce='Přidán odběr', datum=app_now(), pobocka_id=pobocka.id))
+        self.test_user.pobocky = pobocky[:3]
+        db.session.commit()
+        return pobocky
+
+    def assertQueryBudget(self, url, budget):
+        """Request nesmí poslat víc SQL příkazů než budget (a nesmí spadnout na líném načtení).
+
+        Routy chyby často jen zalogují a vykreslí prázdnou stránku – proto hlídáme i ERROR v logu.
+        """
+        # Jako v produkci: prázdná session a znovu načtený uživatel (testy sdílí app context s requesty)
+        db.session.expunge_all()
+        g.pop('_login_user', None)
+        with self.assertNoLogs(app.logger, level='ERROR'), count_queries() as statements:
+            response = self.app.get(url)
+        self.assertLess(response.status_code, 400, f'{url} vrátil {response.status_code}')
+        self.assertLessEqual(len(statements), budget,
+                             f'{url}: {len(statements)} SQL příkazů (rozpočet {budget}):\n' + '\n'.join(statements))
+        return response
+
+    def test_bulk_update_changes_many_pickups_in_one_request(self):
+        """Test hromadné změny stavu odběrů: jedna transakce, log akcí a kontrola pobočky."""
+        cizi = Pobocka(nazev='Cizí Pobočka')
+        db.session.add(cizi)
+        db.session.flush()
+        odbery = [Odber(pobocka_id=self.test_pobocka.id, jmeno=f'O{i}', kdo_zadal='k', datum=date.today()) for i in range(3)]
+        odbery.append(Odber(pobocka_id=cizi.id, jmeno='Cizí', kdo_zadal='k', datum=date.today()))
+        db.session.add_all(odbery)
+        db.session.commit()
+        ids = [o.id for o in odbery]
+        url = f'/branch/{self.test_pobocka.id}/update_bulk'
+        self.login('5678')
+        self.assertEqual(self.app.post(f'/branch/{cizi.id}/update_bulk', json={'ids': ids, 'action': 'vydano'}).status_code, 403)
+        self.assertEqual(self.app.post(url, json={'ids': ids, 'action': 'prodat'}).status_code, 400)
+        with count_queries() as statements:
+            response = self.app.post(url, json={'ids': ids + [999], 'action': 'vydano'})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['updated'], ids[:3])
+        self.assertEqual(data['missing'], [ids[3], 999])
+        self.assertLessEqual(len([s for s in statements if s.lstrip().upper().startswith(('UPDATE', 'INSERT'))]), 2)
+        db.session.expire_all()
+        self.assertEqual([o.stav for o in Odber.query.order_by(Odber.id)], ['vydáno'] * 3 + ['aktivní'])
+        self.assertEqual(Akce.query.filter_by(akce='Stav změněn na vydáno', uzivatel='testuser').count(), 3)
+
+    def test_shipment_sends_and_receives_claims_in_one_transaction(self):
+        """Test zásilky do Ústí: hromadný přechod stavů, log po dávkách, manifest a příjem s výjimkou."""
+        pobocka_id = self.test_pobocka.id
+        claims = []
+        for i, stav in enumerate(('Čeká', 'Čeká', 'Čeká', 'Zamítnuto')):
+            r = Reklamace(pobocka_id=pobocka_id, zakaznik=f'Zásilka {i}', znacka='Nike', stav=stav,
+                          datum_prijmu=date.today(), popis_zavady=f'Závada {i}')
+            db.session.add(r)
+            claims.append(r)
+        db.session.commit()
+        ids = [r.id for r in claims]
+        self.login('5678')
+        with count_queries() as statements:
+            response = self.app.post(f'/reklamace/branch/{pobocka_id}/zasilka',
+                                     data={'reklamace_ids': ids, 'poznamka': 'Týdenní'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len([s for s in statements if s.lstrip().upper().startswith(('UPDATE', 'INSERT'))]), 4)
+        zasilka = app_module.Zasilka.query.one()
+        self.assertIn(f'/reklamace/zasilka/{zasilka.id}', response.location)
+        db.session.expire_all()
+        self.assertEqual([r.stav for r in Reklamace.query.order_by(Reklamace.id)], ['Posláno do Ústí'] * 3 + ['Zamítnuto'])
+        self.assertEqual(ReklamaceLog.query.count(), 3)
+
+        page = self.app.get(f'/reklamace/zasilka/{zasilka.id}').get_data(as_text=True)
+        self.assertIn('Závada 2', page)
+        self.assertNotIn('Závada 3', page)
+        self.assertIn('Týdenní', self.app.get(f'/reklamace/branch/{pobocka_id}/zasilky').get_data(as_text=True))
+
+        response = self.app.post(f'/reklamace/zasilka/{zasilka.id}/prijmout',
+                                 data={'action': 'vymena', f'stav_{ids[1]}': 'zamitnuto'})
+        self.assertEqual(response.status_code, 302)
+        db.session.expire_all()
+        self.assertEqual([r.stav for r in Reklamace.query.order_by(Reklamace.id)],
+                         ['Výměna kus za kus', 'Zamítnuto', 'Výměna kus za kus', 'Zamítnuto'])
+        self.assertEqual(app_module.Zasilka.query.one().stav, 'přijato')
+        self.assertEqual(ReklamaceLog.query.filter(ReklamaceLog.akce.like('%příjem zásilky%')).count(), 3)
+
+    def test_status_changes_answer_json_fragments_for_ajax(self):
+        """Test JSON variant změny stavu: odběr vrátí změnu počitadel, reklamace jen nový řádek."""
+        odber = Odber(pobocka_id=self.test_pobocka.id, jmeno='Ajax', kdo_zadal='k', datum=date.today() - timedelta(days=10))
+        reklamace = Reklamace(pobocka_id=self.test_pobocka.id, zakaznik='Ajax Zákazník', znacka='Nike',
+                              datum_prijmu=date.today(), popis_zavady='Vada')
+        db.session.add_all([odber, reklamace])
+        db.session.commit()
+        odber_id, reklamace_id = odber.id, reklamace.id
+        self.login('5678')
+        ajax = {'Accept': 'application/json, text/javascript, */*; q=0.01'}
+        db.session.expunge_all()
+        g.pop('_login_user', None)
+        with count_queries() as statements:
+            response = self.app.post(f'/update/{odber_id}', data={'action': 'vydano'}, headers=ajax)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['prehled'], {'celkem': -1, 'zelene': 0, 'cervene': -1})
+        self.assertLessEqual(len(statements), 5, '\n'.join(statements))
+
+        db.session.expunge_all()
+        g.pop('_login_user', None)
+        with count_queries() as statements:
+            response = self.app.post(f'/reklamace/{reklamace_id}/status', data={'action': 'poslano_usti'}, headers=ajax)
+        data = response.get_json()
+        self.assertEqual(data['stav'], 'Posláno do Ústí')
+        self.assertTrue(data['row'].lstrip().startswith(f'<tr data-id="{reklamace_id}"'))
+        self.assertIn('Posláno do Ústí', data['row'])
+        self.assertNotIn('<html', data['row'])
+        self.assertLessEqual(len(statements), 5, '\n'.join(statements))
+        self.assertEqual(self.app.post(f'/reklamace/{reklamace_id}/status', data={'action': 'x'}, headers=ajax).status_code, 400)
+        # Bez AJAX hlavičky zůstává redirect zpět na přehled
+        self.assertEqual(self.app.post(f'/reklamace/{reklamace_id}/status', data={'action': 'ceka'}).status_code, 302)
+
+    def test_import_validates_rows_and_inserts_in_batches(self):
+        """Test hromadného importu: pravidla z formulářů, chyby po řádcích, dávky s auditním logem."""
+        pobocka_id = self.test_pobocka.id
+        csv_odbery = ('Jméno;Telefon;Datum;Částka;Placeno předem;Stav\n'
+                      'Jan Novák;+420 777 123 456;01.02.2024;250,50;ano;vydáno\n'
+                      'Eva;777123;2024-02-02;;;\n'
+                      'Petr;777000111;2024-02-03;;;\n'
+                      '\n'
+                      'Karel;777000222;;;;\n'
+                      'Lada;777000444;2024-02-05;;;\n'
+                      'Ota;777000333;2024-02-04;;;ztraceno\n').encode('utf-8-sig')
+        self.login('1234')
+        app.config['IMPORT_BATCH_SIZE'] = 2
+        try:
+            with count_queries() as statements:
+                response = self.app.post('/admin/import', data={
+                    'kind': 'odbery', 'pobocka': pobocka_id, 'soubor': (io.BytesIO(csv_odbery), 'odbery.csv')})
+        finally:
+            app.config['IMPORT_BATCH_SIZE'] = 2000
+        self.assertEqual(response.status_code, 200)
+        page = response.get_data(as_text=True)
+        self.assertIn('Telefon musí být 9 číslic', page)
+        self.assertIn('ztraceno', page)
+        inserts = [s for s in statements if s.lstrip().upper().startswith('INSERT')]
+        self.assertEqual(len(inserts), 4)  # 3 platné řádky po 2 = 2 dávky × (odběry + audit)
+        db.session.expire_all()
+        odbery = Odber.query.order_by(Odber.id).all()
+        self.assertEqual([o.jmeno for o in odbery], ['Jan Novák', 'Petr', 'Lada'])
+        self.assertEqual((odbery[0].telefon, odbery[0].castka, odbery[0].placeno_predem, odbery[0].stav),
+                         ('+420777123456', 250.5, True, 'vydáno'))
+        self.assertEqual(odbery[1].kdo_zadal, 'Test Admin')
+        self.assertEqual(Akce.query.filter(Akce.akce.like('Importován odběr:%')).count(), 3)
+
+        # Reklamace z CLI: záruka se posuzuje ke dni přijetí, --dry-run nic nezapíše
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as f:
+            f.write('zakaznik,telefon,znacka,model,datum_prijmu,datum_zakoupeni,popis_zavady,stav\n'
+                    'Alena,777111222,Elf,Bar,2023-05-01,2022-01-01,Netáhne,Zamítnuto\n'
+                    'Bohouš,777111333,Elf,Bar,2024-06-01,2022-01-01,Teče,\n')
+        self.addCleanup(os.unlink, f.name)
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['import-data', 'reklamace', f.name, '--pobocka', str(pobocka_id), '--dry-run'])
+        self.assertIn('1/2 řádků ověřeno', result.output)
+        self.assertEqual(Reklamace.query.count(), 0)
+        result = runner.invoke(args=['import-data', 'reklamace', f.name, '--pobocka', str(pobocka_id), '--user', 'Papír'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('řádek 3: Záruka 2 roky již vypršela', result.output)
+        reklamace = Reklamace.query.one()
+        self.assertEqual((reklamace.zakaznik, reklamace.stav, reklamace.prijal), ('Alena', 'Zamítnuto', 'Papír'))
+        self.assertEqual(ReklamaceLog.query.filter_by(reklamace_id=reklamace.id, uzivatel='Papír').count(), 1)
+
+    def test_import_reports_bad_header_and_empty_file(self):
+        """Test importu: chybná hlavička i prázdný soubor skončí přehledem chyb, ne chybou 500."""
+        self.login('1234')
+        for content in (b'foo;bar\n1;2\n', b''):
+            response = self.app.post('/admin/import', data={
+                'kind': 'odbery', 'pobocka': self.test_pobocka.id, 'soubor': (io.BytesIO(content), 'odbery.csv')})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('v hlavičce chybí povinné sloupce', response.get_data(as_text=True))
+        self.assertEqual(Odber.query.count(), 0)
+        result = run_import(db.engine, app_module.IMPORT_SPECS['odbery'], iter(()), self.test_pobocka.id, 'Test', app_now())
+        self.assertEqual(result['errors'], [(1, 'prázdný soubor')])
+        self.assertIn('ms', result)
+
+    def test_import_csv_header_with_spaces_after_delimiter(self):
+        """Test importu: mezery za oddělovačem v hlavičce nesmí rozbít mapování sloupců."""
+        rows = read_rows(io.BytesIO('jmeno; telefon; datum\nJan; 777123456; 2024-02-01\n'.encode('utf-8')), 'odbery.csv')
+        result = run_import(db.engine, app_module.IMPORT_SPECS['odbery'], rows, self.test_pobocka.id, 'Test', app_now())
+        self.assertEqual((result['imported'], result['errors']), (1, []))
+        self.assertEqual(Odber.query.one().jmeno, 'Jan')
+
+    def test_route_query_budgets(self):
+        """Test, že hlavní routy drží rozpočet SQL příkazů nezávisle na počtu poboček."""
+        pobocky = self._create_branch_data()
+        params = {'pobocka_id': pobocky[1].id, 'user_id': self.test_user.id}
+        self.login('1234')
+        for route, budget in ROUTE_QUERY_BUDGETS.items():
+            self.assertQueryBudget(route.format(**params), budget)
+        self.app.get('/logout')
+        self.login('5678')
+        for route in ('/', '/reklamace', '/branch/{pobocka_id}', '/reklamace/branch/{pobocka_id}'):
+            self.assertQueryBudget(route.format(**params), ROUTE_QUERY_BUDGETS[route])
+
+    def test_admission_control_rejects_when_report_lane_full(self):
+        """Test, že plný pruh pro reporty vrátí 503 s Retry-After a pobočky jedou dál."""
+        self.login('1234')
+        lane = admission.lanes['report']
+        old_queue = lane.max_queue
+        lane.max_queue = 0
+        held = [lane.acquire() for _ in range(lane.slots)]
+        try:
+            response = self.app.get('/admin/statistiky')
+            self.assertEqual(response.status_code, 503)
+            self.assertIn('Retry-After', response.headers)
+            # Odmítnutí se objeví v metrikách requestů, i když profiler request nezačal
+            text = self.app.get('/metrics').get_data(as_text=True)
+            self.assertIn('odbery_http_requests_total{endpoint="admin_statistiky",method="GET",status="503"}', text)
+            self.assertIn('odbery_http_request_duration_seconds_count{endpoint="admin_statistiky",status="503"}', text)
+            # Interaktivní provoz pobočky není dotčen
+            response = self.app.get(f'/branch/{self.test_pobocka.id}')
+            self.assertEqual(response.status_code, 200)
+        finally:
+            for ok in held:
+                if ok:
+                    lane.release()
+            lane.max_queue = old_queue
+
+    def test_admission_heavy_lanes_leave_threads_for_interactive(self):
+        """Test, že aktivní i čekající těžké požadavky se vejdou do vláken mimo rezervu poboček."""
+        threads, reserved = app.config['WAITRESS_THREADS'], app.config['ADMISSION_RESERVED_INTERACTIVE']
+        heavy = [admission.lanes[name] for name in ('report', 'export')]
+        self.assertLessEqual(sum(lane.slots + lane.max_queue for lane in heavy), threads - reserved)
+        self.assertEqual(admission_module.plan_slots(8, 4, 2, 1, 4), {'report': (2, 1), 'export': (1, 0)})
+        self.assertEqual(admission_module.plan_slots(16, 4, 2, 1, 4), {'report': (2, 4), 'export': (1, 4)})
+
+        self.login('1234')
+        release = threading.Event()
+
+        def wait_in_queue(lane):
+            if lane.acquire():
+                release.wait(5)
+                lane.release()
+
+        held = [(lane, lane.acquire()) for lane in heavy for _ in range(lane.slots)]
+        waiters = [threading.Thread(target=wait_in_queue, args=(lane,)) for lane in heavy for _ in range(lane.max_queue)]
+        for t in waiters:
+            t.start()
+        try:
+            # Všechny sloty i fronty jsou plné – další report dostane hned 503, pobočka jede dál
+            for _ in range(100):
+                if sum(lane.snapshot()['waiting'] for lane in heavy) == len(waiters):
+                    break
+                threading.Event().wait(0.01)
+            self.assertEqual(self.app.get('/admin/statistiky').status_code, 503)
+            self.assertEqual(self.app.get(f'/branch/{self.test_pobocka.id}').status_code, 200)
+            self.assertLessEqual(len(held) + len(waiters), threads - reserved)
+        finally:
+            for lane, ok in held:
+                if ok:
+                    lane.release()
+            release.set()
+            for t in waiters:
+                t.join()
+
+    def test_query_budget_interrupts_runaway_query(self):
+        """Test, že dotaz přes rozpočet se přeruší a pozná se jako překročení limitu."""
+        runaway = db.text(
+            'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 50000000) '
+            'SELECT count(*) FROM c'
+        )
+        with self.assertRaises(OperationalError) as ctx:
+            with query_budget.limit(50):
+                db.session.execute(runaway).scalar()
+        self.assertTrue(query_budget.is_query_budget_exceeded(ctx.exception))
+        db.session.rollback()
+        # Mimo limit dotazy běží normálně
+        self.assertEqual(db.session.execute(db.text('SELECT 1')).scalar(), 1)
+
+    def test_query_budget_counts_only_sql_time(self):
+        """Test, že práce mimo databázi (šablony, openpyxl) rozpočet SQL nespotřebuje."""
+        with query_budget.limit(100):
+            threading.Event().wait(0.2)  # pomalá práce v Pythonu delší než celý rozpočet
+            cheap = 'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 5000) SELECT count(*) FROM c'
+            self.assertEqual(db.session.execute(db.text(cheap)).scalar(), 5000)
+        self.assertFalse(query_budget.budget_exceeded())
+
+    def test_query_budget_postgres_timeout_uses_remaining_sql_budget(self):
+        """Test, že na PostgreSQL dostane každý příkaz zbytek rozpočtu SQL, ne celý limit za transakci."""
+        class FakeCursor:
+            def __init__(self):
+                self.statements = []
+
+            def execute(self, statement):
+                self.statements.append(statement)
+
+        class FakeConn:
+            dialect = type('Dialect', (), {'name': 'postgresql'})()
+            info = {}
+
+        conn, cursor = FakeConn(), FakeCursor()
+        with query_budget.limit(10000):
+            query_budget._before_cursor_execute(conn, cursor, 'SELECT 1', {}, None, False)
+            query_budget._after_cursor_execute(conn, cursor, 'SELECT 1', {}, None, False)
+            query_budget._state.spent += 9  # první příkaz strávil v databázi 9 s
+            threading.Event().wait(0.05)  # čas mimo databázi se nepočítá
+            query_budget._before_cursor_execute(conn, cursor, 'SELECT 2', {}, None, False)
+            query_budget._after_cursor_execute(conn, cursor, 'SELECT 2', {}, None, False)
+        timeouts = [int(s.rsplit('=', 1)[1]) for s in cursor.statements]
+        self.assertEqual(len(timeouts), 2)
+        self.assertGreater(timeouts[0], 9900)
+        self.assertGreater(timeouts[1], 950)
+        self.assertLessEqual(timeouts[1], 1000)
+
+    def test_admin_perf_page_shows_profiled_routes(self):
+        """Test, že /admin/perf ukazuje změřené endpointy a je jen pro admina."""
+        self.login('5678')
+        response = self.app.get('/admin/perf', follow_redirects=True)
+        self.assertNotIn('Výkon rout'.encode('utf-8'), response.data)
+        self.app.get('/logout')
+
+        self.login('1234')
+        self.app.get(f'/branch/{self.test_pobocka.id}')
+        response = self.app.get('/admin/perf', headers={'X-Profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'<code>branch</code>', response.data)
+        self.assertIn('X-Profile-Id', response.headers)
+
+    def test_metrics_endpoint_prometheus_format(self):
+        """Test, že /metrics vrací čítače requestů, histogram a stav poolu."""
+        self.login('1234')
+        self.app.get(f'/branch/{self.test_pobocka.id}')
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        text = response.get_data(as_text=True)
+        self.assertIn('# TYPE odbery_http_requests_total counter', text)
+        self.assertIn('odbery_http_requests_total{endpoint="branch",method="GET",status="200"}', text)
+        self.assertIn('odbery_http_request_duration_seconds_bucket{endpoint="branch",status="200",le="+Inf"}', text)
+        self.assertIn('odbery_sql_compile_cache_total{result="hit"}', text)
+        self.assertIn('odbery_admission_waiting{lane="report"} 0', text)
+        # Worker z run_waitress.py označí všechny své řady, aby se scrapy různých procesů nemíchaly
+        app_module.metrics.registry.const_labels = (('worker', '2'),)
+        try:
+            text = self.app.get('/metrics').get_data(as_text=True)
+        finally:
+            app_module.metrics.registry.const_labels = ()
+        self.assertIn('odbery_http_requests_total{worker="2",endpoint="branch",method="GET",status="200"}', text)
+        self.assertIn('odbery_admission_waiting{worker="2",lane="report"} 0', text)
+
+    def test_bench_generator_is_deterministic(self):
+        """Test, že generátor benchmark dat dává pro stejný seed stejná data se zkreslenými značkami."""
+        counts = {'pobocky': 5, 'users': 10, 'odbery': 50, 'reklamace': 400}
+        first = DataGenerator(seed=1, counts=counts, end_date=date(2025, 6, 30))
+        second = DataGenerator(seed=1, counts=counts, end_date=date(2025, 6, 30))
+        self.assertEqual(list(first.odbery()), list(second.odbery()))
+        reklamace = list(first.reklamace())
+        self.assertEqual(reklamace, list(second.reklamace()))
+        self.assertEqual(len(reklamace), 400)
+        znacky = [r['znacka'] for r in reklamace]
+        self.assertGreater(znacky.count('Nike'), znacky.count('Crocs') * 5)
+
+    def test_loadtest_summary_counts_errors(self):
+        """Test, že souhrn zátěžového testu počítá percentily a chybovost včetně 503 a chyb spojení."""
+        stats = loadtest.Stats()
+        for ms in range(1, 101):
+            stats.record('branch_view', 200, float(ms))
+        stats.record('odber_create', 503, 5.0)
+        stats.error('odber_create')
+        summary = loadtest.summarize(stats, elapsed=10.0, lock_errors=2)
+        self.assertEqual(summary['requests'], 101)
+        self.assertEqual(summary['actions']['branch_view']['p95_ms'], 95.0)
+        self.assertEqual(summary['rejected_503'], 1)
+        self.assertEqual(summary['connection_errors'], 1)
+        self.assertAlmostEqual(summary['error_rate'], 2 / 102, places=4)
+        self.assertEqual(summary['sqlite_lock_errors'], 2)
+
+    def test_plan_audit_flags_scans_sorts_and_correlated_subqueries(self):
+        """Test, že audit plánů hlásí plný průchod, temp B-tree a korelovaný poddotaz, ne hledání přes index."""
+        plan = [
+            'SCAN odber',
+            'SCAN pobocka',
+            'SEARCH reklamace USING INDEX ix_reklamace_pobocka_id (pobocka_id=?)',
+            'SCAN akce USING COVERING INDEX ix_akce_datum',
+            'USE TEMP B-TREE FOR ORDER BY',
+            'CORRELATED SCALAR SUBQUERY 1',
+        ]
+        findings = plan_audit.classify_plan('sqlite', plan)
+        self.assertEqual([k for k, _ in findings], ['full-scan', 'temp-btree', 'correlated'])
+        self.assertEqual(findings[0][1], 'SCAN odber')
+        pg_plan = ['Sort  (cost=1.1..1.2)', '  ->  Seq Scan on reklamace  (cost=0.00..1.01)',
+                   '  ->  Index Scan using odber_pkey on odber']
+        self.assertEqual([k for k, _ in plan_audit.classify_plan('postgresql', pg_plan)], ['temp-btree', 'full-scan'])
+
+    def test_import_app_touches_no_database(self):
+        """Test, že import app.py a create_app() nevytvoří databázi ani nenačtou openpyxl."""
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'import_test.db')
+            code = ('import sys, app; app.create_app({"TESTING": True}); '
+                    'print("openpyxl" in sys.modules)')
+            out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)),
+                                 env=dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}'))
+            self.assertEqual(out.stdout.strip(), 'False')
+            self.assertFalse(os.path.exists(db_path))
+
+    def test_worker_pool_sizing_and_sqlite_pragmas(self):
+        """Test, že pool se dělí mezi workery podle limitu DB a SQLite připojení dostane PRAGMA."""
+        env = run_waitress.worker_env(workers=4, threads=8, max_connections=20, sqlite_cache_kb=64000)
+        self.assertEqual((env['DB_POOL_SIZE'], env['DB_MAX_OVERFLOW'], env['SQLITE_CACHE_KB']), ('5', '0', '16000'))
+        env = run_waitress.worker_env(workers=2, threads=8)
+        self.assertEqual((env['DB_POOL_SIZE'], env['DB_MAX_OVERFLOW']), ('8', '2'))
+        # Sloty admission control platí za celý server, ne za každý proces
+        env = run_waitress.worker_env(workers=2, threads=8, report_slots=4, export_slots=1, admission_queue=4)
+        self.assertEqual((env['ADMISSION_REPORT_SLOTS'], env['ADMISSION_EXPORT_SLOTS'], env['ADMISSION_QUEUE']),
+                         ('2', '1', '2'))
+        self.assertEqual(log_queue.worker_log_path('logs/app.log', '2'), 'logs/app.worker2.log')
+        self.assertEqual(log_queue.worker_log_path('logs/app.log', ''), 'logs/app.log')
+        self.assertEqual(db.session.execute(db.text('PRAGMA synchronous')).scalar(), 1)  # NORMAL
+        self.assertEqual(db.session.execute(db.text('PRAGMA cache_size')).scalar(), -app.config['SQLITE_CACHE_KB'])
+
+    def test_warm_up_compiles_templates_and_caches_bytecode(self):
+        """Test, že warm-up zkompiluje všechny šablony do bytecode cache a nahlásí připravenost."""
+        templates_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+        html = [n for n in os.listdir(templates_dir) if n.endswith('.html')]
+        previous_cache = app.jinja_env.bytecode_cache
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                warmup.enable_bytecode_cache(app, tmp)
+                app.jinja_env.cache.clear()
+                state = warmup.warm_up(app, db, queries=[('pobocky', lambda: Pobocka.query.all())])
+                self.assertEqual(len(os.listdir(tmp)), len(html))
+            finally:
+                app.jinja_env.bytecode_cache = previous_cache
+                app.jinja_env.cache.clear()
+        self.assertTrue(state['ready'])
+        self.assertEqual(state['errors'], [])
+        self.assertEqual(state['templates'], len(html))
+        self.assertIs(app.extensions['warmup'], state)
+        self.assertTrue({'mappers', 'templates', 'pool', 'pobocky', 'url_map'} <= set(state['steps']))
+
+    def test_readiness_checks_schema_and_write_lock(self):
+        """Test /health/live a /health/ready: chybějící migrace = 503, držený zápisový zámek = fail."""
+        self.assertEqual(self.app.get('/health/live').status_code, 200)
+        response = self.app.get('/health/ready')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()['checks']['schema']['status'], health.FAIL)
+        migrations.stamp(db.engine)
+        response = self.app.get('/health/ready')
+        data = response.get_json()
+        self.assertEqual(response.status_code, 200, data)
+        self.assertEqual(set(data['checks']), {'schema', 'pool', 'write_lock', 'wal', 'warmup', 'queues'})
+        self.assertEqual(data['checks']['schema']['status'], health.OK)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'lock.db')}")
+            self.assertLess(health.write_probe_ms(engine, timeout_ms=200), 200)
+            holder = engine.raw_connection()
+            holder.execute('BEGIN IMMEDIATE')
+            try:
+                with self.assertRaises(OperationalError):
+                    health.write_probe_ms(engine, timeout_ms=50)
+            finally:
+                holder.rollback()
+                holder.close()
+                engine.dispose()
+        self.assertEqual(health.grade(300, 250, 2000), health.WARN)
+
+    def test_list_views_skip_large_text_columns(self):
+        """Test, že seznamy reklamací nenačítají popis/řešení/poznámky a archiv připojí pobočku JOINem."""
+        db.session.add(Reklamace(pobocka_id=self.test_pobocka.id, zakaznik='Jan Projekce', znacka='Salomon',
+                                 datum_prijmu=date.today(), popis_zavady='x' * 5000, reseni='Výměna', stav='Čeká'))
+        db.session.commit()
+        self.login()
+        db.session.expunge_all()
+        for url in ('/admin/reklamace-archiv', f'/reklamace/branch/{self.test_pobocka.id}'):
+            with count_queries() as statements:
+                response = self.app.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn('Jan Projekce', response.get_data(as_text=True))
+            selects = [st for st in statements if 'FROM reklamace' in st]
+            self.assertEqual(len(selects), 1, url)
+            for column in ('popis_zavady', 'reseni', 'poznamky'):
+                self.assertNotIn(f'reklamace.{column}', selects[0], url)
+            if 'archiv' in url:
+                self.assertIn('JOIN pobocka', selects[0])
+                self.assertFalse([st for st in statements if st.lstrip().startswith('SELECT') and 'FROM pobocka' in st
+                                  and 'reklamace' not in st and 'pobocka.id = ?' in st])
+        response = self.app.get(f'/reklamace/branch/{self.test_pobocka.id}/export.csv')
+        self.assertIn('x' * 5000, response.get_data(as_text=True))
+
+    def test_archived_claims_move_to_cold_storage_and_read_through(self):
+        """Test přesunu starých archivovaných reklamací i s logem do studeného archivu a čtení přes obě tabulky."""
+        stare = app_now() - timedelta(days=400)
+        pobocka_id = self.test_pobocka.id
+        claims = []
+        for i, archived in enumerate((True, True, False, True)):
+            r = Reklamace(pobocka_id=pobocka_id, zakaznik=f'Chladný {i}', znacka='Nike', stav='Zamítnuto',
+                          datum_prijmu=date.today(), popis_zavady='Prasklá podrážka', archived=archived,
+                          archived_at=stare if archived else None)
+            db.session.add(r)
+            db.session.flush()
+            db.session.add(ReklamaceLog(reklamace_id=r.id, uzivatel='testadmin', akce='Archivována',
+                                        datum=stare, pobocka_id=pobocka_id))
+            claims.append(r.id)
+        db.session.commit()
+
+        self.assertEqual(app_module.presun_do_archivu(), (2, 2))  # poslední id zůstává v horké tabulce
+        self.assertEqual(app_module.presun_do_archivu(), (0, 0))
+        db.session.expunge_all()
+        self.assertEqual({r.id for r in Reklamace.query.all()}, {claims[2], claims[3]})
+        self.assertEqual(ReklamaceLog.query.count(), 2)
+        cold_ids = {row.id for row in db.session.query(app_module.reklamace_cold.c.id)}
+        self.assertEqual(cold_ids, {claims[0], claims[1]})
+
+        self.login()
+        page = self.app.get('/admin/reklamace-archiv').get_data(as_text=True)
+        for i in range(4):
+            self.assertIn(f'Chladný {i}', page)
+        self.assertIn('Chladný 0', self.app.get(f'/reklamace/branch/{pobocka_id}/export.csv').get_data(as_text=True))
+        self.assertEqual(self.app.get(f'/reklamace/{claims[0]}/print').status_code, 200)
+        response = self.app.get(f'/reklamace/{claims[0]}/edit')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/print', response.location)
+
+        # Archiv v samostatném souboru připojeném přes ATTACH
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'hot.db')}")
+            event.listen(engine, 'connect', lambda conn, rec: cold_storage.attach(conn, os.path.join(tmp, 'cold.db')))
+            with engine.begin() as conn:
+                Reklamace.__table__.create(conn)
+                ReklamaceLog.__table__.create(conn)
+                cold_storage.create_cold_tables(conn, db.metadata)
+                conn.execute(Reklamace.__table__.insert(), [
+                    {'id': i, 'pobocka_id': 1, 'zakaznik': 'X', 'znacka': 'Y', 'datum_prijmu': date.today(),
+                     'popis_zavady': 'Z', 'zavolano_zakaznikovi': False, 'archived': True, 'archived_at': stare,
+                     'created_at': stare} for i in (1, 2, 3)])
+            moved = cold_storage.move_archived(engine, Reklamace.__table__, app_module.reklamace_cold,
+                                               ReklamaceLog.__table__, app_module.reklamace_log_cold, app_now(), batch_size=1)
+            self.assertEqual(moved, (2, 0))
+            with engine.connect() as conn:
+                self.assertEqual(conn.exec_driver_sql('SELECT COUNT(*) FROM archive.reklamace_archive').scalar(), 2)
+                self.assertEqual(conn.exec_driver_sql('SELECT COUNT(*) FROM main.reklamace').scalar(), 1)
+            engine.dispose()
+
+    def test_maintenance_jobs_run_in_chunks_and_record_runs(self):
+        """Test úloh údržby: auto-archivace vyřízených reklamací, propadlé odběry, záznam běhů a plánování."""
+        maintenance = app_module.maintenance
+        maintenance.pause_s, maintenance.chunk_size = 0, 2
+        stare = date.today() - timedelta(days=200)
+        for i, stav in enumerate(('Zamítnuto', 'Výměna kus za kus', 'Zamítnuto', 'Čeká')):
+            db.session.add(Reklamace(pobocka_id=self.test_pobocka.id, zakaznik=f'Z{i}', znacka='Nike', stav=stav,
+                                     datum_prijmu=stare, popis_zavady='Vada'))
+        for datum in (stare, stare, date.today()):
+            db.session.add(Odber(pobocka_id=self.test_pobocka.id, jmeno='O', kdo_zadal='k', datum=datum))
+        db.session.commit()
+        try:
+            results = {r['job']: r for r in maintenance.run(db.engine, ['auto_archive', 'expire_pickups', 'analyze', 'wal_checkpoint'])}
+        finally:
+            maintenance.pause_s, maintenance.chunk_size = 0.05, 200
+        self.assertEqual((results['auto_archive']['rows'], results['auto_archive']['chunks']), (3, 2))
+        self.assertEqual(results['expire_pickups']['rows'], 2)
+        self.assertEqual(results['analyze']['status'], 'ok', results['analyze'])
+        db.session.expire_all()
+        self.assertEqual(Reklamace.query.filter_by(archived=True).count(), 3)
+        self.assertEqual(ReklamaceLog.query.filter_by(uzivatel='system').count(), 3)
+        self.assertEqual(Odber.query.filter_by(stav='nevyzvednuto').count(), 2)
+        self.assertEqual(Akce.query.filter_by(uzivatel='system').count(), 2)
+        self.assertEqual(app_module.MaintenanceRun.query.count(), 4)
+        due = maintenance.due(db.engine)
+        self.assertNotIn('auto_archive', due)
+        self.assertIn('vacuum', due)
+        # Databáze vzniklá přes _sqlite_on_connect má auto_vacuum=INCREMENTAL, úloha se nepřeskočí
+        result = maintenance.run(db.engine, ['vacuum'])[0]
+        self.assertEqual(result['status'], 'ok', result)
+
+    def test_online_backup_snapshots_rotate_and_run_from_admin(self):
+        """Test online zálohy: gzip snapshot čitelné kopie za provozu (WAL), rotace a ruční spuštění z adminu."""
+        workdir = tempfile.mkdtemp()
+        source = os.path.join(workdir, 'odbery.db')
+        conn = sqlite3.connect(source)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE t (x TEXT)')
+        conn.executemany('INSERT INTO t VALUES (?)', [(str(i) * 50,) for i in range(3000)])
+        conn.commit()  # data zůstávají ve -wal souboru, kopie souboru by je neobsahovala
+        self.addCleanup(conn.close)
+
+        store = backup.Backup(directory=os.path.join(workdir, 'zalohy'), keep=2, step_pages=4, step_sleep_ms=0)
+        result = store.run(source, now=datetime(2025, 1, 1, 12, 0, 0))
+        self.assertGreater(result['steps'], 1)
+        restored = os.path.join(workdir, 'obnova.db')
+        with gzip.open(os.path.join(store.directory, result['name'])) as gz, open(restored, 'wb') as out:
+            out.write(gz.read())
+        with sqlite3.connect(restored) as copy:
+            self.assertEqual(copy.execute('SELECT COUNT(*) FROM t').fetchone()[0], 3000)
+        for hour in (13, 14):
+            store.run(source, now=datetime(2025, 1, 1, hour, 0, 0))
+        self.assertEqual([s['name'] for s in store.snapshots()],
+                         ['odbery-20250101-140000.db.gz', 'odbery-20250101-130000.db.gz'])
+        self.assertEqual(sorted(os.listdir(store.directory)), sorted(s['name'] for s in store.snapshots()))  # bez dočasných souborů
+
+        # Admin: ruční spuštění jde na pozadí a zapíše se do maintenance_run (testy běží v paměti → přeskočeno)
+        self.login('1234')
+        self.assertEqual(self.app.post('/admin/zalohy/spustit').status_code, 302)
+        for thread in threading.enumerate():
+            if thread.name == 'backup':
+                thread.join()
+        page = self.app.get('/admin/zalohy').get_data(as_text=True)
+        self.assertIn('databáze v paměti', page)
+        self.assertEqual(self.app.get('/admin/zalohy/..%2Fodbery.db').status_code, 404)
+
+    def test_log_retention_moves_old_rows_to_segments_and_stays_searchable(self):
+        """Test retence logu: staré Akce/ReklamaceLog do gzip segmentů s indexem a hledání z admin historie."""
+        pobocka_id = self.test_pobocka.id
+        r = Reklamace(pobocka_id=pobocka_id, zakaznik='Z', znacka='Nike', datum_prijmu=date.today(), popis_zavady='Vada')
+        db.session.add(r)
+        db.session.flush()
+        stare = datetime(2020, 3, 15, 10, 30)
+        for i, datum in enumerate((stare, stare + timedelta(days=40), app_now())):
+            db.session.add(Akce(odber_id=0, uzivatel='testadmin', akce=f'Odběr {i}', datum=datum, pobocka_id=pobocka_id))
+            db.session.add(ReklamaceLog(reklamace_id=r.id, uzivatel='testadmin', akce=f'Reklamace {i}', datum=datum,
+                                        pobocka_id=pobocka_id))
+        db.session.commit()
+        store = app_module.log_segments
+        maintenance = app_module.maintenance
+        with tempfile.TemporaryDirectory() as tmp:
+            root, store.root = store.root, tmp
+            maintenance.pause_s = 0
+            try:
+                result = maintenance.run(db.engine, ['log_retention'])[0]
+                self.assertEqual((result['status'], result['rows']), ('ok', 4), result)
+                self.assertEqual(Akce.query.count(), 1)
+                self.assertEqual(ReklamaceLog.query.count(), 1)
+                index = store.load_index()
+                self.assertEqual(sorted(index['akce']), ['2020-03', '2020-04'])
+                self.assertEqual(index['reklamace_log']['2020-03']['pobocky'], [pobocka_id])
+                self.assertTrue(os.path.exists(os.path.join(tmp, 'akce', '2020-03.ndjson.gz')))
+                # Dávka přesunutá podruhé (pád před commitem) se nezapíše ani nezapočte do indexu znovu
+                moved = next(record for _stream, record in store.search(['akce']) if record['akce'] == 'Odběr 0')
+                self.assertEqual(moved['zdroj'], 'akce')
+                self.assertEqual(store.append('akce', [dict(moved)]), 0)
+                self.assertEqual(store.load_index()['akce']['2020-03']['rows'], 1)
+                # Dva skutečné řádky se stejným obsahem (jiné id) zůstanou oba
+                self.assertEqual(store.append('akce', [dict(moved, id=moved['id'] + 1000)]), 1)
+                self.assertEqual(len(store.search(['akce'])), 3)
+                self.assertEqual(store.load_index()['akce']['2020-03']['rows'], 2)
+                self.assertEqual(store.search(pobocky=[pobocka_id + 1]), [])
+
+                self.login()
+                page = self.app.get('/admin/historie').get_data(as_text=True)
+                self.assertIn('Odběr 2', page)
+                self.assertNotIn('Odběr 0', page)
+                page = self.app.get('/admin/historie?starsi=1&q=reklamace&date_to=2020-03-31').get_data(as_text=True)
+                self.assertIn('Reklamace 0', page)
+                self.assertNotIn('Reklamace 1', page)
+                self.assertNotIn('Odběr 0', page)
+            finally:
+                store.root = root
+                maintenance.pause_s = 0.05
+
+    def test_access_log_is_json_and_written_off_request_thread(self):
+        """Test JSON access záznamu (routa, pobočka, SQL) a zápisu přes frontu v jiném vlákně."""
+        with self.assertLogs('odbery.access', level='INFO') as logs:
+            self.app.get('/branch/1')
+        fields = logs.records[-1].access
+        self.assertEqual(fields['route'], '/branch/<int:pobocka_id>')
+        self.assertEqual(fields['branch'], 1)
+        self.assertEqual(fields['status'], 302)
+        self.assertIn('sql_count', fields)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'access.log')
+            logger = logging.getLogger('odbery.test_queue')
+            handler = logging.FileHandler(path, encoding='utf-8')
+            handler.setFormatter(log_queue.JsonFormatter())
+            threads = []
+            handler.emit = lambda record, emit=handler.emit: (threads.append(threading.current_thread()), emit(record))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            queue_logs = log_queue.LogQueue()
+            queue_logs.install([logger])
+            logger.info('x', extra={'access': fields})
+            queue_logs.stop()
+            logger.handlers.clear()
+            handler.close()
+            with open(path, encoding='utf-8') as f:
+                line = json.loads(f.readline())
+        self.assertEqual(line['route'], fields['route'])
+        self.assertIn('ts', line)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_migrations_upgrade_legacy_schema_once(self):
+        """Test, že migrace doplní sloupce do staré databáze a další start udělá jen jeden dotaz na verzi."""
+        engine = create_engine('sqlite://')
+        with engine.begin() as conn:
+            conn.exec_driver_sql('CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(80), password_hash VARCHAR(120))')
+            conn.exec_driver_sql('CREATE TABLE pobocka (id INTEGER PRIMARY KEY, nazev VARCHAR(100))')
+            conn.exec_driver_sql("CREATE TABLE reklamace (id INTEGER PRIMARY KEY, pobocka_id INTEGER, stav VARCHAR(20))")
+            conn.exec_driver_sql("INSERT INTO reklamace (pobocka_id, stav) VALUES (1, 'Sleva')")
+        self.assertEqual(migrations.current_version(engine), 0)
+        self.assertEqual(migrations.upgrade(engine, db.metadata), [m[0] for m in migrations.MIGRATIONS])
+        columns = {c['name'] for c in sa_inspect(engine).get_columns('reklamace')}
+        self.assertTrue({'archived', 'archived_at', 'sleva_procent', 'prijal'} <= columns)
+        self.assertIn('pin', {c['name'] for c in sa_inspect(engine).get_columns('user')})
+        with engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql('SELECT stav, archived FROM reklamace').one(), ('Zamítnuto', 0))
+            self.assertEqual(conn.exec_driver_sql('PRAGMA auto_vacuum').scalar(), 2)  # INCREMENTAL po VACUUM
+
+        statements = []
+        event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        self.assertEqual(migrations.upgrade(engine, db.metadata), [])
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(migrations.current_version(engine), migrations.LATEST_VERSION)
+
+    def test_migrate_to_postgres_copies_in_chunks_and_resumes(self):
+        """Test převodu dat po dávkách: přerušený běh pokračuje za poslední dávkou a kontrolní součty sedí."""
+        source, target = create_engine('sqlite://'), create_engine('sqlite://')
+        db.metadata.create_all(source)
+        db.metadata.create_all(target)
+        with source.begin() as conn:
+            conn.execute(Pobocka.__table__.insert(), [{'id': 1, 'nazev': 'Teplice'}, {'id': 2, 'nazev': 'Děčín'}])
+            conn.execute(User.__table__.insert(), [{'id': 7, 'username': 'u', 'password': 'x', 'role': 'admin'}])
+            conn.execute(app_module.user_pobocky.insert(), [{'user_id': 7, 'pobocka_id': 1}, {'user_id': 7, 'pobocka_id': 2}])
+            conn.execute(Odber.__table__.insert(), [
+                {'pobocka_id': 1 + i % 2, 'jmeno': f'Tab\tulátor {i}\n\\', 'kdo_zadal': 'k', 'datum': date(2024, 1, 1 + i),
+                 'castka': 0.1 * i if i % 3 else None, 'placeno_predem': i % 2 == 0, 'stav': 'aktivní'}
+                for i in range(7)])
+
+        # Přerušení při druhé dávce odběrů – potvrzené dávky zůstanou, stav převodu ukazuje za ně
+        inserts = []
+
+        def _crash(conn, cursor, statement, *args):
+            if statement.startswith('INSERT INTO odber'):
+                inserts.append(statement)
+                if len(inserts) == 2:
+                    raise RuntimeError('spojení přerušeno')
+
+        event.listen(target, 'before_cursor_execute', _crash)
+        with self.assertRaises(RuntimeError):
+            migrate_to_postgres.migrate(source, target, chunk_rows=3, log=lambda message: None)
+        event.remove(target, 'before_cursor_execute', _crash)
+        with target.connect() as conn:
+            self.assertEqual(conn.execute(db.select(db.func.count()).select_from(Odber.__table__)).scalar(), 3)
+
+        messages = []
+        steps = migrate_to_postgres.migrate(source, target, chunk_rows=3, log=messages.append)
+        self.assertIn('odber: pokračuje za 3 řádky', messages)
+        self.assertEqual(migrate_to_postgres.verify(source, target, steps, log=lambda message: None), [])
+        names = [t.name for _s, t, _c in steps]
+        self.assertLess(names.index('pobocka'), names.index('user'))
+        self.assertLess(names.index('user'), names.index('user_pobocky'))
+        with target.connect() as conn:
+            self.assertEqual(conn.execute(db.select(Odber.__table__.c.jmeno).where(Odber.__table__.c.id == 1)).scalar(),
+                             'Tab\tulátor 0\n\\')
+
+        # Cíl s cizími daty (bez stavu převodu) se nepřepíše bez --restart
+        with target.begin() as conn:
+            conn.execute(migrate_to_postgres.migrace_stav.delete())
+        with self.assertRaises(migrate_to_postgres.MigraceError):
+            migrate_to_postgres.migrate(source, target, log=lambda message: None)
+        steps = migrate_to_postgres.migrate(source, target, restart_all=True, log=lambda message: None)
+        self.assertEqual(migrate_to_postgres.verify(source, target, steps, log=lambda message: None), [])
+
+    def test_slow_query_log_captures_plan(self):
+        """Test, že pomalý dotaz se zaznamená s tvarem parametrů a plánem dotazu."""
+        old_threshold = slow_queries.threshold_ms
+        slow_queries.threshold_ms = 0.000001
+        try:
+            Odber.query.filter_by(pobocka_id=self.test_pobocka.id, stav='aktivní').all()
+        finally:
+            slow_queries.threshold_ms = old_threshold
+        entry = next(e for e in slow_queries.entries if 'FROM odber' in e['sql'])
+        self.assertEqual(entry['params'], 'int, str')
+        self.assertTrue(any('odber' in line for line in entry['plan']))
+
+    def test_slow_query_failed_explain_keeps_postgres_transaction_usable(self):
+        """Test, že chyba EXPLAIN na PostgreSQL neshodí transakci requestu (savepoint)."""
+        class FakePgConnection:
+            """Napodobí PostgreSQL: po chybě v transakci projde jen ROLLBACK TO SAVEPOINT."""
+            def __init__(self):
+                self.aborted = False
+                self.statements = []
+
+            def cursor(self):
+                return self
+
+            def execute(self, statement, parameters=None):
+                self.statements.append(statement)
+                if self.aborted and not statement.startswith('ROLLBACK TO SAVEPOINT'):
+                    raise RuntimeError('current transaction is aborted')
+                if statement.startswith('ROLLBACK TO SAVEPOINT'):
+                    self.aborted = False
+                elif statement.startswith('EXPLAIN'):
+                    self.aborted = True
+                    raise RuntimeError('canceling statement due to statement timeout')
+
+            def close(self):
+                pass
+
+        conn = FakePgConnection()
+        with self.assertRaises(RuntimeError):
+            slow_query.explain(conn, 'postgresql', 'SELECT 1', {})
+        self.assertFalse(conn.aborted)
+        conn.execute('SELECT 2')  # další příkaz requestu projde
+        self.assertEqual(conn.statements, ['SAVEPOINT slow_query_explain', 'EXPLAIN SELECT 1',
+                                           'ROLLBACK TO SAVEPOINT slow_query_explain',
+                                           'RELEASE SAVEPOINT slow_query_explain', 'SELECT 2'])
+
 
 def run_tests():
     """Spustí všechny testy."""
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Zahřátí workeru po startu – než začne přijímat requesty.
+
+První requesty po deployi jinak platí za kompilaci Jinja šablon (base.html má
+přes 600 řádků), konfiguraci SQLAlchemy mapperů, kompilaci SQL a otevírání
+připojení do databáze. `warm_up(app)` to udělá předem: zkompiluje všechny
+šablony (s perzistentní bytecode cache na disku se při dalším startu jen
+načtou), nakonfiguruje mappery, otevře pool připojení a jednou spustí dotazy,
+které běží na každém requestu (načtení uživatele, seznam poboček), aby byly
+v cache zkompilovaných příkazů.
+
+Spouští ho run_waitress.py a wsgi.py před tím, než worker začne naslouchat;
+stav je v app.extensions['warmup'] pro /health.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import url_for
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+
+
+def enable_bytecode_cache(app, directory):
+    """Zkompilované šablony se ukládají do adresáře a přežijí restart i deploy bez změny šablon."""
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def _compile_templates(app):
+    names = [n for n in app.jinja_env.list_templates() if n.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def _open_pool(engine, size):
+    """Otevře `size` připojení souběžně (ať se nevrací pořád to samé) a vrátí je do poolu."""
+    def _ping(_):
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+            time.sleep(0.05)  # držet připojení, dokud si ostatní vlákna neotevřou vlastní
+
+    with ThreadPoolExecutor(max_workers=size) as executor:
+        list(executor.map(_ping, range(size)))
+    return size
+
+
+def warm_up(app, db, queries=()):
+    """Zahřeje šablony, mappery, pool a SQL cache. Vrací stav s časy jednotlivých kroků (ms)."""
+    state = {'ready': False, 'steps': {}, 'errors': []}
+    app.extensions['warmup'] = state
+    started = time.perf_counter()
+
+    def step(name, func):
+        t0 = time.perf_counter()
+        try:
+            result = func()
+        except Exception as e:  # zahřátí nesmí shodit worker – jen bude první request pomalejší
+            state['errors'].append(f'{name}: {e}')
+            app.logger.warning(f'Warm-up {name} selhal: {e}')
+            result = None
+        state['steps'][name] = round((time.perf_counter() - t0) * 1000, 1)
+        return result
+
+    step('mappers', configure_mappers)
+    state['templates'] = step('templates', lambda: _compile_templates(app))
+    with app.app_context():
+        engine = db.engine
+        pool_size = engine.pool.size() if hasattr(engine.pool, 'size') else 1
+        size = max(1, min(pool_size, app.config.get('WAITRESS_THREADS', 8)))
+        state['connections'] = step('pool', lambda: _open_pool(engine, size))
+        for name, query in queries:
+            step(name, query)
+        db.session.remove()
+    with app.test_request_context():
+        step('url_map', lambda: url_for('index'))
+    state['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    state['ready'] = True
+    app.logger.info(f"Warm-up hotov za {state['total_ms']} ms: {state['steps']}")
+    return state
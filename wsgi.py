@@ -17,7 +17,9 @@ if path not in sys.path:
 os.chdir(path)
 
 # Importujeme aplikaci
-from app import app as application
+from app import create_app, warm_up_app
+application = create_app()
+warm_up_app()
 
 # Nastavíme proměnné prostředí (volitelné, pokud je chcete nastavit zde)
 # os.environ['SECRET_KEY'] = 'your-secret-key-here'